@@ -1,34 +1,55 @@
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from api.conditional import content_etag, is_not_modified, not_modified, validator_headers
 from schemas import ChatRequest, ChatResponse
-from services.chat_service import ChatService
+import json
 import uuid
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-chat_service = ChatService()
+_chat_service = None
+_session_service = None
+
+
+def get_chat_service():
+    """Build the ChatService (LangChain, Pinecone, Redis) on first use, not at import."""
+    global _chat_service
+    if _chat_service is None:
+        from services.chat_service import ChatService
+        _chat_service = ChatService()
+    return _chat_service
+
+
+def get_session_service():
+    """Transcript store only – reading history shouldn't spin up the RAG stack."""
+    global _session_service
+    if _session_service is None:
+        from services.session_service import SessionService
+        _session_service = SessionService()
+    return _session_service
 
 
 @router.post("/", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest, response: Response):
     """Chat endpoint for conversational AI interactions"""
     # ── debug logging ────────────────────────────────────────────────────
-    logger.info("=== CHAT REQUEST RECEIVED ===")
-    logger.info(f"Request content: {request.content}")
-    logger.info(f"Request role: {request.role}")
-    logger.info(f"Request session_id: {request.session_id}")
+    logger.debug("=== CHAT REQUEST RECEIVED ===")
+    logger.debug("Request content: %s", request.content)
+    logger.debug("Request role: %s", request.role)
+    logger.debug("Request session_id: %s", request.session_id)
 
     try:
         session_id = request.session_id or str(uuid.uuid4())
-        logger.info(f"Using session_id: {session_id}")
+        logger.debug("Using session_id: %s", session_id)
 
-        service_response = await chat_service.process_message(
+        service_response = await get_chat_service().process_message(
             content=request.content,
             role=request.role,
             session_id=session_id,
         )
 
-        logger.info(f"Chat service response received: {service_response}")
+        logger.debug("Chat service response received: %s", service_response)
 
         chat_response = ChatResponse(
             message=service_response["message"],
@@ -46,7 +67,8 @@ async def chat_endpoint(request: ChatRequest, response: Response):
             # Cache for 1 hour
             response.headers["Cache-Control"] = "public, max-age=3600, s-maxage=3600"
 
-        logger.info(f"Returning response: {chat_response.dict()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Returning response: %s", chat_response.dict())
         return chat_response
 
     except ValueError as e:
@@ -60,11 +82,40 @@ async def chat_endpoint(request: ChatRequest, response: Response):
 
 
 @router.get("/sessions/{session_id}/history")
-async def get_chat_history(session_id: str):
-    """Get chat history for a session"""
+async def get_chat_history(
+    session_id: str,
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    stream: bool = False,
+):
+    """
+    Get chat history for a session, oldest first.  Paginated with
+    offset/limit; ``stream=true`` returns the whole transcript as NDJSON.
+    Pages carry an ETag over the stored messages, so a poll that finds
+    nothing new gets a 304 without decoding or re-serialising the page.
+    """
+    sessions = get_session_service()
+    if stream:
+        async def lines():
+            async for message in sessions.iter_history(session_id):
+                yield json.dumps(message) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
     try:
-        history = chat_service.get_session_history(session_id)
-        return {"session_id": session_id, "history": history}
+        raw, total = await sessions.get_page_raw(session_id, offset, limit)
+        etag = content_etag(f"{offset}:{limit}:{total}\n".encode() + b"\n".join(raw))
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        return JSONResponse(
+            {
+                "session_id": session_id,
+                "history": sessions.decode_messages(raw),
+                "offset": offset,
+                "limit": limit,
+                "total": total,
+            },
+            headers=validator_headers(etag),
+        )
     except Exception as e:
         logger.error(f"Error fetching chat history: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching chat history")
@@ -0,0 +1,139 @@
+"""
+Conditional GET helpers: strong ETags, 304 Not Modified and byte ranges.
+
+Polled resources (estimates, chat history, export downloads) send an ETag
+and ``Cache-Control: no-cache`` so clients revalidate every time; a match on
+``If-None-Match`` (or, for exports, ``If-Modified-Since``) is answered with
+headers only, before any payload is loaded, parsed or serialised.
+Downloads honour single ``Range`` requests (``ranged_response``).
+"""
+import hashlib
+import re
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+REVALIDATE = "private, no-cache"
+
+
+def strong_etag(digest: str) -> str:
+    """ETag for a content hash stored alongside the resource."""
+    return f'"{digest}"'
+
+
+def content_etag(data: bytes) -> str:
+    """Strong ETag for a payload's exact bytes."""
+    return strong_etag(hashlib.blake2b(data, digest_size=16).hexdigest())
+
+
+def http_date(timestamp: float) -> str:
+    return format_datetime(datetime.fromtimestamp(int(timestamp), timezone.utc), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: Optional[float] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """RFC 9110 precedence: If-None-Match decides when present, else If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # If-None-Match uses the weak comparison: W/"x" matches "x"
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+def not_modified(etag: str, last_modified: Optional[float] = None) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def byte_range(request: Request, size: int, etag: str) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) for a satisfiable single ``Range: bytes=…`` header,
+    None to send the whole body (no header, multiple ranges, or a stale
+    ``If-Range``).  Raises ValueError when the range cannot be satisfied.
+    """
+    header = request.headers.get("range")
+    if not header:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":                       # suffix: the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _chunks(data: bytes, start: int, end: int) -> Iterator[bytes]:
+    view = memoryview(data)
+    for offset in range(start, end + 1, CHUNK_SIZE):
+        yield bytes(view[offset:min(offset + CHUNK_SIZE, end + 1)])
+
+
+def _held_chunks(held: Any, start: int, end: int) -> Iterator[bytes]:
+    try:
+        yield from held.chunks(start, end)
+    finally:
+        held.release()
+
+
+def ranged_response(
+    request: Request, data: Union[bytes, Any], media_type: str, etag: str, headers: Dict[str, str]
+) -> Response:
+    """
+    Stream *data* in chunks, as a 206 partial response when a Range asks for
+    one.  *data* is bytes, or a held file (``size``, ``chunks(start, end)``,
+    ``release()`` – see services/export_store.py) released once the
+    response is finished or abandoned.
+    """
+    held = not isinstance(data, (bytes, bytearray))
+    size = data.size if held else len(data)
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    try:
+        span = byte_range(request, size, etag)
+    except ValueError:
+        if held:
+            data.release()
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    status = 200
+    start, end = 0, size - 1
+    if span is not None:
+        status = 206
+        start, end = span
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if held:
+        return StreamingResponse(_held_chunks(data, start, end), status_code=status, media_type=media_type,
+                                 headers=headers, background=BackgroundTask(data.release))
+    return StreamingResponse(_chunks(data, start, end), status_code=status,
+                             media_type=media_type, headers=headers)
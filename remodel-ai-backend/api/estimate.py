@@ -1,32 +1,142 @@
-from fastapi import APIRouter, HTTPException
-from schemas import EstimateRequest, EstimateResponse
-from services.estimate_service import EstimateService
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from api.conditional import content_etag, is_not_modified, not_modified, strong_etag, validator_headers
+from config import settings
+from schemas import BatchEstimateRequest, EstimateRequest, EstimateResponse
+from typing import Optional
+import json
 import logging
+import time
 router = APIRouter()
 logger = logging.getLogger(__name__)
-estimate_service = EstimateService()
+_estimate_service = None
+def warm_up() -> None:
+    """Precompute the estimate statistics (NumPy, dataset read) off the request path."""
+    from services.estimate_engine import get_estimate_engine
+    get_estimate_engine()
+def dataset_status():
+    """Estimate dataset status for the health check (None until warm-up has built the engine)."""
+    from services.estimate_engine import estimate_data_status
+    return estimate_data_status()
+async def run_price_refresher(interval: float) -> None:
+    """Keep material prices warm in the background (SerpAPI client built here, not at import)."""
+    from services.material_price_service import get_material_price_service
+    await get_material_price_service().run_refresher(interval)
+def get_estimate_service():
+    """Build the EstimateService (dataset statistics, SerpAPI client) on first use, not at import."""
+    global _estimate_service
+    if _estimate_service is None:
+        from services.estimate_service import EstimateService
+        _estimate_service = EstimateService()
+    return _estimate_service
 @router.post("/", response_model=EstimateResponse)
-async def create_estimate(request: EstimateRequest):
-    """Create a new construction cost estimate"""
+async def create_estimate(request: EstimateRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Create a new construction cost estimate.  With an ``Idempotency-Key``
+    header a retried request returns the original estimate (marked
+    ``Idempotent-Replayed: true``) instead of creating another.
+    """
     try:
-        estimate = await estimate_service.generate_estimate(
+        service = get_estimate_service()
+        if idempotency_key:
+            from services.estimate_service import IdempotencyConflict, IdempotencyInProgress
+            try:
+                data, replayed = await service.generate_idempotent(
+                    idempotency_key, request.project_details, request.session_id
+                )
+            except IdempotencyInProgress as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            except IdempotencyConflict as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            headers = {"Idempotent-Replayed": "true"} if replayed else None
+            return Response(content=data, media_type="application/json", headers=headers)
+        estimate = await service.generate_estimate(
             project_details=request.project_details,
             session_id=request.session_id
         )
         return estimate
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Estimate error: {str(e)}")
         raise HTTPException(status_code=500, detail="Error generating estimate")
+@router.post("/batch")
+async def create_estimates_batch(request: BatchEstimateRequest):
+    """
+    Estimate a portfolio of projects.  Every project is validated up front
+    (an invalid one fails the request with 422, its index in ``loc``).  The
+    reply is NDJSON, one ``{"index", "estimate"}`` line per project in input
+    order, streamed chunk by chunk, then a ``{"summary": …}`` line.
+    """
+    started = time.perf_counter()
+    projects = request.projects
+    if len(projects) > settings.estimate_batch_max_projects:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.estimate_batch_max_projects} projects per batch",
+        )
+    service = get_estimate_service()
+    async def lines():
+        unique = set()
+        try:
+            async for chunk in service.generate_batch(projects, request.session_id):
+                for index, data in chunk:
+                    unique.add(data)
+                    yield b'{"index":%d,"estimate":%s}\n' % (index, data)
+        except Exception as e:
+            logger.error(f"Batch estimate error: {str(e)}")
+            yield b'{"error":"Error generating estimates"}\n'
+            return
+        summary = {
+            "count": len(projects),
+            "unique": len(unique),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        yield json.dumps({"summary": summary}).encode() + b"\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+@router.get("/sessions/{session_id}")
+async def get_session_estimates(
+    session_id: str,
+    request: Request,
+    limit: int = Query(20, ge=1, le=200),
+):
+    """A session's most recent estimates, newest first (stored JSON, not re-serialised)"""
+    try:
+        estimates = await get_estimate_service().store.for_session(session_id, limit)
+        body = b'{"session_id":%s,"estimates":[%s]}' % (
+            json.dumps(session_id).encode(), b",".join(data for _, data in estimates),
+        )
+        etag = content_etag(body)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        return Response(content=body, media_type="application/json", headers=validator_headers(etag))
+    except Exception as e:
+        logger.error(f"Error listing session estimates: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error fetching estimates")
 @router.get("/{estimate_id}", response_model=EstimateResponse)
-async def get_estimate(estimate_id: str):
-    """Get an existing estimate by ID"""
+async def get_estimate(estimate_id: str, request: Request):
+    """
+    Get an existing estimate by ID.  Conditional: a matching If-None-Match
+    is answered from the stored content hash alone; otherwise the stored
+    JSON is sent as-is (it was validated when the estimate was created).
+    """
     try:
-        estimate = estimate_service.get_estimate(estimate_id)
-        if not estimate:
+        store = get_estimate_service().store
+        if request.headers.get("if-none-match"):
+            digest = await store.get_hash(estimate_id)
+            if digest and is_not_modified(request, strong_etag(digest)):
+                return not_modified(strong_etag(digest))
+        stored = await store.get(estimate_id)
+        if not stored:
             raise HTTPException(status_code=404, detail="Estimate not found")
-        return estimate
+        data, digest = stored
+        return Response(
+            content=data,
+            media_type="application/json",
+            headers=validator_headers(strong_etag(digest)),
+        )
     except HTTPException:
         raise
     except Exception as e:
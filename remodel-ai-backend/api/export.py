@@ -1,48 +1,170 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-from schemas import ExportRequest, ExportResponse
-from services.pdf_service import PDFService
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from api.conditional import is_not_modified, not_modified, ranged_response, strong_etag, validator_headers
+from config import settings
+from schemas import BulkExportRequest, ExportJobResponse, ExportRequest, ExportResponse
+from services import export_formats
+from services.estimate_store import get_estimate_store
+from services.render_pool import RenderQueueFull, RenderUnavailable
+from typing import Any, Dict, List, Optional
 import logging
 from datetime import datetime, timedelta
 router = APIRouter()
 logger = logging.getLogger(__name__)
-pdf_service = PDFService()
-@router.post("/", response_model=ExportResponse)
-async def export_estimate(request: ExportRequest):
-    """Export an estimate in the requested format"""
+_pdf_service = None
+def get_pdf_service():
+    """Build the PDFService (ReportLab) on first use, not at import."""
+    global _pdf_service
+    if _pdf_service is None:
+        from services.pdf_service import PDFService
+        _pdf_service = PDFService()
+    return _pdf_service
+def _download_url(estimate_id: str, key: str) -> str:
+    return f"/api/v1/export/download/{estimate_id}?key={key}"
+def _attachment(filename: str) -> Dict[str, str]:
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+def _job_response(job_id: str, job: Dict[str, Any]) -> ExportJobResponse:
+    return ExportJobResponse(
+        job_id=job_id,
+        estimate_id=job["estimate_id"],
+        status=job["status"],
+        status_url=f"/api/v1/export/jobs/{job_id}",
+        file_url=_download_url(job["estimate_id"], job["key"]) if job["status"] == "done" else None,
+        error=job.get("error"),
+    )
+@router.post("/", response_model=ExportResponse, responses={202: {"model": ExportJobResponse}})
+async def export_estimate(request: ExportRequest, mode: str = Query("sync", pattern="^(sync|async)$")):
+    """
+    Export an estimate in the requested format.  CSV and JSON are streamed
+    from the estimate store on download.  PDFs render in a bounded process
+    pool: when it is saturated the reply is 429 (503 if the pool is
+    down) with Retry-After.  ``?mode=async`` returns 202 and a job to poll
+    at ``/jobs/{job_id}`` instead of waiting for the render.
+    """
     try:
+        if request.format == "pdf" and mode == "async":
+            job_id = await get_pdf_service().start_export_job(
+                estimate_id=request.estimate_id,
+                include_breakdown=request.include_breakdown,
+                include_similar_projects=request.include_similar_projects
+            )
+            job = _job_response(job_id, {"status": "pending", "estimate_id": request.estimate_id})
+            return JSONResponse(status_code=202, content=job.model_dump(),
+                                headers={"Location": job.status_url})
         if request.format == "pdf":
-            file_path = await pdf_service.generate_estimate_pdf(
+            export = await get_pdf_service().generate_estimate_pdf(
                 estimate_id=request.estimate_id,
                 include_breakdown=request.include_breakdown,
                 include_similar_projects=request.include_similar_projects
             )
             return ExportResponse(
-                file_url=f"/api/v1/export/download/{request.estimate_id}",
+                file_url=_download_url(request.estimate_id, export["key"]),
                 download_name=f"estimate_{request.estimate_id}.pdf",
-                expires_at=datetime.now() + timedelta(hours=1)
+                expires_at=datetime.now() + timedelta(seconds=settings.export_ttl)
             )
-        else:
-            raise HTTPException(status_code=400, detail=f"Format {request.format} not yet implemented")
+        if not await get_estimate_store().get_hash(request.estimate_id):
+            raise HTTPException(status_code=404, detail="Estimate not found")
+        extension = export_formats.EXTENSIONS[request.format]
+        return ExportResponse(
+            file_url=f"/api/v1/export/download/{request.estimate_id}?format={request.format}",
+            download_name=f"estimate_{request.estimate_id}.{extension}",
+            expires_at=datetime.now() + timedelta(seconds=settings.export_ttl)
+        )
+    except HTTPException:
+        raise
+    except RenderQueueFull as e:
+        raise HTTPException(status_code=429, detail="Too many exports in progress",
+                            headers={"Retry-After": str(e.retry_after)})
+    except RenderUnavailable as e:
+        raise HTTPException(status_code=503, detail="PDF rendering temporarily unavailable",
+                            headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Export error: {str(e)}")
         raise HTTPException(status_code=500, detail="Error exporting estimate")
+@router.post("/bulk")
+async def bulk_export(request: BulkExportRequest):
+    """
+    Stream many estimates as one CSV, NDJSON, or a zip with one PDF/CSV
+    (``entry_format``) per estimate.  Rows and zip entries are sent as soon
+    as each is produced; estimates come from ``estimate_ids`` followed by
+    the session's most recent ones (``session_id``).
+    """
+    store = get_estimate_store()
+    estimate_ids: List[str] = list(request.estimate_ids)
+    if request.session_id:
+        estimate_ids += await store.session_ids(request.session_id, settings.estimate_session_index_max)
+    estimate_ids = list(dict.fromkeys(estimate_ids))
+    if not estimate_ids:
+        raise HTTPException(status_code=400, detail="No estimates to export")
+    if len(estimate_ids) > settings.export_bulk_max_estimates:
+        raise HTTPException(status_code=413,
+                            detail=f"At most {settings.export_bulk_max_estimates} estimates per export")
+
+    if request.format == "csv":
+        body = export_formats.stream_csv(store, estimate_ids)
+    elif request.format == "json":
+        body = export_formats.stream_ndjson(store, estimate_ids)
+    else:
+        body = export_formats.stream_zip_export(
+            store, estimate_ids, request.entry_format, request.include_breakdown,
+            get_pdf_service() if request.entry_format == "pdf" else None,
+        )
+    filename = f"estimates.{export_formats.EXTENSIONS[request.format]}"
+    return StreamingResponse(body, media_type=export_formats.MEDIA_TYPES[request.format],
+                             headers=_attachment(filename))
+@router.get("/jobs/{job_id}", response_model=ExportJobResponse)
+async def get_export_job(job_id: str):
+    """Poll an async export job"""
+    job = await get_pdf_service().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return _job_response(job_id, job)
 @router.get("/download/{estimate_id}")
-async def download_export(estimate_id: str):
-    """Download an exported file"""
+async def download_export(estimate_id: str, request: Request, key: Optional[str] = None,
+                          format: str = Query("pdf", pattern="^(pdf|csv|json)$")):
+    """
+    Download an exported file – the variant *key* (from the export's
+    file_url), else the estimate's latest export.  Conditional on the
+    export's content address / time; served from memory with Range support.
+    CSV and JSON are streamed from the stored estimate.
+    """
+    if format != "pdf":
+        return await _download_tabular(estimate_id, request, format)
     try:
-        file_path = pdf_service.get_export_path(estimate_id)
-        if not file_path:
+        service = get_pdf_service()
+        export = await service.get_export_info(estimate_id, key)
+        if not export:
             raise HTTPException(status_code=404, detail="Export not found")
-        return FileResponse(
-            path=file_path,
-            filename=f"estimate_{estimate_id}.pdf",
-            media_type="application/pdf"
-        )
+        etag = strong_etag(export["key"])
+        if is_not_modified(request, etag, export["modified"]):
+            return not_modified(etag, export["modified"])
+        data = await service.open_export(export)
+        headers = validator_headers(etag, export["modified"])
+        headers.update(_attachment(f"estimate_{estimate_id}.pdf"))
+        return ranged_response(request, data, "application/pdf", etag, headers)
     except HTTPException:
         raise
+    except RenderQueueFull as e:
+        raise HTTPException(status_code=429, detail="Too many exports in progress",
+                            headers={"Retry-After": str(e.retry_after)})
+    except RenderUnavailable as e:
+        raise HTTPException(status_code=503, detail="PDF rendering temporarily unavailable",
+                            headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Download error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error downloading file")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error downloading file")
+async def _download_tabular(estimate_id: str, request: Request, format: str):
+    store = get_estimate_store()
+    digest = await store.get_hash(estimate_id)
+    if not digest:
+        raise HTTPException(status_code=404, detail="Export not found")
+    etag = strong_etag(f"{digest}.{format}")
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    stream = export_formats.stream_csv if format == "csv" else export_formats.stream_ndjson
+    headers = validator_headers(etag)
+    headers.update(_attachment(f"estimate_{estimate_id}.{export_formats.EXTENSIONS[format]}"))
+    return StreamingResponse(stream(store, [estimate_id]), media_type=export_formats.MEDIA_TYPES[format],
+                             headers=headers)
@@ -1,16 +1,17 @@
 ﻿from dotenv import load_dotenv
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # Try to load dotenv, but don't fail if it doesn't work
 try:
     load_dotenv()
 except Exception as e:
-    print(f"Warning: Could not load .env file: {e}")
-    print("Continuing with default settings...")
+    logger.warning("Could not load .env file: %s – continuing with default settings", e)
 
 from typing import Dict, Any, Optional
 from dataclasses import dataclass
-import redis
 
 
 @dataclass
@@ -38,6 +39,68 @@ class Settings:
     redis_port: int = 6379
     redis_db: int = 0
     session_ttl: int = 3600  # 1-hour TTL for sessions
+    history_max_messages: int = 200   # transcript cap per session (oldest trimmed)
+    history_window_pairs: int = 10    # exchanges the chat pipeline reads per turn
+    active_session_window: int = 900  # a session counts as active this long after its last turn
+    redis_timeout: float = 0.25       # per-command socket timeout (seconds)
+    redis_max_connections: int = 50   # shared async connection pool size
+
+    # Shared state (sessions, contexts, estimates, exports) – see
+    # services/state_backend.py
+    state_backend: str = "sqlite"                # "sqlite", "redis" or "memory"
+    state_db_path: str = "state/remodelai.db"
+
+    # In-process state (memory backend / Redis fallback) – services/memory_store.py
+    memory_store_max_bytes: int = 64 * 1024 * 1024
+    memory_store_max_entries: int = 50_000
+    memory_store_shards: int = 16
+    memory_sweep_interval: float = 30.0          # seconds between expiry sweeps
+    http_cache_max_bytes: int = 16 * 1024 * 1024 # shared HTTP response cache (middleware/cache.py)
+
+    # Conversation-context encoding (see services/context_codec.py)
+    context_codec: str = "msgpack"               # "json", "msgpack" or "msgpack+zstd"
+    context_zstd_dict: Optional[str] = None      # path to a trained zstd dictionary
+    context_delta: bool = False                  # per-field hash, changed fields only
+
+    # Material prices via SerpAPI (services/material_price_service.py)
+    serpapi_base_url: str = "https://serpapi.com"
+    material_price_concurrency: int = 4          # lookups in flight at once
+    material_price_timeout: float = 3.0          # per lookup (seconds)
+    material_price_deadline: float = 1.5         # estimate waits this long for prices
+    material_price_rate: float = 2.0             # outbound lookups per second
+    material_price_max_stale: int = 7 * 86400    # serve (and revalidate) prices up to this old
+    material_price_refresh_interval: float = 3600.0  # background refresh period; 0 disables
+    material_price_db_path: str = "state/material_prices.db"
+
+    # Estimate engine (services/estimate_engine.py)
+    estimate_data_path: str = "../remodel-ai-data/processed/cleaned_data_all.csv"
+    estimate_narrative: bool = False             # ask the LLM for an explanatory paragraph
+    estimate_batch_max_projects: int = 5000      # POST /estimate/batch size limit
+    estimate_ttl: int = 90 * 86400               # stored estimates expire after this (0 = never)
+    estimate_hot_max_bytes: int = 8 * 1024 * 1024  # per-process LRU of recent estimates
+    estimate_session_index_max: int = 200       # estimate ids remembered per session
+    estimate_memo_ttl: int = 3600                # reuse figures for identical projects (0 = off)
+    estimate_memo_sqft_step: float = 10          # square footage rounding for the memo key
+    idempotency_ttl: int = 86400                 # how long an Idempotency-Key is remembered
+
+    # PDF rendering (services/render_pool.py)
+    pdf_render_workers: int = 2                  # render processes per API worker
+    pdf_render_queue: int = 8                    # renders allowed to wait; beyond that 429
+    pdf_job_ttl: int = 3600                      # how long async export job status is kept
+    pdf_cache_max_bytes: int = 32 * 1024 * 1024  # in-memory cache of rendered PDFs
+    export_bulk_max_estimates: int = 10_000      # POST /export/bulk size limit
+
+    # Rendered exports on disk (services/export_store.py)
+    export_dir: str = "exports"
+    export_store_max_bytes: int = 256 * 1024 * 1024  # LRU beyond this
+    export_ttl: int = 3600                       # exports expire this long after rendering
+    export_janitor_interval: float = 60.0        # seconds between expiry sweeps
+
+    # Logging settings (see logging_config.py)
+    log_level: str = "INFO"          # root level, or OFF
+    log_levels: str = ""             # "services.rag_service=DEBUG,uvicorn.access=WARNING"
+    log_format: str = "text"         # "text" or "json"
+    log_sample_rate: float = 1.0     # fraction of DEBUG records kept
     
     # ────────────────────────────────────────────────────────────
     #  Updated Redis connector
@@ -46,11 +109,14 @@ class Settings:
         """Return a Redis client or None if Redis is disabled/unavailable."""
         # If the user explicitly disabled Redis, skip connection attempt
         if os.environ.get("USE_REDIS", "").lower() == "false":
-            print("DEBUG: Redis is disabled via USE_REDIS environment variable")
+            logger.debug("Redis is disabled via USE_REDIS environment variable")
             return None
         
-        # Attempt to establish a Redis connection
+        # Attempt to establish a Redis connection (imported lazily – keeps
+        # the redis client off the cold-start import path)
         try:
+            import redis
+
             if self.redis_url:
                 return redis.from_url(self.redis_url, decode_responses=True)
             else:
@@ -61,7 +127,7 @@ class Settings:
                     decode_responses=True,
                 )
         except Exception as e:
-            print(f"DEBUG: Could not connect to Redis: {e}")
+            logger.warning("Could not connect to Redis: %s", e)
             return None
 
 
@@ -81,35 +147,74 @@ settings = Settings(
     redis_port=int(os.getenv("REDIS_PORT", "6379")),
     redis_db=int(os.getenv("REDIS_DB", "0")),
     session_ttl=int(os.getenv("SESSION_TTL", "3600")),
+    history_max_messages=int(os.getenv("HISTORY_MAX_MESSAGES", "200")),
+    history_window_pairs=int(os.getenv("HISTORY_WINDOW_PAIRS", "10")),
+    active_session_window=int(os.getenv("ACTIVE_SESSION_WINDOW", "900")),
+    redis_timeout=float(os.getenv("REDIS_TIMEOUT", "0.25")),
+    redis_max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+    state_backend=os.getenv("STATE_BACKEND", "sqlite"),
+    state_db_path=os.getenv("STATE_DB_PATH", "state/remodelai.db"),
+    memory_store_max_bytes=int(os.getenv("MEMORY_STORE_MAX_BYTES", str(64 * 1024 * 1024))),
+    memory_store_max_entries=int(os.getenv("MEMORY_STORE_MAX_ENTRIES", "50000")),
+    memory_store_shards=int(os.getenv("MEMORY_STORE_SHARDS", "16")),
+    memory_sweep_interval=float(os.getenv("MEMORY_SWEEP_INTERVAL", "30")),
+    http_cache_max_bytes=int(os.getenv("HTTP_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    context_codec=os.getenv("CONTEXT_CODEC", "msgpack"),
+    context_zstd_dict=os.getenv("CONTEXT_ZSTD_DICT"),
+    context_delta=os.getenv("CONTEXT_DELTA", "false").lower() == "true",
+    serpapi_base_url=os.getenv("SERPAPI_BASE_URL", "https://serpapi.com"),
+    material_price_concurrency=int(os.getenv("MATERIAL_PRICE_CONCURRENCY", "4")),
+    material_price_timeout=float(os.getenv("MATERIAL_PRICE_TIMEOUT", "3.0")),
+    material_price_deadline=float(os.getenv("MATERIAL_PRICE_DEADLINE", "1.5")),
+    material_price_rate=float(os.getenv("MATERIAL_PRICE_RATE", "2.0")),
+    material_price_max_stale=int(os.getenv("MATERIAL_PRICE_MAX_STALE", str(7 * 86400))),
+    material_price_refresh_interval=float(os.getenv("MATERIAL_PRICE_REFRESH_INTERVAL", "3600")),
+    material_price_db_path=os.getenv("MATERIAL_PRICE_DB_PATH", "state/material_prices.db"),
+    estimate_data_path=os.getenv("ESTIMATE_DATA_PATH", "../remodel-ai-data/processed/cleaned_data_all.csv"),
+    estimate_narrative=os.getenv("ESTIMATE_NARRATIVE", "false").lower() == "true",
+    estimate_batch_max_projects=int(os.getenv("ESTIMATE_BATCH_MAX_PROJECTS", "5000")),
+    estimate_ttl=int(os.getenv("ESTIMATE_TTL", str(90 * 86400))),
+    estimate_hot_max_bytes=int(os.getenv("ESTIMATE_HOT_MAX_BYTES", str(8 * 1024 * 1024))),
+    estimate_session_index_max=int(os.getenv("ESTIMATE_SESSION_INDEX_MAX", "200")),
+    estimate_memo_ttl=int(os.getenv("ESTIMATE_MEMO_TTL", "3600")),
+    estimate_memo_sqft_step=float(os.getenv("ESTIMATE_MEMO_SQFT_STEP", "10")),
+    idempotency_ttl=int(os.getenv("IDEMPOTENCY_TTL", "86400")),
+    pdf_render_workers=int(os.getenv("PDF_RENDER_WORKERS", "2")),
+    pdf_render_queue=int(os.getenv("PDF_RENDER_QUEUE", "8")),
+    pdf_job_ttl=int(os.getenv("PDF_JOB_TTL", "3600")),
+    pdf_cache_max_bytes=int(os.getenv("PDF_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    export_bulk_max_estimates=int(os.getenv("EXPORT_BULK_MAX_ESTIMATES", "10000")),
+    export_dir=os.getenv("EXPORT_DIR", "exports"),
+    export_store_max_bytes=int(os.getenv("EXPORT_STORE_MAX_BYTES", str(256 * 1024 * 1024))),
+    export_ttl=int(os.getenv("EXPORT_TTL", "3600")),
+    export_janitor_interval=float(os.getenv("EXPORT_JANITOR_INTERVAL", "60")),
+    log_level=os.getenv("LOG_LEVEL", "INFO"),
+    log_levels=os.getenv("LOG_LEVELS", ""),
+    log_format=os.getenv("LOG_FORMAT", "text"),
+    log_sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "1.0")),
 )
 
-# Cache for estimates
-estimates_cache: Dict[str, Any] = {}
-
 # Debug: show Redis configuration details
 if settings.redis_url:
-    print(f"DEBUG: Redis URL loaded: {settings.redis_url[:20]}...")
+    logger.debug("Redis URL loaded: %.20s...", settings.redis_url)
 else:
-    print("DEBUG: No Redis URL found, using host/port configuration")
-    print(f"DEBUG: Redis host: {settings.redis_host}, port: {settings.redis_port}")
+    logger.debug("No Redis URL found, using host/port configuration")
+    logger.debug("Redis host: %s, port: %s", settings.redis_host, settings.redis_port)
 
 
-# Test Redis connection (only if Redis is not disabled)
+# Test Redis connection (only if Redis is not disabled).  Not run at import
+# time – a blocking network round trip here delays every cold start.
 def test_redis_connection():
     redis_client = settings.get_redis_connection()
     if redis_client is None:
-        print("DEBUG: Redis disabled or unavailable; skipping connection test")
+        logger.debug("Redis disabled or unavailable; skipping connection test")
         return False
 
     try:
         redis_client.ping()
-        print("DEBUG: Redis connection successful!")
+        logger.debug("Redis connection successful!")
         return True
     except Exception as e:
-        print(f"DEBUG: Redis connection failed: {e}")
+        logger.warning("Redis connection failed: %s", e)
         return False
 
-
-# Run the Redis connectivity test when the module loads
-print("DEBUG: Testing Redis connection...")
-test_redis_connection()
@@ -0,0 +1,144 @@
+# logging_config.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+Process-wide logging setup.
+
+All records go through a ``QueueHandler`` so the request path only pays for
+an in-memory enqueue; a ``QueueListener`` thread does the formatting and the
+stdout write.  Everything is driven by environment variables (see
+``Settings``):
+
+    LOG_LEVEL         root level, or OFF to silence everything
+    LOG_LEVELS        per-logger overrides, e.g.
+                      "services.rag_service=DEBUG,uvicorn.access=WARNING"
+    LOG_FORMAT        "json" (structured) or "text"
+    LOG_SAMPLE_RATE   fraction of DEBUG records kept (0.0 – 1.0)
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+_OFF = logging.CRITICAL + 10
+_listener: Optional[QueueListener] = None
+
+# Attributes every LogRecord has; anything else was passed via ``extra=``.
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, plus any ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keep only a fraction of DEBUG records; higher levels always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock ``prepare`` renders the message (and any traceback) on the
+    calling thread so the record can be pickled.  Our queue is in-process,
+    so the record is passed through untouched and the listener thread does
+    the ``%``-interpolation – the event loop only pays for the enqueue.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _parse_level(name: str) -> int:
+    name = name.strip().upper()
+    if name in ("OFF", "NONE", "DISABLED"):
+        return _OFF
+    level = logging.getLevelName(name)
+    return level if isinstance(level, int) else logging.INFO
+
+
+def _parse_module_levels(spec: str) -> Dict[str, int]:
+    levels: Dict[str, int] = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        if name.strip():
+            levels[name.strip()] = _parse_level(level)
+    return levels
+
+
+def configure_logging(
+    level: str = "INFO",
+    module_levels: str = "",
+    fmt: str = "text",
+    sample_rate: float = 1.0,
+) -> None:
+    """Install the queue-based handler on the root logger (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if fmt.lower() == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(_parse_level(level))
+
+    # Route uvicorn's own loggers through the same queue
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uv_logger = logging.getLogger(name)
+        uv_logger.handlers = []
+        uv_logger.propagate = True
+
+    for name, lvl in _parse_module_levels(module_levels).items():
+        logging.getLogger(name).setLevel(lvl)
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
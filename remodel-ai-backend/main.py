@@ -5,42 +5,91 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from datetime import datetime
 import logging
-import gc                     # graceful shutdown
 import os
 import sys                    # for cache-middleware path tweak
-import asyncio                # final task-cancellation sweep
+import asyncio                # lifespan background tasks
 
 # ensure current directory is resolvable by middleware import
 sys.path.append('.')
-from middleware.cache import CacheMiddleware
+from middleware.cache import CacheMiddleware, response_cache
+from middleware.metrics import MetricsMiddleware
 
-# Internal routers / services
+# Internal routers / services.  Heavy stacks (LangChain, Pinecone, ReportLab,
+# SerpAPI) are imported by the routers on first use, not here – see
+# scripts/benchmarks/import_time.py for the cold-start budget.
 from api import chat, estimate, export
 from config import settings
-from services.rag_service import RAGService
+from logging_config import configure_logging
+from services.export_store import run_janitor
+from services.memory_store import run_sweeper
+from services.metrics import (
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+    monitor_event_loop_lag,
+)
 
 # ═════════════════════════════════════════════════════════════════════════
-#  Redis override – force in-memory storage instead of Redis
+#  Redis override – Redis is off unless explicitly enabled.  Shared state
+#  still works across workers through the embedded SQLite backend
+#  (STATE_BACKEND=sqlite); set USE_REDIS=True with STATE_BACKEND=redis to
+#  share it across boxes instead.
 # ═════════════════════════════════════════════════════════════════════════
-os.environ["USE_REDIS"] = "False"   # ← NEW LINE
+os.environ.setdefault("USE_REDIS", "False")
 
-# ── logging setup ─────────────────────────────────────────────────────────
-logging.basicConfig(level=logging.INFO)
+# ── logging setup (queue-based, env-driven – see logging_config.py) ───────
+configure_logging(
+    level=settings.log_level,
+    module_levels=settings.log_levels,
+    fmt=settings.log_format,
+    sample_rate=settings.log_sample_rate,
+)
 logger = logging.getLogger(__name__)
 
-# ── lifespan (startup / shutdown banner) ──────────────────────────────────
+# ── lifespan (background tasks, shutdown cleanup) ────────────────────────
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("=== RemodelAI Starting ===")
-    print("Available environment variables:")
-    for key, value in os.environ.items():
-        if any(x in key.lower() for x in ["key", "password", "secret"]):
-            print(f"{key}={'*' * 8}")
-        else:
-            print(f"{key}={value}")
-    print("=== Starting application ===")
+    logger.info("=== RemodelAI Starting (%s) ===", settings.environment)
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    sweeper = asyncio.create_task(run_sweeper(settings.memory_sweep_interval))
+    # Estimate statistics build in a worker thread – startup doesn't wait,
+    # the health check reports it until it is done
+    app.state.warm_up = asyncio.get_running_loop().run_in_executor(None, estimate.warm_up)
+    janitor = asyncio.create_task(run_janitor(settings.export_janitor_interval))
+    background = [lag_monitor, sweeper, janitor]
+    if settings.material_price_refresh_interval > 0:
+        background.append(asyncio.create_task(
+            estimate.run_price_refresher(settings.material_price_refresh_interval)
+        ))
     yield
-    print("=== Shutting down application ===")
+    logger.info("=== Shutting down application ===")
+    for task in background:
+        task.cancel()
+    # Cancelled tasks run their cleanup before the loop closes; the warm-up
+    # thread can't be cancelled, so wait for it too
+    await asyncio.gather(*background, app.state.warm_up, return_exceptions=True)
+    # Pooled SerpAPI client (only exists once prices have been fetched) –
+    # closed after the refresher, its other user, has stopped
+    price_module = sys.modules.get("services.material_price_service")
+    if price_module and price_module._service is not None:
+        await price_module._service.aclose()
+    # PDF render processes (only started once something was exported)
+    render_module = sys.modules.get("services.render_pool")
+    if render_module:
+        await asyncio.to_thread(render_module.shutdown_render_pool)
+    # RAGService aiohttp session (only exists once a request used the RAG
+    # stack – importing it here would drag LangChain in just to shut down)
+    rag_module = sys.modules.get("services.rag_service")
+    rag_instance = rag_module.RAGService._instance if rag_module else None
+    if (
+        rag_instance is not None
+        and getattr(rag_instance, "aiohttp_session", None)
+        and not rag_instance.aiohttp_session.closed
+    ):
+        try:
+            await rag_instance.close()
+        except Exception as e:
+            logger.error(f"Error closing aiohttp session: {e}")
+    logger.info("Application shutdown complete")
 
 # ── FastAPI app ───────────────────────────────────────────────────────────
 app = FastAPI(
@@ -70,60 +119,30 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-# ‣ cache layer (simple in-memory HTTP cache)
+# ‣ cache layer (bounded shared HTTP cache – honours Cache-Control)
 app.add_middleware(CacheMiddleware)
 
+# ‣ metrics (outermost so cache hits are timed too)
+app.add_middleware(MetricsMiddleware)
+
 # ═════════════════════════════════════════════════════════════════════════
 #  Request-logging middleware
 # ═════════════════════════════════════════════════════════════════════════
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start = datetime.now()
-    logger.info(f"Request: {request.method} {request.url.path}")
-    logger.info(f"Headers: {dict(request.headers)}")
-    logger.info(f"Origin: {request.headers.get('origin', 'No origin header')}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Request: %s %s", request.method, request.url.path)
+        logger.debug("Headers: %s", dict(request.headers))
+        logger.debug("Origin: %s", request.headers.get("origin", "No origin header"))
     response = await call_next(request)
     duration = (datetime.now() - start).total_seconds()
-    logger.info(f"Response: {response.status_code} – {duration}s")
+    logger.info(
+        "Response: %s %s %s – %ss",
+        request.method, request.url.path, response.status_code, duration,
+    )
     return response
 
-# ═════════════════════════════════════════════════════════════════════════
-#  Graceful shutdown – close all RAGService aiohttp sessions
-# ═════════════════════════════════════════════════════════════════════════
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Ensure any RAGService instances still in memory close their aiohttp sessions."""
-    from services.rag_service import RAGService  # local import to avoid circular refs
-
-    # Force garbage collection so we catch recently dereferenced objects
-    gc.collect()
-
-    closed = 0
-    for obj in gc.get_objects():
-        if isinstance(obj, RAGService):
-            if (
-                hasattr(obj, "aiohttp_session")
-                and obj.aiohttp_session
-                and not obj.aiohttp_session.closed
-            ):
-                try:
-                    await obj.close()
-                    closed += 1
-                except Exception as e:
-                    logger.error(f"Error closing aiohttp session: {e}")
-
-    logger.info(f"Closed {closed} RAGService aiohttp sessions on shutdown")
-
-    # Final sweep: cancel any lingering asyncio tasks to avoid warnings
-    tasks = [
-        t for t in asyncio.all_tasks()
-        if t is not asyncio.current_task() and not t.done()
-    ]
-    for task in tasks:
-        task.cancel()
-
-    logger.info("Application shutdown complete")
-
 # ═════════════════════════════════════════════════════════════════════════
 #  Routers
 # ═════════════════════════════════════════════════════════════════════════
@@ -136,7 +155,7 @@ app.include_router(export.router,   prefix="/api/v1/export",   tags=["export"])
 # ═════════════════════════════════════════════════════════════════════════
 @app.get("/")
 async def root(response: Response):
-    logger.info("Root endpoint accessed")
+    logger.debug("Root endpoint accessed")
     # Cache root for 1 hour
     response.headers["Cache-Control"] = "public, max-age=3600, s-maxage=3600"
     return {"message": "RemodelAI API is running"}
@@ -144,10 +163,25 @@ async def root(response: Response):
 
 @app.get("/api/v1/health")
 async def health_check(response: Response):
-    logger.info("Health check accessed")
-    # Cache health check for 1 hour
-    response.headers["Cache-Control"] = "public, max-age=3600, s-maxage=3600"
-    return {"status": "healthy", "environment": settings.environment}
+    logger.debug("Health check accessed")
+    dataset = estimate.dataset_status()
+    warm_up = getattr(app.state, "warm_up", None)
+    if dataset is not None and dataset["loaded"]:
+        # Cache health check for 1 hour
+        response.headers["Cache-Control"] = "public, max-age=3600, s-maxage=3600"
+        status = "healthy"
+    else:
+        # Still warming up, or estimates fall back to defaults (dataset
+        # missing, or warm-up finished without building it): don't cache
+        response.headers["Cache-Control"] = "no-store"
+        starting = dataset is None and (warm_up is None or not warm_up.done())
+        status = "starting" if starting else "degraded"
+    return {"status": status, "environment": settings.environment, "estimate_data": dataset}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # ═════════════════════════════════════════════════════════════════════════
 #  Debug endpoints
@@ -155,9 +189,11 @@ async def health_check(response: Response):
 @app.get("/debug/pinecone")
 async def debug_pinecone():
     try:
+        from services.rag_service import RAGService
+
         rag = RAGService()
         test_query = "What are ADUs?"
-        response = await rag.get_chat_response(test_query, [])
+        response = await rag.get_chat_response(test_query)
         return {
             "status": "success",
             "vectorstore_initialized": rag.vector_store is not None,
@@ -173,12 +209,20 @@ async def debug_pinecone():
         }
 
 
+@app.get("/debug/cache")
+async def debug_cache():
+    """Hit ratio and occupancy of the HTTP response cache."""
+    return response_cache.stats()
+
+
 @app.post("/api/v1/debug/search")
 async def debug_search(location: str, project_type: str):
     """
     Debug endpoint to inspect raw Pinecone data (very limited use).
     """
     try:
+        from services.rag_service import RAGService
+
         rag_service = RAGService()
 
         # Build synthetic query → embedding
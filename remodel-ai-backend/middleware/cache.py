@@ -1,99 +1,246 @@
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+"""
+Pure-ASGI shared HTTP response cache.
+
+Responses are cached only when the endpoint says so through Cache-Control
+(``public`` / ``max-age`` / ``s-maxage``), and are stored as raw bytes plus
+headers in a byte-bounded LRU (services/memory_store.py), so a hit is one
+``send`` of prebuilt messages – no Response objects, no re-rendering.
+
+  • Scope      – GET only.  POSTs always reach their handler: a chat turn
+                 updates the session's history and context, so replaying a
+                 cached reply would silently skip that turn.
+  • Key        – method, path, sorted query and the request headers
+                 responses vary on (Origin, Accept-Encoding).
+  • Freshness  – s-maxage, else max-age.  Within ``stale-while-revalidate``
+                 a stale GET entry is served immediately and refreshed once
+                 in the background.
+  • Requests   – ``no-store`` bypasses the cache, ``no-cache`` skips the
+                 lookup but stores the fresh response.
+
+Hit / miss / stale counts are kept per cache (``ResponseCache.stats``) and
+exported through the shared cache metrics.
+"""
+import asyncio
 import hashlib
+import logging
 import time
-from typing import Dict, Optional, Tuple
-
-# Simple in-memory cache
-cache: Dict[str, Tuple[float, Response]] = {}
-CACHE_EXPIRY = 3600  # 1 hour in seconds
-
-class CacheMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Only cache GET requests or specific POST endpoints
-        if request.method == "GET" or (
-            request.method == "POST" and 
-            request.url.path == "/api/v1/chat" and 
-            not await self._is_dynamic_content(request)
-        ):
-            cache_key = await self._generate_cache_key(request)
-            cached_response = self._get_cached_response(cache_key)
-            
-            if cached_response:
-                return cached_response
-            
-            # Process the request
-            response = await call_next(request)
-            
-            # Cache the response
-            if 200 <= response.status_code < 400:
-                try:
-                    # Try to read the response body
-                    response_body = [chunk async for chunk in response.body_iterator]
-                    response.body_iterator = self._iterate_in_threadpool(iter(response_body))
-                    
-                    # Create a new response with the same data
-                    content = b"".join(response_body)
-                    cached_resp = Response(
-                        content=content,
-                        status_code=response.status_code,
-                        headers=dict(response.headers),
-                        media_type=response.media_type
-                    )
-                    
-                    # Store in cache
-                    cache[cache_key] = (time.time(), cached_resp)
-                except:
-                    # If we can't cache the response, just return it
-                    pass
-            
-            return response
-        
-        # For non-cacheable requests, just pass through
-        return await call_next(request)
-    
-    async def _is_dynamic_content(self, request: Request) -> bool:
-        """Check if the request is for dynamic content that shouldn't be cached"""
-        if request.url.path != "/api/v1/chat":
-            return False
-            
-        # Don't cache cost estimate requests
-        try:
-            body_bytes = await request.body()
-            body_str = body_bytes.decode("utf-8")
-            import json
-            body = json.loads(body_str)
-            content = body.get("content", "").lower()
-            return "cost" in content or "estimate" in content or "price" in content
-        except:
-            return True
-    
-    async def _generate_cache_key(self, request: Request) -> str:
-        """Generate a unique key for the request"""
-        url = str(request.url)
-        
-        # For POST requests, include the body in the cache key
-        if request.method == "POST":
-            body = await request.body()
-            return hashlib.md5(f"{url}:{body}".encode()).hexdigest()
-        
-        return hashlib.md5(url.encode()).hexdigest()
-    
-    def _get_cached_response(self, key: str) -> Optional[Response]:
-        """Retrieve a cached response if it exists and is not expired"""
-        if key in cache:
-            timestamp, response = cache[key]
-            if time.time() - timestamp < CACHE_EXPIRY:
-                return response
-            # Remove expired cache entry
-            del cache[key]
-        return None
-    
-    def _iterate_in_threadpool(self, iterator):
-        """Return iterator that can be used in async context."""
-        
-        async def _iterate():
-            for item in iterator:
-                yield item
-        
-        return _iterate()
\ No newline at end of file
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from config import settings
+from services.memory_store import MemoryStore
+
+logger = logging.getLogger(__name__)
+
+# Never serve these from cache (scrapes must always be fresh)
+EXCLUDED_PATHS = {"/metrics"}
+KEY_HEADERS = (b"origin", b"accept-encoding")
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives: Dict[str, Optional[str]] = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('" ') or None
+    return directives
+
+
+def _seconds(directives: Dict[str, Optional[str]], name: str) -> int:
+    try:
+        return max(0, int(directives.get(name) or 0))
+    except ValueError:
+        return 0
+
+
+class _Entry:
+    __slots__ = ("status", "headers", "body", "stored_at", "fresh_for", "stale_for")
+
+    def __init__(self, status, headers, body, fresh_for, stale_for):
+        self.status = status
+        self.headers = headers      # without content-length; rebuilt per hit
+        self.body = body
+        self.stored_at = time.time()
+        self.fresh_for = fresh_for
+        self.stale_for = stale_for
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers)
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+
+class ResponseCache:
+    """Byte-bounded LRU of raw responses with hit-ratio bookkeeping."""
+
+    def __init__(self, name: str = "http_response", max_bytes: int = 16 * 1024 * 1024):
+        self.store = MemoryStore(name, max_bytes=max_bytes, shards=settings.memory_store_shards)
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.bypassed = 0
+
+    @property
+    def max_entry_bytes(self) -> int:
+        return self.store.shard_bytes
+
+    def get(self, key: str) -> Optional[_Entry]:
+        return self.store.get(key)
+
+    def put(self, key: str, entry: _Entry) -> None:
+        self.store.set(key, entry, ttl=entry.fresh_for + entry.stale_for, size=entry.size)
+
+    def clear(self) -> None:
+        for key in list(self.store.keys()):
+            self.store.pop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            **self.store.stats(),
+        }
+
+
+response_cache = ResponseCache(max_bytes=settings.http_cache_max_bytes)
+
+
+class CacheMiddleware:
+    """Pure-ASGI middleware serving and filling a ResponseCache."""
+
+    def __init__(self, app, cache: Optional[ResponseCache] = None):
+        self.app = app
+        self.cache = cache or response_cache
+        self._refreshing: set = set()
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] != "GET"
+                or scope["path"] in EXCLUDED_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        request_cc = parse_cache_control(self._header(scope, b"cache-control"))
+        if "no-store" in request_cc:
+            self.cache.bypassed += 1
+            await self.app(scope, receive, send)
+            return
+
+        key = self._key(scope)
+        entry = None if "no-cache" in request_cc else self.cache.get(key)
+        if entry is not None:
+            age = entry.age()
+            if age < entry.fresh_for:
+                self.cache.hits += 1
+                await self._replay(entry, send, age, b"HIT")
+                return
+            if age < entry.fresh_for + entry.stale_for:
+                self.cache.stale_hits += 1
+                await self._replay(entry, send, age, b"STALE")
+                self._revalidate(key, scope)
+                return
+        self.cache.misses += 1
+        await self._fetch(key, scope, receive, send)
+
+    # ─── request side ─────────────────────────────────────────────────────
+    @staticmethod
+    def _header(scope, name: bytes) -> str:
+        for k, v in scope["headers"]:
+            if k == name:
+                return v.decode("latin-1")
+        return ""
+
+    def _key(self, scope) -> str:
+        """Canonical cache key: query parameters sorted, vary headers included."""
+        query = parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+        parts = [
+            scope["method"],
+            scope["path"],
+            urlencode(sorted(query)),
+            *(self._header(scope, name) for name in KEY_HEADERS),
+        ]
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    # ─── response side ────────────────────────────────────────────────────
+    async def _replay(self, entry: _Entry, send, age: float, state: bytes) -> None:
+        headers = entry.headers + [
+            (b"content-length", str(len(entry.body)).encode()),
+            (b"age", str(int(age)).encode()),
+            (b"x-cache", state),
+        ]
+        await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+        await send({"type": "http.response.body", "body": entry.body})
+
+    async def _fetch(self, key: str, scope, receive, send) -> None:
+        """Run the app, streaming its response through while capturing a copy."""
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+        size = 0
+        policy = None
+
+        async def capture(message):
+            nonlocal policy, size
+            if message["type"] == "http.response.start":
+                start.update(message)
+                policy = self._policy(scope, message)
+                message = {**message, "headers": [*message.get("headers", []), (b"x-cache", b"MISS")]}
+            elif message["type"] == "http.response.body" and policy is not None:
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+                if size > self.cache.max_entry_bytes:
+                    policy = None
+                    chunks.clear()
+                elif not message.get("more_body", False):
+                    self._store(key, start, b"".join(chunks), *policy)
+            if send is not None:
+                await send(message)
+
+        await self.app(scope, receive, capture)
+
+    def _policy(self, scope, start) -> Optional[Tuple[int, int]]:
+        """(fresh, stale-while-revalidate) seconds if the response may be stored."""
+        if start["status"] != 200:
+            return None
+        headers = {k.lower(): v.decode("latin-1") for k, v in start.get("headers", [])}
+        if b"set-cookie" in headers:
+            return None
+        vary = {v.strip().lower() for v in headers.get(b"vary", "").split(",") if v.strip()}
+        if not vary <= {n.decode() for n in KEY_HEADERS}:
+            return None
+        cc = parse_cache_control(headers.get(b"cache-control", ""))
+        if {"no-store", "no-cache", "private"} & cc.keys():
+            return None
+        if self._header(scope, b"authorization") and "public" not in cc:
+            return None
+        fresh = _seconds(cc, "s-maxage") if "s-maxage" in cc else _seconds(cc, "max-age")
+        if fresh <= 0:
+            return None
+        return fresh, _seconds(cc, "stale-while-revalidate")
+
+    def _store(self, key: str, start, body: bytes, fresh: int, stale: int) -> None:
+        headers = [(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+        self.cache.put(key, _Entry(start["status"], headers, body, fresh, stale))
+
+    def _revalidate(self, key: str, scope) -> None:
+        """Refresh a stale GET entry once, in the background."""
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def refresh():
+            try:
+                await self._fetch(key, dict(scope), receive, None)
+            except Exception as e:
+                logger.warning("Background revalidation of %s failed: %s", scope["path"], e)
+            finally:
+                self._refreshing.discard(key)
+
+        asyncio.get_running_loop().create_task(refresh())
@@ -100,6 +100,11 @@ class EstimateRequest(BaseModel):
     session_id: Optional[str] = None
 
 
+class BatchEstimateRequest(BaseModel):
+    projects: List[ProjectDetails] = Field(..., min_length=1)  # capped by estimate_batch_max_projects
+    session_id: Optional[str] = None
+
+
 class CostBreakdown(BaseModel):
     materials: float
     labor: float
@@ -144,7 +149,24 @@ class ExportRequest(BaseModel):
     include_similar_projects: bool = True
 
 
+class BulkExportRequest(BaseModel):
+    estimate_ids: List[str] = Field(default_factory=list)
+    session_id: Optional[str] = None           # export the session's recent estimates
+    format: str = Field(default="zip", pattern="^(csv|json|zip)$")
+    entry_format: str = Field(default="pdf", pattern="^(pdf|csv)$")  # files inside a zip
+    include_breakdown: bool = True
+
+
 class ExportResponse(BaseModel):
     file_url: str
     download_name: str
     expires_at: datetime
+
+
+class ExportJobResponse(BaseModel):
+    job_id: str
+    estimate_id: str
+    status: str                       # pending | done | failed
+    status_url: str
+    file_url: Optional[str] = None    # set once done
+    error: Optional[str] = None
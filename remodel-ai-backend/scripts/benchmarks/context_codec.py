@@ -0,0 +1,139 @@
+"""
+Context persistence benchmark: bytes on the wire and encode/decode time.
+
+Replays a synthetic conversation (prices, features and metadata growing
+turn by turn, as they do in production) and, for every codec, reports the
+average payload written per turn and the per-call encode/decode cost.  The
+"delta" rows measure the msgpack per-field hash, where a turn only writes
+the fields that changed.
+
+    uv run python scripts/benchmarks/context_codec.py --turns 30
+    uv run python scripts/benchmarks/context_codec.py --train-dict state/context.zdict
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, BACKEND_DIR)
+
+from services.context_codec import ContextCodec  # noqa: E402
+
+_FEATURES = ["quartz countertops", "island", "custom cabinets", "tile backsplash",
+             "recessed lighting", "hardwood floors", "walk-in shower", "double vanity"]
+
+
+def conversation(turns: int, session: int = 0) -> List[Dict[str, Any]]:
+    """Context snapshots after each turn of one synthetic conversation."""
+    snapshots = []
+    ctx: Dict[str, Any] = {
+        "session_id": f"3f2c9a1e-{session:04d}-4b8e-9d2f-7a6c5e4b3a21",
+        "location": None, "project_type": None, "budget_range": {}, "timeline": None,
+        "discussed_prices": {}, "specific_features": [], "conversation_summary": "",
+        "last_updated": datetime(2024, 1, 1).isoformat(), "turn_count": 0, "metadata": {},
+    }
+    for turn in range(turns):
+        ctx = json.loads(json.dumps(ctx))
+        if turn == 0:
+            ctx["project_type"] = ("kitchen", "bathroom", "adu")[session % 3]
+        if turn == 1:
+            ctx["location"] = ("San Diego", "Los Angeles")[session % 2]
+        if turn % 2 == 0:
+            price = 20_000 + 1_500 * turn + 250 * session
+            ctx["discussed_prices"].setdefault(ctx["project_type"], []).append(f"{price:,}")
+            ctx["budget_range"] = {"min": 20_000, "max": price}
+        if turn % 3 == 0 and turn // 3 < len(_FEATURES):
+            ctx["specific_features"].append(_FEATURES[turn // 3])
+        if turn == 4:
+            ctx["timeline"] = "6-8 weeks"
+        ctx["metadata"][f"turn_{turn}_lang"] = "en"
+        ctx["conversation_summary"] = (
+            f"Discussing {ctx['project_type'].capitalize()} remodel in {ctx['location']} "
+            f"with budget ${ctx['budget_range'].get('min', 0):,}-${ctx['budget_range'].get('max', 0):,}."
+        )
+        ctx["turn_count"] = turn + 1
+        ctx["last_updated"] = (datetime(2024, 1, 1) + timedelta(minutes=turn)).isoformat()
+        snapshots.append(ctx)
+    return snapshots
+
+
+def _timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench_blob(name: str, codec, snapshots, repeat: int) -> None:
+    encoded = [codec(s) if callable(codec) else codec.encode(s) for s in snapshots]
+    avg_bytes = sum(map(len, encoded)) / len(encoded)
+    last = snapshots[-1]
+    if callable(codec):  # legacy path: json.dumps(...).encode() / json.loads
+        enc_us = _timed(lambda: json.dumps(last).encode(), repeat)
+        dec_us = _timed(lambda: json.loads(encoded[-1]), repeat)
+    else:
+        enc_us = _timed(lambda: codec.encode(last), repeat)
+        dec_us = _timed(lambda: codec.decode(encoded[-1]), repeat)
+    print(f"{name:<24}{avg_bytes:>10.0f}{len(encoded[-1]):>10}{enc_us:>12.1f}{dec_us:>12.1f}")
+
+
+def bench_delta(codec: ContextCodec, snapshots, repeat: int) -> None:
+    written = []
+    previous: Dict[str, Any] = {}
+    for snap in snapshots:
+        changed = {k: v for k, v in snap.items() if previous.get(k) != v}
+        written.append(sum(len(k) + len(v) for k, v in codec.encode_fields(changed).items()))
+        previous = snap
+    fields = codec.encode_fields(snapshots[-1])
+    enc_us = _timed(lambda: codec.encode_fields({"turn_count": 1, "last_updated": "x"}), repeat)
+    dec_us = _timed(lambda: codec.decode_fields(fields), repeat)
+    full = sum(len(k) + len(v) for k, v in fields.items())
+    print(f"{'msgpack delta (hash)':<24}{sum(written) / len(written):>10.0f}{full:>10}"
+          f"{enc_us:>12.1f}{dec_us:>12.1f}")
+
+
+def train_dictionary(path: str, samples: int = 2000, size: int = 4096) -> None:
+    import zstandard
+
+    packer = ContextCodec("msgpack")
+    corpus = [packer.encode_value(snap)[2:]  # raw msgpack body, without our header
+              for session in range(samples // 20)
+              for snap in conversation(20, session)]
+    zdict = zstandard.train_dictionary(size, corpus)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(zdict.as_bytes())
+    print(f"Wrote {len(zdict.as_bytes())}-byte dictionary from {len(corpus)} samples to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--zstd-dict", help="trained dictionary to benchmark (CONTEXT_ZSTD_DICT)")
+    parser.add_argument("--train-dict", metavar="PATH", help="train a zstd dictionary and exit")
+    args = parser.parse_args()
+
+    if args.train_dict:
+        train_dictionary(args.train_dict)
+        return
+
+    snapshots = conversation(args.turns, session=7)
+    print(f"Context persistence over a {args.turns}-turn conversation")
+    print(f"{'codec':<24}{'avg B':>10}{'last B':>10}{'enc µs':>12}{'dec µs':>12}")
+    print("-" * 68)
+    bench_blob("json (current)", lambda s: json.dumps(s).encode(), snapshots, args.repeat)
+    bench_blob("msgpack", ContextCodec("msgpack"), snapshots, args.repeat)
+    bench_blob("msgpack+zstd", ContextCodec("msgpack+zstd"), snapshots, args.repeat)
+    if args.zstd_dict:
+        bench_blob("msgpack+zstd (dict)", ContextCodec("msgpack+zstd", args.zstd_dict),
+                   snapshots, args.repeat)
+    bench_delta(ContextCodec("msgpack"), snapshots, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Portfolio estimate benchmark: one request per project vs. the batch path.
+
+Builds an engine from synthetic dataset rows, then estimates the same
+portfolio twice against an in-memory state backend – once through
+``generate_estimate`` per project (as a client looping over
+POST /estimate/ would), once through ``generate_batch``.  Material-price
+lookups are answered empty so only the estimate path itself is timed.
+
+    uv run python scripts/benchmarks/estimate_batch.py --projects 5000
+    uv run python scripts/benchmarks/estimate_batch.py --projects 5000 --distinct 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, BACKEND_DIR)
+
+from schemas import ProjectDetails, ProjectType  # noqa: E402
+from services.estimate_engine import CITIES, REFERENCE_SQFT, EstimateEngine  # noqa: E402
+from services.estimate_service import EstimateService  # noqa: E402
+from services.estimate_store import EstimateStore  # noqa: E402
+from services.state_backend import MemoryStateBackend  # noqa: E402
+
+
+class _NoPrices:
+    def get_common_materials(self, project_type) -> List[str]:
+        return []
+
+    async def get_material_prices(self, materials, location) -> Dict:
+        return {}
+
+
+def dataset(rows_per_group: int = 40) -> List[Dict[str, str]]:
+    rng = random.Random(1)
+    rows = []
+    for city in CITIES:
+        for project_type, sqft in REFERENCE_SQFT.items():
+            for _ in range(rows_per_group):
+                low = sqft * rng.uniform(50, 250)
+                rows.append({
+                    "Location": city, "Remodel Type": project_type,
+                    "Average Cost (Low)": f"{low:.0f}", "Average Cost (High)": f"{low * 1.6:.0f}",
+                    "Average Time (weeks/other unit)": f"{rng.randint(2, 20)} weeks",
+                })
+    return rows
+
+
+def portfolio(size: int, distinct: int) -> List[ProjectDetails]:
+    rng = random.Random(2)
+    types = list(ProjectType)
+    unique = [
+        ProjectDetails(project_type=rng.choice(types), property_type="single_family",
+                       city=rng.choice(CITIES), state="CA", square_footage=rng.randint(50, 4000))
+        for _ in range(distinct or size)
+    ]
+    return [unique[i % len(unique)] for i in range(size)]
+
+
+def service(engine: EstimateEngine) -> EstimateService:
+    svc = EstimateService.__new__(EstimateService)
+    svc.engine = engine
+    svc.material_service = _NoPrices()
+    svc.store = EstimateStore(MemoryStateBackend())
+    return svc
+
+
+async def run(projects: List[ProjectDetails], engine: EstimateEngine) -> None:
+    svc = service(engine)
+    start = time.perf_counter()
+    for project in projects:
+        await svc.generate_estimate(project)
+    single = time.perf_counter() - start
+
+    svc = service(engine)
+    start = time.perf_counter()
+    count = 0
+    async for chunk in svc.generate_batch(projects):
+        count += len(chunk)
+    batch = time.perf_counter() - start
+    assert count == len(projects)
+
+    print(f"{'path':<20}{'seconds':>10}{'projects/s':>14}")
+    print("-" * 44)
+    for name, elapsed in (("per project", single), ("batch", batch)):
+        print(f"{name:<20}{elapsed:>10.3f}{len(projects) / elapsed:>14.0f}")
+    print(f"speed-up: {single / batch:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=0, help="distinct projects (0 = all unique)")
+    args = parser.parse_args()
+
+    engine = EstimateEngine(dataset())
+    projects = portfolio(args.projects, args.distinct)
+    print(f"Estimating {len(projects)} projects ({args.distinct or len(projects)} distinct)")
+    asyncio.run(run(projects, engine))
+
+
+if __name__ == "__main__":
+    main()
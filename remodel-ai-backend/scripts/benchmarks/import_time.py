@@ -0,0 +1,72 @@
+"""
+Cold-start import profile for the API.
+
+Runs ``python -X importtime -c "import main"`` in a fresh interpreter,
+prints the slowest modules by cumulative import time, flags any heavy
+dependency that leaked onto the import path, and exits non-zero when the
+total exceeds the startup budget.
+
+    uv run python scripts/benchmarks/import_time.py --budget-ms 1500 --top 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules that must only be imported on first use, never by ``import main``
+HEAVY_MODULES = ["langchain", "langchain_openai", "langchain_pinecone", "pinecone",
+                 "reportlab", "serpapi", "pandas", "redis"]
+
+
+def profile_import(module: str = "main") -> List[Tuple[str, int, int]]:
+    """Return (module, self_us, cumulative_us) for every import, in order."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "LOG_LEVEL": "OFF"},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    rows = profile_import(args.module)
+    total_ms = next((cum for name, _, cum in rows if name == args.module), 0) / 1000
+
+    print(f"Import profile for '{args.module}' (cumulative, top {args.top})")
+    print("-" * 60)
+    for name, self_us, cum_us in sorted(rows, key=lambda r: r[2], reverse=True)[: args.top]:
+        print(f"{cum_us / 1000:10.1f} ms  {self_us / 1000:8.1f} ms  {name}")
+    print("-" * 60)
+
+    leaked = sorted({name for name, _, _ in rows if name.split(".")[0] in HEAVY_MODULES})
+    if leaked:
+        print(f"Heavy modules imported at startup: {', '.join(leaked[:10])}"
+              f"{' …' if len(leaked) > 10 else ''}")
+
+    print(f"Total: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms or leaked:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+PDF render benchmark: reports per second and allocations per render.
+
+Renders a mix of representative estimates (kitchens to ADUs, with and
+without the cost breakdown) two ways:
+
+  • before – the report template rebuilt for every render (stylesheet,
+             paragraph/table styles, static headings and footer) and
+             ASCII85-encoded streams, as the renderer used to work;
+  • after  – the process-wide template from services/pdf_render.py, with
+             only the per-estimate paragraphs and tables built per render.
+
+Allocations (peak KiB traced by tracemalloc during one render) are measured
+over a separate, shorter run – tracing slows rendering down, so it is kept
+out of the timing.
+
+    uv run python scripts/benchmarks/pdf_render.py --renders 300
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, BACKEND_DIR)
+
+from reportlab import rl_config  # noqa: E402
+
+from services import pdf_render  # noqa: E402
+
+Job = Tuple[str, dict, bool, str]
+
+
+def estimates(count: int) -> List[Job]:
+    """Render inputs shaped like production estimates."""
+    jobs = []
+    for i in range(count):
+        total = 18_000 + (i * 7_919) % 240_000
+        construction = 20 + (i * 13) % 140
+        data = {
+            "total_cost": total,
+            "cost_range_low": total * 0.85,
+            "cost_range_high": total * 1.2,
+            "confidence_score": 0.7 + (i % 25) / 100,
+            "cost_breakdown": {"materials": total * 0.4, "labor": total * 0.35,
+                               "permits": total * 0.05, "other": total * 0.2},
+            "timeline": {"planning_days": 14, "permit_days": 30, "construction_days": construction,
+                         "total_days": 44 + construction},
+        }
+        jobs.append((f"est_{i:08x}", data, i % 4 != 0, "May 01, 2026"))
+    return jobs
+
+
+def before(estimate_id, estimate_data, include_breakdown, report_date) -> bytes:
+    return pdf_render.ReportTemplate().render(estimate_id, estimate_data, include_breakdown, report_date)
+
+
+def throughput(render: Callable[..., bytes], jobs: List[Job]) -> float:
+    start = time.perf_counter()
+    for job in jobs:
+        render(*job)
+    return len(jobs) / (time.perf_counter() - start)
+
+
+def allocations(render: Callable[..., bytes], jobs: List[Job]) -> float:
+    """Average peak KiB allocated during a render (above what was live before it)."""
+    tracemalloc.start()
+    total = 0
+    for job in jobs:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        render(*job)
+        total += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return total / len(jobs) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=300)
+    parser.add_argument("--traced", type=int, default=30, help="renders measured with tracemalloc")
+    args = parser.parse_args()
+
+    jobs = estimates(args.renders)
+    traced = jobs[:args.traced]
+    pdf_render.render_pdf(*jobs[0])  # build the shared template, warm ReportLab's caches
+
+    results = []
+    for name, render, use_a85 in (("before", before, 1), ("after", pdf_render.render_pdf, 0)):
+        rl_config.useA85 = use_a85
+        rate = throughput(render, jobs)
+        results.append((name, rate, allocations(render, traced)))
+
+    print(f"Rendering {len(jobs)} estimates ({len(traced)} traced)")
+    print(f"{'path':<10}{'PDFs/s':>10}{'KiB/render':>14}")
+    print("-" * 34)
+    for name, rate, kib in results:
+        print(f"{name:<10}{rate:>10.1f}{kib:>14.1f}")
+    print(f"speed-up: {results[1][1] / results[0][1]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
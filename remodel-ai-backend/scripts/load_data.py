@@ -1,8 +1,34 @@
+"""
+Load the remodeling dataset into Pinecone.
+
+Ingestion is an async pipeline: embedding requests and upserts each run
+several at a time, paced by rate limiters that back off on 429s (honouring
+Retry-After) and speed up again while calls succeed.  Failed calls are
+retried with exponential backoff; a batch that still fails is reported and
+the script exits non-zero instead of dropping the rows.  Stored document
+ids are appended to a checkpoint file, so an interrupted load resumes where
+it stopped (the checkpoint is tied to the CSV's content and removed once
+everything is stored).
+
+Loads are incremental.  A row's vector id comes from its content key
+(remodel type, location, source URL), not its position, and its metadata
+carries a hash of the document.  Rows whose stored hash matches are skipped
+without calling the embeddings API, vectors for rows no longer in the CSV
+are deleted, and the run reports added / updated / unchanged / deleted.
+
+    python scripts/load_data.py
+    python scripts/load_data.py ../remodel-ai-data/processed/cleaned_data_all.csv --embed-concurrency 8
+"""
 import os
 import sys
+import json
+import random
+import asyncio
+import hashlib
+import argparse
 import pandas as pd
 import numpy as np
-from typing import List, Dict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
 from pinecone import Pinecone
 from langchain.embeddings import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -16,8 +42,100 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
+DEFAULT_CHECKPOINT = "state/ingest_checkpoint.jsonl"
+ID_PREFIX = "proj_"
+LEGACY_ID_PREFIX = "doc_"   # row-position ids written by earlier loads; removed as stale
+FETCH_BATCH = 100           # ids per Pinecone fetch when comparing content hashes
+DELETE_BATCH = 1000         # ids per Pinecone delete
+def _row_id(key: str) -> str:
+    """Stable vector id for a row's content key"""
+    return ID_PREFIX + hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+def _content_hash(text: str, metadata: Dict) -> str:
+    canonical = json.dumps({"text": text, "metadata": metadata}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait if *error* is a 429 (0 when the server gave no Retry-After), else None"""
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if status != 429:
+        return None
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+def _transient(error: Exception) -> bool:
+    """Whether retrying *error* can help: not for bugs or 4xx responses (other than 429)"""
+    if isinstance(error, (AttributeError, TypeError, ValueError)):
+        return False
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status != 429)
+class _AdaptiveLimiter:
+    """
+    Spaces calls at most *rate* per second.  A 429 halves the rate and
+    pauses until Retry-After; every success adds a little back (AIMD), up
+    to four times the starting rate.
+    """
+    def __init__(self, name: str, rate: float):
+        self.name = name
+        self.rate = rate
+        self.min_rate = rate / 32
+        self.max_rate = rate * 4
+        self.step = rate / 10
+        self._next = 0.0
+    async def wait(self) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + 1.0 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+    def success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.step)
+    def throttled(self, retry_after: float) -> None:
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._next = max(self._next, time.monotonic() + retry_after)
+        logger.warning(f"{self.name}: rate limited; slowing to {self.rate:.2f} calls/s")
+class _Checkpoint:
+    """Append-only record of stored document ids, valid for one input file (by content hash)"""
+    def __init__(self, path: str, source_hash: str):
+        self.path = path
+        self.source_hash = source_hash
+        self._file = None
+    def load(self) -> Set[str]:
+        """Ids stored by an earlier, interrupted run of the same input"""
+        if not os.path.exists(self.path):
+            return set()
+        done: Set[str] = set()
+        with open(self.path, encoding="utf-8") as f:
+            header = f.readline()
+            try:
+                if json.loads(header).get("source") != self.source_hash:
+                    logger.info("Checkpoint is for a different input; starting over")
+                    return set()
+            except ValueError:
+                return set()
+            for line in f:
+                try:
+                    done.update(json.loads(line))
+                except ValueError:  # torn last line of an interrupted run
+                    break
+        return done
+    def open(self, resume: bool) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        if not resume:
+            self._file.write(json.dumps({"source": self.source_hash}) + "\n")
+            self._file.flush()
+    def mark(self, ids: List[str]) -> None:
+        self._file.write(json.dumps(ids) + "\n")
+        self._file.flush()
+    def close(self, complete: bool) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if complete and os.path.exists(self.path):
+            os.remove(self.path)
 class DataLoader:
-    def __init__(self):
+    def __init__(self, embed_rate: float = 5.0, upsert_rate: float = 10.0, max_attempts: int = 6):
         # Initialize Pinecone
         self.pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
         self.index_name = os.getenv('PINECONE_INDEX')
@@ -33,10 +151,16 @@ class DataLoader:
             # Wait for index to be ready
             time.sleep(10)
         self.index = self.pc.Index(self.index_name)
-        # Initialize embeddings
+        # Initialize embeddings (no client-side retries: 429s drive the limiter below)
         self.embeddings = OpenAIEmbeddings(
-            openai_api_key=os.getenv('OPENAI_API_KEY')
+            openai_api_key=os.getenv('OPENAI_API_KEY'),
+            max_retries=0
         )
+        # Adaptive pacing and retry policy for the ingestion pipeline
+        self.embed_limiter = _AdaptiveLimiter("embeddings", embed_rate)
+        self.upsert_limiter = _AdaptiveLimiter("pinecone upsert", upsert_rate)
+        self.fetch_limiter = _AdaptiveLimiter("pinecone fetch", upsert_rate)
+        self.max_attempts = max_attempts
     def load_csv_data(self, csv_path: str):
         """Load data from CSV file"""
         logger.info(f"Loading data from {csv_path}")
@@ -46,7 +170,7 @@ class DataLoader:
         logger.info(f"Loaded {len(df)} records")
         return df
     def prepare_documents(self, df: pd.DataFrame) -> List[Dict]:
-        """Prepare documents for embedding"""
+        """Prepare documents for embedding, with ids from their content key and a content hash"""
         documents = []
         for idx, row in df.iterrows():
             # Create comprehensive text for each project
@@ -69,8 +193,8 @@ class DataLoader:
             """
             # Check if it's a California project
             is_ca = location.lower() in ['san diego', 'los angeles', 'la', 'sd']
+            text = text.strip()
             metadata = {
-                'project_id': f'proj_{idx}',
                 'remodel_type': remodel_type,
                 'location': location,
                 'cost_low': cost_low,
@@ -80,40 +204,216 @@ class DataLoader:
                 'source_url': source,
                 'is_california': is_ca
             }
+            metadata['content_hash'] = _content_hash(text, metadata)
             documents.append({
-                'id': f'doc_{idx}',
-                'text': text.strip(),
+                'key': "|".join(value.strip().lower() for value in (remodel_type, location, source)),
+                'text': text,
                 'metadata': metadata
             })
+        self._assign_ids(documents)
         logger.info(f"Prepared {len(documents)} documents")
         return documents
-    def embed_and_store(self, documents: List[Dict], batch_size: int = 50):
-        """Embed documents and store in Pinecone"""
-        total_docs = len(documents)
-        logger.info(f"Embedding and storing {total_docs} documents")
-        for i in range(0, total_docs, batch_size):
-            batch = documents[i:i+batch_size]
-            texts = [doc['text'] for doc in batch]
+    @staticmethod
+    def _assign_ids(documents: List[Dict]) -> None:
+        """
+        Stable ids from the row's identifying columns (type, location, source),
+        so an edited row updates its vector in place.  Rows sharing those
+        columns are told apart by content instead; only exact repeats are
+        numbered (in file order).
+        """
+        keys: Dict[str, int] = {}
+        for doc in documents:
+            keys[doc['key']] = keys.get(doc['key'], 0) + 1
+        seen: Dict[str, int] = {}
+        for doc in documents:
+            key = doc.pop('key')
+            if keys[key] > 1:
+                key = f"{key}#{doc['metadata']['content_hash']}"
+                seen[key] = seen.get(key, 0) + 1
+                if seen[key] > 1:
+                    key = f"{key}#{seen[key]}"
+            doc['id'] = _row_id(key)
+            doc['metadata']['project_id'] = doc['id']
+    async def _call(self, limiter: _AdaptiveLimiter, call: Callable[[], Awaitable], what: str):
+        """
+        Run *call* paced by *limiter*, retrying transient errors with
+        exponential backoff (longer after a 429); other errors are raised at once.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            await limiter.wait()
             try:
-                # Generate embeddings
-                embeddings = self.embeddings.embed_documents(texts)
-                # Prepare vectors for Pinecone
-                vectors = []
-                for doc, embedding in zip(batch, embeddings):
-                    vectors.append({
-                        'id': doc['id'],
-                        'values': embedding,
-                        'metadata': doc['metadata']
-                    })
-                # Upsert to Pinecone
-                self.index.upsert(vectors=vectors)
-                logger.info(f"Processed batch {i//batch_size + 1}/{(total_docs//batch_size) + 1}")
-                # Add small delay to avoid rate limits
-                time.sleep(0.5)
+                result = await call()
+                limiter.success()
+                return result
             except Exception as e:
-                logger.error(f"Error processing batch {i//batch_size + 1}: {str(e)}")
-                continue
-        logger.info("All documents embedded and stored successfully!")
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    limiter.throttled(retry_after)
+                if attempt == self.max_attempts or not _transient(e):
+                    raise
+                delay = max(retry_after or 0, min(60, 2 ** attempt) * random.uniform(0.5, 1.0))
+                logger.warning(f"{what} failed (attempt {attempt}/{self.max_attempts}): {str(e)}; "
+                               f"retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+    async def embed_and_store(
+        self,
+        documents: List[Dict],
+        batch_size: int = 100,
+        embed_concurrency: int = 4,
+        upsert_concurrency: int = 4,
+        checkpoint: Optional[_Checkpoint] = None,
+    ) -> int:
+        """
+        Embed documents and store them in Pinecone; returns how many rows failed.
+
+        Embedding workers feed a bounded queue drained by upsert workers, so
+        the two stages overlap.  Ids already in *checkpoint* are skipped and
+        every stored batch is appended to it.
+        """
+        done = checkpoint.load() if checkpoint else set()
+        todo = [doc for doc in documents if doc['id'] not in done]
+        if done:
+            logger.info(f"Resuming: {len(documents) - len(todo)} of {len(documents)} documents already stored")
+        if checkpoint:
+            checkpoint.open(resume=bool(done))
+        total = len(todo)
+        logger.info(f"Embedding and storing {total} documents")
+        batches = iter([todo[i:i + batch_size] for i in range(0, total, batch_size)])
+        vectors_queue: asyncio.Queue = asyncio.Queue(maxsize=upsert_concurrency * 2)
+        failed: List[str] = []
+        stored = 0
+        started = last_report = time.monotonic()
+        async def embedder():
+            for batch in batches:  # shared iterator: each batch goes to one worker
+                texts = [doc['text'] for doc in batch]
+                try:
+                    embeddings = await self._call(
+                        self.embed_limiter, lambda: self.embeddings.aembed_documents(texts), "Embedding batch"
+                    )
+                except Exception as e:
+                    logger.error(f"Giving up on embedding {len(batch)} documents: {str(e)}")
+                    failed.extend(doc['id'] for doc in batch)
+                    continue
+                await vectors_queue.put([
+                    {'id': doc['id'], 'values': embedding, 'metadata': doc['metadata']}
+                    for doc, embedding in zip(batch, embeddings)
+                ])
+        async def upserter():
+            nonlocal stored, last_report
+            while True:
+                vectors = await vectors_queue.get()
+                if vectors is None:
+                    return
+                try:
+                    await self._call(
+                        self.upsert_limiter, lambda: asyncio.to_thread(self.index.upsert, vectors=vectors),
+                        "Upsert batch"
+                    )
+                except Exception as e:
+                    logger.error(f"Giving up on upserting {len(vectors)} vectors: {str(e)}")
+                    failed.extend(vector['id'] for vector in vectors)
+                    continue
+                if checkpoint:
+                    checkpoint.mark([vector['id'] for vector in vectors])
+                stored += len(vectors)
+                now = time.monotonic()
+                if now - last_report >= 5 or stored == total:
+                    last_report = now
+                    logger.info(f"Stored {stored}/{total} documents ({stored / (now - started):.1f} rows/s)")
+        upserters = [asyncio.create_task(upserter()) for _ in range(upsert_concurrency)]
+        try:
+            await asyncio.gather(*(embedder() for _ in range(embed_concurrency)))
+            for _ in upserters:
+                await vectors_queue.put(None)
+            await asyncio.gather(*upserters)
+        finally:
+            for task in upserters:
+                task.cancel()
+            if checkpoint:
+                checkpoint.close(complete=not failed and stored == total)
+        elapsed = time.monotonic() - started
+        logger.info(f"Stored {stored} documents in {elapsed:.1f}s ({stored / max(elapsed, 1e-9):.1f} rows/s)")
+        if failed:
+            logger.error(f"{len(failed)} documents were not stored; re-run to retry them "
+                         f"(checkpoint: {checkpoint.path if checkpoint else 'none'})")
+        else:
+            logger.info("All documents embedded and stored successfully!")
+        return len(failed)
+    # ── incremental sync ──────────────────────────────────────────────────
+    async def _stored_hashes(self, ids: List[str], concurrency: int) -> Dict[str, str]:
+        """content_hash metadata of the vectors already stored under *ids*"""
+        semaphore = asyncio.Semaphore(concurrency)
+        async def fetch(chunk: List[str]) -> Dict[str, str]:
+            async with semaphore:
+                response = await self._call(
+                    self.fetch_limiter, lambda: asyncio.to_thread(self.index.fetch, ids=chunk), "Fetch"
+                )
+            return {
+                vector_id: (vector.metadata or {}).get('content_hash')
+                for vector_id, vector in response.vectors.items()
+            }
+        stored: Dict[str, str] = {}
+        chunks = [ids[i:i + FETCH_BATCH] for i in range(0, len(ids), FETCH_BATCH)]
+        for found in await asyncio.gather(*(fetch(chunk) for chunk in chunks)):
+            stored.update(found)
+        return stored
+    async def _stale_ids(self, current: Set[str]) -> Optional[List[str]]:
+        """Stored ids of rows no longer in the input (None if the index cannot list ids)"""
+        def list_ids() -> List[str]:
+            ids: List[str] = []
+            for prefix in (ID_PREFIX, LEGACY_ID_PREFIX):
+                for page in self.index.list(prefix=prefix):
+                    ids.extend(page)
+            return ids
+        try:
+            stored = await self._call(self.fetch_limiter, lambda: asyncio.to_thread(list_ids), "List ids")
+        except Exception as e:  # e.g. pod-based indexes, which cannot list ids
+            logger.warning(f"Cannot list stored ids ({type(e).__name__}: {str(e)}); "
+                           f"stale vectors were not deleted")
+            return None
+        return [vector_id for vector_id in stored if vector_id not in current]
+    async def _delete(self, ids: List[str]) -> None:
+        for i in range(0, len(ids), DELETE_BATCH):
+            chunk = ids[i:i + DELETE_BATCH]
+            await self._call(self.upsert_limiter, lambda: asyncio.to_thread(self.index.delete, ids=chunk), "Delete")
+    async def sync(self, documents: List[Dict], **pipeline) -> Dict[str, int]:
+        """
+        Bring the index in line with *documents*: embed and store only new or
+        changed rows (by content hash), delete vectors of rows that are gone.
+        Nothing is deleted if any row failed to store: a failed row's old
+        vector (e.g. its legacy ``doc_`` id) stays until a re-run replaces it.
+        *pipeline* is passed to ``embed_and_store``.  Returns the counts.
+        """
+        started = time.monotonic()
+        ids = [doc['id'] for doc in documents]
+        stored = await self._stored_hashes(ids, pipeline.get('upsert_concurrency', 4))
+        changed = [doc for doc in documents if stored.get(doc['id']) != doc['metadata']['content_hash']]
+        added = sum(1 for doc in changed if doc['id'] not in stored)
+        report = {
+            'added': added,
+            'updated': len(changed) - added,
+            'unchanged': len(documents) - len(changed),
+            'deleted': 0,
+            'failed': 0,
+        }
+        logger.info(f"{report['added']} new, {report['updated']} changed, "
+                    f"{report['unchanged']} unchanged documents")
+        if changed:
+            report['failed'] = await self.embed_and_store(changed, **pipeline)
+        if report['failed']:
+            logger.warning("Some documents were not stored; skipping deletion of stale vectors until a re-run succeeds")
+            stale = None
+        else:
+            stale = await self._stale_ids(set(ids))
+        if stale:
+            await self._delete(stale)
+            report['deleted'] = len(stale)
+        logger.info(
+            f"Sync finished in {time.monotonic() - started:.1f}s: added {report['added']}, "
+            f"updated {report['updated']}, unchanged {report['unchanged']}, "
+            f"deleted {report['deleted']}, failed {report['failed']}"
+        )
+        return report
     def verify_data(self):
         """Verify data was loaded correctly"""
         stats = self.index.describe_index_stats()
@@ -131,9 +431,25 @@ class DataLoader:
             logger.info(f"Score: {match['score']:.4f}")
             logger.info(f"Metadata: {match.get('metadata', {})}")
             logger.info("---")
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_path", nargs="?", help="CSV to load (default: first of the usual locations)")
+    parser.add_argument("--batch-size", type=int, default=100, help="documents per embedding request / upsert")
+    parser.add_argument("--embed-concurrency", type=int, default=4)
+    parser.add_argument("--upsert-concurrency", type=int, default=4)
+    parser.add_argument("--embed-rate", type=float, default=5.0, help="initial embedding requests per second")
+    parser.add_argument("--upsert-rate", type=float, default=10.0, help="initial upserts per second")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--no-verify", action="store_true", help="skip the test query at the end")
+    args = parser.parse_args()
     # Possible CSV paths
-    csv_paths = [
+    csv_paths = [args.csv_path] if args.csv_path else [
         "../remodel-ai-data/processed/cleaned_data_all.csv",
         "../remodel-ai-data/cleaned_remodeling_data_1000.csv",
         "../../remodel-ai-data/processed/cleaned_data_all.csv",
@@ -152,13 +468,22 @@ if __name__ == "__main__":
         sys.exit(1)
     try:
         # Initialize loader
-        loader = DataLoader()
+        loader = DataLoader(embed_rate=args.embed_rate, upsert_rate=args.upsert_rate)
         # Load and process data
         df = loader.load_csv_data(csv_path)
         documents = loader.prepare_documents(df)
-        loader.embed_and_store(documents)
+        report = asyncio.run(loader.sync(
+            documents,
+            batch_size=args.batch_size,
+            embed_concurrency=args.embed_concurrency,
+            upsert_concurrency=args.upsert_concurrency,
+            checkpoint=_Checkpoint(args.checkpoint, _file_hash(csv_path)),
+        ))
+        if report['failed']:
+            sys.exit(1)
         # Verify data
-        loader.verify_data()
+        if not args.no_verify:
+            loader.verify_data()
     except Exception as e:
         logger.error(f"Error during data loading: {str(e)}")
-        raise
\ No newline at end of file
+        raise
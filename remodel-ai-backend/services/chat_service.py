@@ -1,6 +1,7 @@
 from typing import List, Dict, Any, Optional
 from services.rag_service import RAGService
 from services.session_service import SessionService
+from services.metrics import observe_stage
 import logging
 import uuid
 
@@ -10,6 +11,7 @@ class ChatService:
     def __init__(self):
         self.rag_service = RAGService()
         self.session_service = SessionService()
+        self.context_manager = self.rag_service.context_manager
     
     async def process_message(self, content: str, role: str = "user", session_id: Optional[str] = None) -> Dict[str, Any]:
         """Process a chat message and return response"""
@@ -18,33 +20,25 @@ class ChatService:
             if not session_id:
                 session_id = str(uuid.uuid4())
             
-            # Get session history
-            session = self.session_service.get_session(session_id)
-            chat_history = session.get("messages", [])
-            
-            # Convert chat history to the format expected by RAGService
-            formatted_history = []
-            for i in range(0, len(chat_history), 2):
-                if i + 1 < len(chat_history):
-                    human_msg = chat_history[i].get("content", "")
-                    ai_msg = chat_history[i + 1].get("content", "")
-                    formatted_history.append((human_msg, ai_msg))
-            
-            # Get response from RAG service - now with session_id
-            response = await self.rag_service.get_chat_response(
-                query=content,
-                chat_history=formatted_history,
-                session_id=session_id  # Pass session ID for caching
-            )
-            
-            # Update session with new messages
-            chat_history.append({"role": role, "content": content})
-            chat_history.append({"role": "assistant", "content": response["message"]})
-            
-            self.session_service.update_session(
-                session_id=session_id,
-                messages=chat_history
-            )
+            # One read: summary, recent messages and context live in a single
+            # session-state record that every stage of the turn shares
+            async with self.context_manager.unit_of_work(session_id) as uow:
+                # Get response from RAG service; it reads the summary and
+                # recent messages from the same record (uow.state)
+                response = await self.rag_service.get_chat_response(
+                    query=content,
+                    session_id=session_id
+                )
+                
+                # One write: the updated record and this turn's transcript
+                # append go out together (a single pipeline on Redis)
+                with observe_stage("context_save"):
+                    await uow.flush(appends=[
+                        self.session_service.history_append(session_id, [
+                            {"role": role, "content": content},
+                            {"role": "assistant", "content": response["message"]},
+                        ]),
+                    ])
             
             return {
                 "message": response["message"],
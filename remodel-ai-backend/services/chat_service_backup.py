@@ -35,8 +35,7 @@ class ChatService:
             })
             # Get response from RAG system
             response = await self.rag_service.get_chat_response(
-                query=content,
-                chat_history=chat_sessions[session_id]
+                query=content
             )
             # Add assistant response to history
             chat_sessions[session_id].append({
@@ -1,6 +1,9 @@
 ﻿# services/city_mappings.py
+import logging
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------------------------------------------------------
 #  City / neighbourhood aliases that should resolve to “San Diego” or
 #  “Los Angeles”.  Put the longer strings first so they win the match.
@@ -59,7 +62,7 @@ def normalize_location(location_text: str) -> Optional[str]:
         return None
 
     location_lower = location_text.lower().strip()
-    print(f"DEBUG: normalize_location checking: '{location_lower}'")
+    logger.debug("normalize_location checking: '%s'", location_lower)
 
     # longest aliases first → “chula vista” beats plain “la”
     for alias, canonical in sorted(
@@ -68,8 +71,8 @@ def normalize_location(location_text: str) -> Optional[str]:
         reverse=True
     ):
         if alias in location_lower:
-            print(f"DEBUG: normalize_location MATCHED '{alias}' → '{canonical}'")
+            logger.debug("normalize_location MATCHED '%s' → '%s'", alias, canonical)
             return canonical
 
-    print(f"DEBUG: normalize_location found NO MATCH for '{location_lower}'")
+    logger.debug("normalize_location found NO MATCH for '%s'", location_lower)
     return None
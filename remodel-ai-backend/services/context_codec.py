@@ -0,0 +1,129 @@
+# services/context_codec.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+Wire format for persisted session state (see SessionState in
+context_manager.py).
+
+Payloads are self-describing so any worker can read what any other worker
+wrote, whatever CONTEXT_CODEC each one runs with:
+
+    {...}                       legacy / "json" – plain UTF-8 JSON
+    0xC1 0x01 <msgpack>         "msgpack"
+    0xC1 0x02 <zstd frame>      "msgpack+zstd" (optionally with a trained
+                                dictionary, CONTEXT_ZSTD_DICT)
+
+0xC1 is the one byte msgpack never emits and JSON never starts with.
+
+Every stored record carries ``"_v"`` (SCHEMA_VERSION).  Readers upgrade
+older payloads through ``_MIGRATIONS`` and read the fields they know from
+newer ones, so a rolling deploy can add fields without breaking old workers.
+"""
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 2
+VERSION_FIELD = "_v"
+
+_MAGIC = 0xC1
+_MSGPACK = 0x01
+_MSGPACK_ZSTD = 0x02
+
+# version -> function upgrading a payload from that version to the next
+_MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    0: lambda data: data,  # unversioned JSON written before the codec existed
+    # v1 stored the bare ConversationContext; v2 is the consolidated session
+    # record, with context attributes under a "context." prefix
+    1: lambda data: {f"context.{k}": v for k, v in data.items()},
+}
+
+
+def upgrade(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Bring a decoded payload up to SCHEMA_VERSION (drops the version tag)."""
+    version = data.pop(VERSION_FIELD, 0)
+    if version > SCHEMA_VERSION:
+        logger.debug("Context schema v%s is newer than v%s; reading known fields",
+                     version, SCHEMA_VERSION)
+        return data
+    while version < SCHEMA_VERSION:
+        data = _MIGRATIONS[version](data)
+        version += 1
+    return data
+
+
+class ContextCodec:
+    """Encode/decode context payloads (whole blobs or single hash fields)."""
+
+    def __init__(self, fmt: str = "msgpack", zstd_dict_path: Optional[str] = None):
+        fmt = fmt.lower()
+        self._msgpack = None
+        self._compressor = self._decompressor = None
+
+        if fmt in ("msgpack", "msgpack+zstd"):
+            try:
+                import msgpack
+                self._msgpack = msgpack
+            except ImportError:
+                logger.warning("msgpack not installed; storing contexts as JSON")
+                fmt = "json"
+
+        if fmt == "msgpack+zstd":
+            try:
+                import zstandard
+                zdict = None
+                if zstd_dict_path:
+                    with open(zstd_dict_path, "rb") as f:
+                        zdict = zstandard.ZstdCompressionDict(f.read())
+                self._compressor = zstandard.ZstdCompressor(level=3, dict_data=zdict)
+                self._decompressor = zstandard.ZstdDecompressor(dict_data=zdict)
+            except Exception as e:
+                logger.warning("zstd unavailable (%s); storing contexts as plain msgpack", e)
+                fmt = "msgpack"
+
+        self.format = fmt
+
+    # ─── single values (hash fields and whole blobs) ──────────────────────
+    def encode_value(self, value: Any, compress: bool = False) -> bytes:
+        if self.format == "json":
+            return json.dumps(value, separators=(",", ":")).encode()
+        body = self._msgpack.packb(value, use_bin_type=True)
+        if compress and self._compressor is not None:
+            return bytes((_MAGIC, _MSGPACK_ZSTD)) + self._compressor.compress(body)
+        return bytes((_MAGIC, _MSGPACK)) + body
+
+    def decode_value(self, raw: bytes) -> Any:
+        if not raw or raw[0] != _MAGIC:
+            return json.loads(raw)
+        kind, body = raw[1], raw[2:]
+        if kind == _MSGPACK_ZSTD:
+            if self._decompressor is None:
+                import zstandard  # written by a zstd worker; works unless a dictionary was used
+                self._decompressor = zstandard.ZstdDecompressor()
+            body = self._decompressor.decompress(body)
+        elif kind != _MSGPACK:
+            raise ValueError(f"unknown context encoding 0x{kind:02x}")
+        return self._msgpack_module().unpackb(body, raw=False)
+
+    def _msgpack_module(self):
+        if self._msgpack is None:
+            import msgpack  # reading a msgpack payload while configured for JSON
+            self._msgpack = msgpack
+        return self._msgpack
+
+    # ─── whole contexts ───────────────────────────────────────────────────
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        return self.encode_value({**data, VERSION_FIELD: SCHEMA_VERSION}, compress=True)
+
+    def decode(self, raw: bytes) -> Dict[str, Any]:
+        return upgrade(self.decode_value(raw))
+
+    def encode_fields(self, data: Dict[str, Any]) -> Dict[str, bytes]:
+        """One hash field per context attribute, plus the schema version."""
+        fields = {name: self.encode_value(value) for name, value in data.items()}
+        fields[VERSION_FIELD] = self.encode_value(SCHEMA_VERSION)
+        return fields
+
+    def decode_fields(self, fields: Dict[str, bytes]) -> Dict[str, Any]:
+        return upgrade({name: self.decode_value(raw) for name, raw in fields.items()})
@@ -1,12 +1,16 @@
-﻿from typing import Dict, Any, Optional, List
+﻿from typing import Dict, Any, Optional, List, AsyncIterator, Sequence, Union
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
-import json
-import redis
+import copy
 import logging
 import re
 
 from config import settings
 from services.city_mappings import normalize_location   # ⬅️ NEW
+from services.context_codec import ContextCodec
+from services.metrics import CONTEXT_IO_PER_REQUEST, observe_stage
+from services.state_backend import AppendItem, get_state_backend
 
 logger = logging.getLogger(__name__)
 
@@ -63,78 +67,298 @@ class ConversationContext:
         return self
 
 
+# ──────────────────────────────────────────────────────────────────────────────
+#  SessionState – the one persisted record per conversation
+# ──────────────────────────────────────────────────────────────────────────────
+class SessionState:
+    """
+    Everything a chat turn needs, stored as a single record: the extracted
+    context, LangChain's running summary plus the message tail it still
+    holds verbatim, and a version bumped on every save.  RAG memory and the
+    context helpers are views over this object; the full transcript for the
+    history API is a separate append-only log (see SessionService).
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.version = 0
+        self.summary = ""
+        self.tail: List[Dict[str, str]] = []   # [{"role": "user"|"assistant", "content": ...}]
+        self.context = ConversationContext()
+        self.context.session_id = session_id
+
+    def to_record(self) -> Dict[str, Any]:
+        """Flat record; context attributes are prefixed so delta mode can diff them."""
+        record: Dict[str, Any] = {
+            "version": self.version,
+            "summary": self.summary,
+            "tail":    self.tail,
+        }
+        for key, value in self.context.to_dict().items():
+            record[f"context.{key}"] = value
+        return record
+
+    @classmethod
+    def from_record(cls, session_id: str, record: Dict[str, Any]) -> "SessionState":
+        state = cls(session_id)
+        state.version = record.get("version", 0)
+        state.summary = record.get("summary", "")
+        state.tail = record.get("tail", [])
+        context = {k[len("context."):]: v for k, v in record.items() if k.startswith("context.")}
+        if context:
+            state.context.from_dict(context)
+            state.context.session_id = session_id
+        return state
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+#  Per-request unit of work
+#
+#  One chat turn touches the session from half a dozen places (prompt
+#  building, memory, validation passes, the post-answer update).  While a
+#  unit of work is active they all share one SessionState, and
+#  ``save_context`` is deferred, so the turn does one load and one save.
+# ──────────────────────────────────────────────────────────────────────────────
+_UNLOADED = object()
+_STATE_NAMESPACE = "session_state"
+_DELTA_NAMESPACE = "session_state_fields"   # per-field hash used when CONTEXT_DELTA=true
+# Where contexts lived before the consolidated record (blob: unversioned JSON
+# or codec v1; delta: codec v1 fields).  Read only when a session has no
+# current record; the codec migrates them and the next save writes the new one.
+_LEGACY_NAMESPACE = "context"
+_LEGACY_DELTA_NAMESPACE = "context_fields"
+_VOLATILE = ("version", "context.last_updated")   # rewritten on every save, never "dirty"
+_active_uow: ContextVar[Optional["ContextUnitOfWork"]] = ContextVar(
+    "context_unit_of_work", default=None
+)
+
+
+class ContextUnitOfWork:
+    """A session's state for the duration of one request: loaded once, flushed once."""
+
+    def __init__(self, manager: "ContextManager", session_id: str):
+        self.manager = manager
+        self.session_id = session_id
+        self.state: Optional[SessionState] = None
+        self.loads = 0
+        self.saves = 0
+        self._snapshot: Dict[str, Any] = {}
+
+    @property
+    def context(self) -> ConversationContext:
+        return self.state.context
+
+    @context.setter
+    def context(self, context: ConversationContext) -> None:
+        self.state.context = context
+
+    @staticmethod
+    def _record(state: SessionState) -> Dict[str, Any]:
+        record = state.to_record()
+        for key in _VOLATILE:
+            record.pop(key)
+        return copy.deepcopy(record)
+
+    def attach(self, raw: Union[bytes, Dict[str, bytes], None]) -> SessionState:
+        """Adopt a payload the caller already read."""
+        self.state = self.manager.parse_state(self.session_id, raw)
+        self._snapshot = self._record(self.state)
+        self.loads += 1
+        return self.state
+
+    async def load(self) -> SessionState:
+        if self.state is None:
+            with observe_stage("context_load"):
+                raw = await self.manager.fetch(self.session_id)
+            self.attach(raw)
+        return self.state
+
+    def dirty_fields(self) -> List[str]:
+        """Record fields changed since the state was loaded (or last flushed)."""
+        if self.state is None:
+            return []
+        current = self.state.to_record()
+        return [k for k, v in self._snapshot.items() if current.get(k) != v]
+
+    def mark_saved(self) -> None:
+        self._snapshot = self._record(self.state)
+        self.saves += 1
+
+    async def flush(self, appends: Sequence[AppendItem] = ()) -> None:
+        """
+        Write the record back if (and only if) something changed, together
+        with any *appends* (e.g. the transcript log) in the same operation.
+        """
+        dirty = self.dirty_fields()
+        if not dirty and not appends:
+            return
+        if await self.manager.store(self.state, dirty, appends) and dirty:
+            self.mark_saved()
+
+    def report(self) -> None:
+        CONTEXT_IO_PER_REQUEST.labels("load").observe(self.loads)
+        CONTEXT_IO_PER_REQUEST.labels("save").observe(self.saves)
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 #  ContextManager
 # ──────────────────────────────────────────────────────────────────────────────
 class ContextManager:
-    """Handles persistence of conversation context (Redis w/ memory fallback)."""
+    """Handles persistence of session state via the shared state backend."""
 
     def __init__(self):
-        try:
-            self.redis_client = settings.get_redis_connection()
-            if self.redis_client:
-                self.redis_client.ping()
-                logger.info("Redis connection established")
-                print("DEBUG: ContextManager – Redis connection established")
-        except Exception as e:
-            logger.error(f"Redis connection failed: {e}")
-            print(f"DEBUG: ContextManager – Redis connection failed: {e}")
-            self.redis_client = None
-
-        # In-memory fallback store
-        self.memory_store: Dict[str, Dict[str, Any]] = {}
-
-    # ─── load / save helpers ──────────────────────────────────────────────
-    def get_or_create_context(self, session_id: str) -> ConversationContext:
-        print(f"DEBUG: Getting context for session {session_id}")
-        ctx = ConversationContext()
-        ctx.session_id = session_id
-
-        if self.redis_client:
+        # Redis, embedded SQLite or per-process memory – see state_backend.py
+        self.backend = get_state_backend()
+        # msgpack (+zstd) or JSON blobs; optionally one hash field per attribute
+        self.codec = ContextCodec(settings.context_codec, settings.context_zstd_dict)
+        self.delta = settings.context_delta
+
+    # ─── (de)serialisation ────────────────────────────────────────────────
+    def parse_state(
+        self, session_id: str, raw: Union[bytes, Dict[str, bytes], None]
+    ) -> SessionState:
+        """
+        Build session state from a stored payload – a whole-record blob or a
+        field map (delta mode).  Fresh state if *raw* is empty.
+        """
+        if raw:
             try:
-                raw = self.redis_client.get(f"context:{session_id}")
-                if raw:
-                    ctx.from_dict(json.loads(raw))
-                    print(f"DEBUG: Loaded context from Redis for {session_id}")
+                record = (
+                    self.codec.decode_fields(raw) if isinstance(raw, dict)
+                    else self.codec.decode(raw)
+                )
+                return SessionState.from_record(session_id, record)
             except Exception as ex:
-                print(f"DEBUG: Redis read error: {ex}")
-        else:
-            if session_id in self.memory_store:
-                ctx.from_dict(self.memory_store[session_id])
-                print(f"DEBUG: Loaded context from memory for {session_id}")
+                logger.warning("Session state decode error for %s: %s", session_id, ex)
+        return SessionState(session_id)
 
-        return ctx
+    def serialize_state(self, state: SessionState) -> bytes:
+        payload = self.codec.encode(state.to_record())
+        logger.debug("Session state for %s encoded as %s (%s bytes)",
+                     state.session_id, self.codec.format, len(payload))
+        return payload
 
-    def save_context(self, session_id: str, context: ConversationContext):
-        context.last_updated = datetime.now()
-        data = context.to_dict()
-        print(f"DEBUG: Saving context for {session_id}")
-        print(f"DEBUG: Context data to save: {data}")
-
-        if self.redis_client:
-            try:
-                self.redis_client.setex(
-                    f"context:{session_id}",
-                    settings.session_ttl,
-                    json.dumps(data),
+    # ─── raw store access (blob or per-field hash) ────────────────────────
+    async def fetch(self, session_id: str) -> Union[bytes, Dict[str, bytes], None]:
+        try:
+            if self.delta:
+                raw = await self.backend.get_fields(_DELTA_NAMESPACE, session_id)
+                if not raw:
+                    raw = await self.backend.get_fields(_LEGACY_DELTA_NAMESPACE, session_id)
+                return raw or await self.backend.get(_LEGACY_NAMESPACE, session_id)
+            # the legacy blob rides along in the same read
+            raw, legacy = await self.backend.get_many(
+                [(_STATE_NAMESPACE, session_id), (_LEGACY_NAMESPACE, session_id)])
+            return raw or legacy
+        except Exception as ex:
+            logger.warning("Session state read error: %s", ex)
+            return None
+
+    async def store(
+        self,
+        state: SessionState,
+        fields: Optional[List[str]] = None,
+        appends: Sequence[AppendItem] = (),
+    ) -> bool:
+        """
+        Persist *state* and any *appends* as one backend operation.  In delta
+        mode only *fields* (default: all) are written, plus the version and
+        timestamp; an empty *fields* list writes just the appends.
+        """
+        write_record = fields != []
+        if write_record:
+            state.version += 1
+            state.context.last_updated = datetime.now()
+        try:
+            if not write_record:
+                await self.backend.write_batch(appends=appends)
+            elif self.delta:
+                record = state.to_record()
+                if fields is not None:
+                    record = {k: record[k] for k in [*fields, *_VOLATILE]}
+                await self.backend.write_batch(
+                    fields=[(_DELTA_NAMESPACE, state.session_id,
+                             self.codec.encode_fields(record), settings.session_ttl)],
+                    appends=appends,
                 )
-                print(f"DEBUG: Successfully saved context to Redis for {session_id}")
-            except Exception as ex:
-                print(f"DEBUG: Redis write error: {ex}")
-                self.memory_store[session_id] = data
-        else:
-            self.memory_store[session_id] = data
-            print(f"DEBUG: Saved context to in-memory store for {session_id}")
+            else:
+                await self.backend.write_batch(
+                    items=[(_STATE_NAMESPACE, state.session_id,
+                            self.serialize_state(state), settings.session_ttl)],
+                    appends=appends,
+                )
+        except Exception as ex:
+            logger.warning("Session state write error: %s", ex)
+            if write_record:
+                state.version -= 1
+            return False
+        logger.debug("Saved session state v%s to %s for %s",
+                     state.version, self.backend.name, state.session_id)
+        return True
+
+    # ─── unit of work ─────────────────────────────────────────────────────
+    @asynccontextmanager
+    async def unit_of_work(self, session_id: str) -> AsyncIterator[ContextUnitOfWork]:
+        """
+        Scope one request's session-state access: loaded here, dirty fields
+        flushed on a clean exit.  Nested calls for the same session reuse
+        the outer unit of work and leave flushing to it.
+        """
+        outer = _active_uow.get()
+        if outer is not None and outer.session_id == session_id:
+            yield outer
+            return
+
+        uow = ContextUnitOfWork(self, session_id)
+        await uow.load()
+        token = _active_uow.set(uow)
+        try:
+            yield uow
+            if uow.dirty_fields():
+                with observe_stage("context_save"):
+                    await uow.flush()
+        finally:
+            _active_uow.reset(token)
+            uow.report()
+
+    # ─── load / save helpers ──────────────────────────────────────────────
+    async def get_state(self, session_id: str) -> SessionState:
+        uow = _active_uow.get()
+        if uow is not None and uow.session_id == session_id:
+            return await uow.load()
+
+        logger.debug("Getting session state for %s", session_id)
+        if uow is not None:
+            uow.loads += 1
+        with observe_stage("context_load"):
+            raw = await self.fetch(session_id)
+        return self.parse_state(session_id, raw)
+
+    async def get_or_create_context(self, session_id: str) -> ConversationContext:
+        return (await self.get_state(session_id)).context
+
+    async def save_context(self, session_id: str, context: ConversationContext):
+        uow = _active_uow.get()
+        if uow is not None and uow.session_id == session_id:
+            uow.context = context  # flushed once when the unit of work ends
+            return
+
+        # Outside a request scope: read-modify-write the record
+        logger.debug("Saving context for %s", session_id)
+        if uow is not None:
+            uow.saves += 1
+        async with self.unit_of_work(session_id) as own:
+            own.context = context
 
     # ─── main update after each Q/A turn ──────────────────────────────────
-    def update_context_from_exchange(
+    async def update_context_from_exchange(
         self, session_id: str, query: str, response: str
     ) -> ConversationContext:
-        print(f"DEBUG: Updating context from exchange for {session_id}")
-        print(f"DEBUG: Query: {query[:80]} ...")
-        print(f"DEBUG: Response: {response[:80]} ...")
+        logger.debug("Updating context from exchange for %s", session_id)
+        logger.debug("Query: %.80s ...", query)
+        logger.debug("Response: %.80s ...", response)
 
-        context = self.get_or_create_context(session_id)
+        context = await self.get_or_create_context(session_id)
         q_lower = query.lower()
         r_lower = response.lower()
 
@@ -147,29 +371,29 @@ class ContextManager:
         mapped_q = normalize_location(query)
         if mapped_q:
             new_location = mapped_q
-            print(f"DEBUG: normalize_location matched '{mapped_q}' from user query")
+            logger.debug("normalize_location matched '%s' from user query", mapped_q)
 
         # 2️⃣  If nothing yet, try direct substrings for quick hits
         if not new_location:
             if "san diego" in q_lower:
                 new_location = "San Diego"
-                print("DEBUG: User explicitly mentioned San Diego")
+                logger.debug("User explicitly mentioned San Diego")
             elif "los angeles" in q_lower or (" la " in q_lower and "los angeles" not in q_lower):
                 new_location = "Los Angeles"
-                print("DEBUG: User explicitly mentioned Los Angeles")
+                logger.debug("User explicitly mentioned Los Angeles")
 
         # 3️⃣  If still unset and we have no stored location, inspect assistant response
         if not new_location and not context.location:
             mapped_r = normalize_location(response)
             if mapped_r:
                 new_location = mapped_r
-                print(f"DEBUG: normalize_location matched '{mapped_r}' from assistant response")
+                logger.debug("normalize_location matched '%s' from assistant response", mapped_r)
             elif "san diego" in r_lower:
                 new_location = "San Diego"
-                print("DEBUG: Assistant mentioned San Diego (initial setting)")
+                logger.debug("Assistant mentioned San Diego (initial setting)")
             elif "los angeles" in r_lower:
                 new_location = "Los Angeles"
-                print("DEBUG: Assistant mentioned Los Angeles (initial setting)")
+                logger.debug("Assistant mentioned Los Angeles (initial setting)")
 
         # 4️⃣  Apply switch / initial-set logic
         if new_location and context.location:
@@ -177,13 +401,13 @@ class ContextManager:
                 kw in q_lower for kw in ["instead", "switch", "what about", "how about", "change to", "not in"]
             )
             if switch_intent and new_location != context.location:
-                print(f"DEBUG: Switching location from {context.location} → {new_location}")
+                logger.debug("Switching location from %s → %s", context.location, new_location)
                 context.location = new_location
             else:
-                print(f"DEBUG: Ignoring '{new_location}'; no explicit switch intent")
+                logger.debug("Ignoring '%s'; no explicit switch intent", new_location)
         elif new_location and not context.location:
             context.location = new_location
-            print(f"DEBUG: Setting initial location to {new_location}")
+            logger.debug("Setting initial location to %s", new_location)
 
         # ------------------------------------------------------------------
         #  PROJECT-TYPE DETECTION
@@ -198,7 +422,7 @@ class ContextManager:
         for ptype, words in project_map.items():
             if any(w in q_lower or w in r_lower for w in words):
                 context.project_type = ptype
-                print(f"DEBUG: Found project type: {ptype}")
+                logger.debug("Found project type: %s", ptype)
                 break
 
         # ------------------------------------------------------------------
@@ -221,9 +445,9 @@ class ContextManager:
             context.discussed_prices[context.project_type] = filtered_prices
             nums = [int(p.replace(",", "")) for p in filtered_prices]
             context.budget_range = {"min": min(nums), "max": max(nums)}
-            print(f"DEBUG: Updated budget range: {context.budget_range}")
+            logger.debug("Updated budget range: %s", context.budget_range)
         elif not filtered_prices:
-            print("DEBUG: No valid prices ≥ $1,000 found; budget unchanged")
+            logger.debug("No valid prices ≥ $1,000 found; budget unchanged")
 
         # ------------------------------------------------------------------
         #  TIMELINE DETECTION  (simple heuristic)
@@ -231,7 +455,7 @@ class ContextManager:
         tl_match = re.search(r"(\d+)\s*(?:to|-)\s*(\d+)\s*weeks?", r_lower)
         if tl_match:
             context.timeline = f"{tl_match.group(1)}-{tl_match.group(2)} weeks"
-            print(f"DEBUG: Timeline set to {context.timeline}")
+            logger.debug("Timeline set to %s", context.timeline)
 
         # ------------------------------------------------------------------
         #  FEATURE KEYWORDS
@@ -241,7 +465,7 @@ class ContextManager:
             if feat in q_lower or feat in r_lower:
                 if feat not in context.specific_features:
                     context.specific_features.append(feat)
-                    print(f"DEBUG: Added feature '{feat}'")
+                    logger.debug("Added feature '%s'", feat)
 
         # ------------------------------------------------------------------
         #  CONVERSATION SUMMARY
@@ -254,10 +478,10 @@ class ContextManager:
                 f"Timeline: {context.timeline or 'Not discussed'}. "
                 f"Features: {', '.join(context.specific_features) or 'None specified'}"
             )
-            print(f"DEBUG: Updated summary: {context.conversation_summary}")
+            logger.debug("Updated summary: %s", context.conversation_summary)
 
         context.turn_count += 1
-        self.save_context(session_id, context)
+        await self.save_context(session_id, context)
         return context
 
     # ──────────────────────────────────────────────────────────────────────
@@ -313,15 +537,15 @@ class ContextManager:
 
         if parts:
             prompt = "Context: " + ". ".join(parts) + "."
-            print(f"DEBUG: Generated context prompt: {prompt}")
+            logger.debug("Generated context prompt: %s", prompt)
             return prompt
         return ""
 
     # ──────────────────────────────────────────────────────────────────────
     #  System prompt for the LLM
     # ──────────────────────────────────────────────────────────────────────
-    def get_system_prompt(self, session_id: str) -> str:
-        ctx = self.get_or_create_context(session_id)
+    async def get_system_prompt(self, session_id: str) -> str:
+        ctx = await self.get_or_create_context(session_id)
 
         base_prompt = (
             "You are an expert construction cost estimator for RemodelAI, specializing in "
@@ -346,8 +570,5 @@ class ContextManager:
         else:
             system_prompt = base_prompt
 
-        print("DEBUG: Generated system prompt:")
-        print("DEBUG: ----------------------")
-        print(f"DEBUG: {system_prompt[:500]}...")
-        print("DEBUG: ----------------------")
+        logger.debug("Generated system prompt: %.500s...", system_prompt)
         return system_prompt
@@ -0,0 +1,294 @@
+# services/estimate_engine.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+Data-driven cost estimates from the cleaned project dataset.
+
+The dataset (``cleaned_data_all.csv``) lists published low/high cost ranges
+and typical durations per location and remodel type; it has no square-footage
+column.  Each range is therefore normalised to cost per square foot against
+the footprint such figures usually describe (``REFERENCE_SQFT``) and scaled
+back up to the requested size.
+
+Everything is precomputed once with NumPy into per-(city, project type)
+statistics; ``EstimateEngine.estimate`` is a dict lookup plus arithmetic.
+Lookups fall back from the exact city to both supported cities and then to
+every location for the project type, with lower confidence at each step.
+"""
+import csv
+import logging
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+from services.city_mappings import normalize_location
+
+logger = logging.getLogger(__name__)
+
+# Footprint (sq ft) a published whole-project range typically assumes
+REFERENCE_SQFT: Dict[str, float] = {
+    "kitchen_remodel": 200,
+    "bathroom_remodel": 75,
+    "room_addition": 400,
+    "whole_house_remodel": 2000,
+    "accessory_dwelling_unit": 600,
+    "landscaping": 1000,
+    "pool_installation": 450,
+    "garage_conversion": 400,
+    "roofing": 2000,
+    "flooring": 500,
+}
+# Rough California cost per sq ft, used only when the dataset has no
+# statistics for a project type (or is missing): keeps such estimates
+# proportional to size rather than one flat figure
+DEFAULT_COST_PER_SQFT: Dict[str, float] = {
+    "kitchen_remodel": 300,
+    "bathroom_remodel": 400,
+    "room_addition": 350,
+    "whole_house_remodel": 150,
+    "accessory_dwelling_unit": 350,
+    "landscaping": 20,
+    "pool_installation": 150,
+    "garage_conversion": 200,
+    "roofing": 10,
+    "flooring": 12,
+}
+# Same keyword mapping as remodel-ai-data/scripts/clean_data.py, so raw and
+# cleaned CSVs both resolve to ProjectType values
+_TYPE_KEYWORDS = [
+    ("kitchen", "kitchen_remodel"), ("bathroom", "bathroom_remodel"), ("bath", "bathroom_remodel"),
+    ("addition", "room_addition"), ("whole house", "whole_house_remodel"),
+    ("complete", "whole_house_remodel"), ("accessory dwelling", "accessory_dwelling_unit"),
+    ("adu", "accessory_dwelling_unit"), ("landscap", "landscaping"), ("pool", "pool_installation"),
+    ("garage", "garage_conversion"), ("roof", "roofing"), ("floor", "flooring"),
+]
+_DURATION = re.compile(
+    r"(\d+(?:\.\d+)?)(?:\s*(?:-|–|to)\s*(\d+(?:\.\d+)?))?\s*(day|week|month|year)", re.I
+)
+_DAYS_PER = {"day": 1, "week": 7, "month": 30, "year": 365}
+
+CITIES = ("San Diego", "Los Angeles")
+MIN_SAMPLES = 3
+LEVEL_CONFIDENCE = (1.0, 0.85, 0.7)   # exact city, both cities, any location
+
+
+@dataclass(frozen=True)
+class CostStats:
+    """Precomputed distribution for one (city, project type) group."""
+    n: int
+    low_per_sqft: float
+    mid_per_sqft: float
+    high_per_sqft: float
+    p10_per_sqft: float
+    p90_per_sqft: float
+    construction_days: int
+    examples: Tuple[Tuple[str, str, float, float, str, str], ...]  # type, location, low, high, timeline, source
+
+
+@dataclass(frozen=True)
+class CostEstimate:
+    total: float
+    low: float
+    high: float
+    confidence: float
+    construction_days: int
+    samples: int
+    basis: str
+    similar: Tuple[Tuple[str, str, float, float, str, str], ...]
+
+
+def project_type_of(text: str) -> Optional[str]:
+    text = text.lower()
+    if text in REFERENCE_SQFT:
+        return text
+    for keyword, project_type in _TYPE_KEYWORDS:
+        if keyword in text:
+            return project_type
+    return None
+
+
+def duration_days(text: str) -> float:
+    """"6-8 weeks" → 49.0; NaN when the text has no recognisable duration."""
+    match = _DURATION.search(text or "")
+    if not match:
+        return math.nan
+    low = float(match.group(1))
+    high = float(match.group(2) or low)
+    return (low + high) / 2 * _DAYS_PER[match.group(3).lower()]
+
+
+class EstimateEngine:
+    """Cost-per-sqft and timeline statistics per (city, project type)."""
+
+    def __init__(self, rows: List[Dict[str, str]], source: Optional[str] = None):
+        self.stats: Dict[Tuple[str, str], CostStats] = {}
+        self.source = source
+        self.rows = len(rows)
+        self._build(rows)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "EstimateEngine":
+        if not os.path.exists(path):
+            logger.error(
+                "Estimate dataset %s not found (generate it with remodel-ai-data/scripts/"
+                "clean_data.py and point ESTIMATE_DATA_PATH at it); every estimate will "
+                "use the per-sq-ft defaults", path,
+            )
+            return cls([], source=path)
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        logger.info("Estimate engine: loaded %s rows from %s", len(rows), path)
+        return cls(rows, source=path)
+
+    def status(self) -> Dict[str, object]:
+        """Dataset summary for the health endpoint; ``loaded`` is False without statistics."""
+        return {
+            "path": self.source,
+            "loaded": bool(self.stats),
+            "rows": self.rows,
+            "project_types": len({project_type for _, project_type in self.stats}),
+        }
+
+    def _build(self, rows: List[Dict[str, str]]) -> None:
+        parsed = []
+        for row in rows:
+            project_type = project_type_of(row.get("Remodel Type", ""))
+            try:
+                low = float(row.get("Average Cost (Low)") or "nan")
+                high = float(row.get("Average Cost (High)") or "nan")
+            except ValueError:
+                continue
+            if project_type is None or not (low > 0 and high >= low):
+                continue
+            location = row.get("Location", "")
+            parsed.append((
+                normalize_location(location) or "", project_type, low, high,
+                duration_days(row.get("Average Time (weeks/other unit)", "")),
+                location, row.get("Average Time (weeks/other unit)", ""), row.get("Source URL", ""),
+            ))
+        if not parsed:
+            return
+
+        city = np.array([p[0] for p in parsed])
+        ptype = np.array([p[1] for p in parsed])
+        ref = np.array([REFERENCE_SQFT[t] for t in ptype], dtype=float)
+        low = np.array([p[2] for p in parsed]) / ref
+        high = np.array([p[3] for p in parsed]) / ref
+        mid = (low + high) / 2
+        days = np.array([p[4] for p in parsed])
+
+        def group(mask: np.ndarray) -> Optional[CostStats]:
+            if mask.sum() < MIN_SAMPLES:
+                return None
+            p10, p50, p90 = np.percentile(mid[mask], [10, 50, 90])
+            d = days[mask]
+            d = d[~np.isnan(d)]
+            idx = np.flatnonzero(mask)
+            # Examples nearest the median first
+            idx = idx[np.argsort(np.abs(mid[idx] - p50))][:3]
+            return CostStats(
+                n=int(mask.sum()),
+                low_per_sqft=float(np.median(low[mask])),
+                mid_per_sqft=float(p50),
+                high_per_sqft=float(np.median(high[mask])),
+                p10_per_sqft=float(p10),
+                p90_per_sqft=float(p90),
+                construction_days=int(round(np.median(d))) if d.size else 60,
+                examples=tuple((parsed[i][1], parsed[i][5], parsed[i][2], parsed[i][3],
+                                parsed[i][6], parsed[i][7]) for i in idx),
+            )
+
+        in_ca = np.isin(city, CITIES)
+        for project_type in map(str, np.unique(ptype)):
+            of_type = ptype == project_type
+            for name in CITIES:
+                self._put((name, project_type), group(of_type & (city == name)))
+            self._put(("CA", project_type), group(of_type & in_ca))
+            self._put(("*", project_type), group(of_type))
+
+    def _put(self, key: Tuple[str, str], stats: Optional[CostStats]) -> None:
+        if stats is not None:
+            self.stats[key] = stats
+
+    def _resolve(self, city: str, project_type: str) -> Optional[Tuple[CostStats, float, str]]:
+        """Best-matching stats for a (city, type), with its confidence and basis label."""
+        for level, (scope, basis) in enumerate(((city, city), ("CA", "San Diego + Los Angeles"),
+                                                ("*", "all locations"))):
+            stats = self.stats.get((scope, project_type))
+            if stats is not None:
+                break
+        else:
+            return None
+        spread = (stats.p90_per_sqft - stats.p10_per_sqft) / stats.mid_per_sqft
+        confidence = (0.5 + 0.45 * (1 - math.exp(-stats.n / 8))) * LEVEL_CONFIDENCE[level]
+        confidence *= 1 - min(0.3, spread / 10)
+        return stats, round(min(0.95, confidence), 2), basis
+
+    def estimate(self, city: str, project_type: str, square_footage: float) -> Optional[CostEstimate]:
+        """Scale the best-matching distribution to *square_footage*; None without data."""
+        return self.estimate_many([city], [project_type], [square_footage])[0]
+
+    def estimate_many(
+        self,
+        cities: Sequence[str],
+        project_types: Sequence[str],
+        square_footage: Sequence[float],
+    ) -> List[Optional[CostEstimate]]:
+        """
+        Vectorised ``estimate`` over a batch: each distinct (city, type) is
+        resolved once, then costs for every project are one array multiply.
+        """
+        keys = list(zip(cities, project_types))
+        resolved = {key: self._resolve(*key) for key in dict.fromkeys(keys)}
+        groups = list(resolved)
+        position = {key: i for i, key in enumerate(groups)}
+        idx = np.fromiter((position[key] for key in keys), dtype=np.intp, count=len(keys))
+        per_sqft = np.array([
+            (r[0].low_per_sqft, r[0].mid_per_sqft, r[0].high_per_sqft) if r else (np.nan,) * 3
+            for r in resolved.values()
+        ], dtype=float).reshape(len(groups), 3)
+        costs = per_sqft[idx] * np.asarray(square_footage, dtype=float)[:, None]
+
+        results: List[Optional[CostEstimate]] = []
+        for key, (low, total, high) in zip(keys, costs.tolist()):
+            match = resolved[key]
+            if match is None:
+                results.append(None)
+                continue
+            stats, confidence, basis = match
+            results.append(CostEstimate(
+                total=total,
+                low=low,
+                high=high,
+                confidence=confidence,
+                construction_days=stats.construction_days,
+                samples=stats.n,
+                basis=basis,
+                similar=stats.examples,
+            ))
+        return results
+
+
+_engine: Optional[EstimateEngine] = None
+_engine_lock = threading.Lock()
+
+
+def estimate_data_status() -> Optional[Dict[str, object]]:
+    """The engine's dataset status, or None while it is still being built."""
+    engine = _engine
+    return engine.status() if engine is not None else None
+
+
+def get_estimate_engine() -> EstimateEngine:
+    """Process-wide engine, built from ``settings.estimate_data_path`` on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = EstimateEngine.from_csv(settings.estimate_data_path)
+    return _engine
@@ -1,126 +1,376 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from schemas import ProjectDetails, EstimateResponse, CostBreakdown, TimelineBreakdown, SimilarProject
-from services.rag_service import RAGService
-from services.material_price_service import MaterialPriceService
-from config import estimates_cache
+from config import settings
+from services.estimate_engine import DEFAULT_COST_PER_SQFT, get_estimate_engine
+from services.material_price_service import get_material_price_service
+from services.estimate_store import get_estimate_store
+from services.metrics import record_cache
+import asyncio
+import hashlib
+import json
+import time
 import uuid
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+BATCH_CHUNK = 500                  # projects computed (and streamed) per step
+MEMO_NAMESPACE = "estimate_memo"   # canonical project hash -> computed figures
+IDEMPOTENCY_NAMESPACE = "estimate_idempotency"  # Idempotency-Key -> estimate_id
+# An Idempotency-Key is claimed (set-if-absent, shared by every worker)
+# before the estimate is generated and renewed every third of this TTL
+# while generation runs, so it only lapses this many seconds after its
+# worker dies; concurrent retries wait on it that long before a 409
+IDEMPOTENCY_CLAIM_TTL = 60
+IDEMPOTENCY_POLL = 0.05
+COST_FIELDS = ("total_cost", "cost_range_low", "cost_range_high")  # proportional to square footage
+
+
+class IdempotencyConflict(ValueError):
+    """An Idempotency-Key was reused with a different request."""
+
+
+class IdempotencyInProgress(IdempotencyConflict):
+    """The first request under an Idempotency-Key has not finished yet."""
+
+
+def canonical_project(project_details: ProjectDetails) -> Dict[str, Any]:
+    """
+    Memo key for a project: canonical city (already normalised by the
+    schema), square footage rounded to ``estimate_memo_sqft_step`` and free
+    text trimmed, whitespace-collapsed and lower-cased.  Only a key – the
+    figures are always priced at the real square footage.
+    """
+    step = settings.estimate_memo_sqft_step
+    square_footage = project_details.square_footage
+    if step > 0:
+        square_footage = round(square_footage / step) * step
+    return {
+        "project_type": project_details.project_type.value,
+        "property_type": project_details.property_type,
+        "city": project_details.city,
+        "state": project_details.state,
+        "square_footage": square_footage,
+        "address": " ".join((project_details.address or "").split()).lower(),
+        "additional_details": " ".join((project_details.additional_details or "").split()).lower(),
+    }
+
+
+def _fingerprint(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def _rescaled(estimate_data: Dict[str, Any], factor: float) -> Dict[str, Any]:
+    """Figures computed for one square footage, scaled to another (factor = new / old)."""
+    if factor == 1:
+        return estimate_data
+    return {**estimate_data, **{field: estimate_data[field] * factor for field in COST_FIELDS}}
+
 class EstimateService:
     def __init__(self):
-        self.rag_service = RAGService()
-        self.material_service = MaterialPriceService()
+        self.engine = get_estimate_engine()
+        self.material_service = get_material_price_service()
+        self.store = get_estimate_store()
+        self._rag_service = None
+    
+    @property
+    def rag_service(self):
+        """The RAG stack is only needed for the optional narrative – build it on first use."""
+        if self._rag_service is None:
+            from services.rag_service import RAGService
+            self._rag_service = RAGService()
+        return self._rag_service
     
     async def generate_estimate(self, project_details: ProjectDetails, session_id: Optional[str] = None) -> EstimateResponse:
         """Generate a detailed cost estimate"""
+        return (await self._generate(project_details, session_id))[0]
+    
+    async def generate_idempotent(
+        self, idempotency_key: str, project_details: ProjectDetails, session_id: Optional[str] = None
+    ) -> Tuple[bytes, bool]:
+        """
+        (estimate JSON, replayed): a retry carrying the same Idempotency-Key
+        gets the original estimate back instead of a new one.  Reusing a key
+        for a different request raises IdempotencyConflict.
+        """
+        backend = self.store.backend
+        slot = hashlib.sha256(idempotency_key.encode()).hexdigest()
+        request = _fingerprint({"project": project_details.model_dump(mode="json"), "session_id": session_id})
+        claim = json.dumps({"request": request, "estimate_id": None}).encode()
+        deadline = time.monotonic() + IDEMPOTENCY_CLAIM_TTL
+        # Atomic claim in the shared backend: exactly one worker generates
+        while not await backend.add(IDEMPOTENCY_NAMESPACE, slot, claim, ttl=IDEMPOTENCY_CLAIM_TTL):
+            raw = await backend.get(IDEMPOTENCY_NAMESPACE, slot)
+            if raw is None:
+                continue  # released or expired meanwhile – claim again
+            record = json.loads(raw)
+            if record["request"] != request:
+                raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+            if record["estimate_id"] is not None:
+                stored = await self.store.get(record["estimate_id"])
+                if stored:
+                    record_cache("estimate_idempotency", True)
+                    return stored[0], True
+                await backend.delete(IDEMPOTENCY_NAMESPACE, slot)  # estimate gone: start over
+                continue
+            if time.monotonic() >= deadline:
+                raise IdempotencyInProgress("A request with this Idempotency-Key is still being processed")
+            await asyncio.sleep(IDEMPOTENCY_POLL)
+        record_cache("estimate_idempotency", False)
+        done = asyncio.Event()
+        renewer = asyncio.create_task(self._renew_claim(slot, claim, done))
         try:
-            # Query RAG system for estimate
-            query = self._build_estimate_query(project_details)
-            
-            # Use get_chat_response instead of get_estimate
-            rag_response = await self.rag_service.get_chat_response(
-                query=query,
-                chat_history=[]
-            )
+            estimate, data = await self._generate(project_details, session_id)
+        except BaseException:
+            done.set()
+            await renewer
+            await backend.delete(IDEMPOTENCY_NAMESPACE, slot)  # let a retry run it again
+            raise
+        # the estimate is stored; stop renewing (letting a write in progress
+        # land first) before the claim is replaced by the result
+        done.set()
+        await renewer
+        await backend.set(
+            IDEMPOTENCY_NAMESPACE, slot,
+            json.dumps({"request": request, "estimate_id": estimate.estimate_id}).encode(),
+            ttl=settings.idempotency_ttl,
+        )
+        return data, False
+    
+    async def _renew_claim(self, slot: str, claim: bytes, done: asyncio.Event) -> None:
+        """Keep an Idempotency-Key claim alive until *done* – generation may outlast its TTL."""
+        while True:
+            try:
+                await asyncio.wait_for(done.wait(), IDEMPOTENCY_CLAIM_TTL / 3)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.store.backend.set(IDEMPOTENCY_NAMESPACE, slot, claim, ttl=IDEMPOTENCY_CLAIM_TTL)
+            except Exception as e:
+                logger.warning(f"Could not renew Idempotency-Key claim: {str(e)}")
+    
+    async def _generate(self, project_details: ProjectDetails, session_id: Optional[str]) -> Tuple[EstimateResponse, bytes]:
+        try:
+            # Numbers come from the dataset; the LLM (if enabled) only writes prose
+            estimate_data, narrative = await self._computed(project_details)
             
             # Get material prices
             common_materials = self.material_service.get_common_materials(project_details.project_type)
-            material_prices = self.material_service.get_material_prices(common_materials, project_details.city)
-            
-            # Parse RAG response and create estimate
-            estimate_data = self._parse_rag_response(rag_response)
-            
-            # Create estimate object
-            estimate_id = f"est_{uuid.uuid4().hex[:8]}"
-            
-            # Calculate cost breakdown
-            total_cost = estimate_data["total_cost"]
-            
-            # Adjust for LA pricing (+12%)
-            if project_details.city == "Los Angeles":
-                total_cost *= 1.12
-            
-            cost_breakdown = CostBreakdown(
-                materials=total_cost * 0.40,
-                labor=total_cost * 0.35,
-                permits=total_cost * 0.05,
-                other=total_cost * 0.20,
-                total=total_cost
-            )
-            
-            # Calculate timeline
-            timeline = TimelineBreakdown(
-                planning_days=14,
-                permit_days=estimate_data.get("permit_days", 30),
-                construction_days=estimate_data.get("construction_days", 60),
-                total_days=14 + estimate_data.get("permit_days", 30) + estimate_data.get("construction_days", 60)
-            )
+            material_prices = await self.material_service.get_material_prices(common_materials, project_details.city)
             
-            # Create similar projects
-            similar_projects = []
-            for sp in estimate_data.get("similar_projects", []):
-                similar_projects.append(SimilarProject(**sp))
+            metadata = {"basis": estimate_data["basis"], "samples": estimate_data["samples"],
+                        "material_prices": material_prices}
+            if session_id:
+                metadata["session_id"] = session_id
+            if settings.estimate_narrative:
+                metadata["narrative"] = narrative
             
-            # Create response
-            estimate = EstimateResponse(
-                estimate_id=estimate_id,
-                total_cost=total_cost,
-                cost_range_low=estimate_data.get("cost_range_low", total_cost * 0.9),
-                cost_range_high=estimate_data.get("cost_range_high", total_cost * 1.1),
-                cost_breakdown=cost_breakdown,
-                confidence_score=estimate_data.get("confidence_score", 0.85),
-                timeline=timeline,
-                similar_projects=similar_projects,
-                created_at=datetime.now(),
-                metadata={
-                    "session_id": session_id,
-                    "material_prices": material_prices
-                } if session_id else {"material_prices": material_prices}
-            )
+            estimate = self._build_estimate(estimate_data, metadata)
             
-            # Cache estimate
-            estimates_cache[estimate_id] = estimate.dict()
+            # Store estimate + its content hash (shared across workers)
+            data = estimate.model_dump_json().encode()
+            await self.store.put(estimate.estimate_id, data, session_id)
             
-            return estimate
+            return estimate, data
             
         except Exception as e:
             logger.error(f"Error generating estimate: {str(e)}")
             raise
     
-    def get_estimate(self, estimate_id: str) -> Optional[EstimateResponse]:
-        """Retrieve a cached estimate"""
-        estimate_data = estimates_cache.get(estimate_id)
-        if estimate_data:
-            return EstimateResponse(**estimate_data)
+    async def _computed(self, project_details: ProjectDetails) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Figures (and narrative, when enabled) for the project, memoised for
+        ``estimate_memo_ttl`` under its canonical form so repeats skip the
+        computation and the LLM call.  Costs are proportional to square
+        footage, so a memo hit is rescaled to the requested size; the
+        narrative quotes the figures, so it is only reused at the same
+        size and otherwise written afresh (and memoised with the rescaled
+        figures).  Each request still gets its own estimate_id.
+        """
+        square_footage = project_details.square_footage
+        key = _fingerprint(canonical_project(project_details))
+        memo = None
+        if settings.estimate_memo_ttl > 0:
+            raw = await self.store.backend.get(MEMO_NAMESPACE, key)
+            memo = json.loads(raw) if raw else None
+            record_cache("estimate_memo", memo is not None)
+        if memo is not None:
+            estimate_data = _rescaled(memo["estimate_data"], square_footage / memo["square_footage"])
+            if not settings.estimate_narrative or (
+                memo["narrative"] is not None and memo["square_footage"] == square_footage
+            ):
+                return estimate_data, memo["narrative"]
+        else:
+            estimate_data = self._estimate_data(project_details)
+        narrative = await self._narrative(project_details, estimate_data) if settings.estimate_narrative else None
+        if settings.estimate_memo_ttl > 0:
+            await self.store.backend.set(
+                MEMO_NAMESPACE, key,
+                json.dumps({"estimate_data": estimate_data, "square_footage": square_footage,
+                            "narrative": narrative}).encode(),
+                ttl=settings.estimate_memo_ttl,
+            )
+        return estimate_data, narrative
+    
+    async def generate_batch(
+        self, projects: List[ProjectDetails], session_id: Optional[str] = None
+    ) -> AsyncIterator[List[Tuple[int, bytes]]]:
+        """
+        Estimate a portfolio: yields (index, estimate JSON) for each chunk of
+        BATCH_CHUNK projects as soon as it is computed and stored.  Projects
+        that are the same once canonicalised (at their exact square footage)
+        share one estimate; costs for a chunk are computed in one vectorised
+        engine call.  Material prices
+        are left out – they are per type and city, not per project.
+        """
+        seen: Dict[str, bytes] = {}
+        for start in range(0, len(projects), BATCH_CHUNK):
+            chunk = projects[start:start + BATCH_CHUNK]
+            keys = [_fingerprint({**canonical_project(p), "square_footage": p.square_footage}) for p in chunk]
+            fresh = [(key, p) for key, p in dict(zip(keys, chunk)).items() if key not in seen]
+            if fresh:
+                results = self.engine.estimate_many(
+                    [p.city for _, p in fresh],
+                    [p.project_type.value for _, p in fresh],
+                    [p.square_footage for _, p in fresh],
+                )
+                stored = []
+                for (key, project), result in zip(fresh, results):
+                    estimate_data = (self._from_engine(result) if result is not None
+                                     else self._default_estimate_data(project))
+                    metadata = {"basis": estimate_data["basis"], "samples": estimate_data["samples"]}
+                    if session_id:
+                        metadata["session_id"] = session_id
+                    estimate = self._build_estimate(estimate_data, metadata)
+                    seen[key] = estimate.model_dump_json().encode()
+                    stored.append((estimate.estimate_id, seen[key]))
+                await self.store.put_many(stored, session_id)
+            yield [(start + i, seen[key]) for i, key in enumerate(keys)]
+    
+    def _build_estimate(self, estimate_data: Dict[str, Any], metadata: Dict[str, Any]) -> EstimateResponse:
+        """Assemble the response (breakdown, timeline, similar projects) from computed figures"""
+        # Create estimate object
+        estimate_id = f"est_{uuid.uuid4().hex[:8]}"
+        
+        # Calculate cost breakdown
+        total_cost = estimate_data["total_cost"]
+        
+        cost_breakdown = CostBreakdown(
+            materials=total_cost * 0.40,
+            labor=total_cost * 0.35,
+            permits=total_cost * 0.05,
+            other=total_cost * 0.20,
+            total=total_cost
+        )
+        
+        # Calculate timeline
+        timeline = TimelineBreakdown(
+            planning_days=14,
+            permit_days=estimate_data.get("permit_days", 30),
+            construction_days=estimate_data.get("construction_days", 60),
+            total_days=14 + estimate_data.get("permit_days", 30) + estimate_data.get("construction_days", 60)
+        )
+        
+        # Create similar projects
+        similar_projects = []
+        for sp in estimate_data.get("similar_projects", []):
+            similar_projects.append(SimilarProject(**sp))
+        
+        return EstimateResponse(
+            estimate_id=estimate_id,
+            total_cost=total_cost,
+            cost_range_low=estimate_data.get("cost_range_low", total_cost * 0.9),
+            cost_range_high=estimate_data.get("cost_range_high", total_cost * 1.1),
+            cost_breakdown=cost_breakdown,
+            confidence_score=estimate_data.get("confidence_score", 0.85),
+            timeline=timeline,
+            similar_projects=similar_projects,
+            created_at=datetime.now(),
+            metadata=metadata
+        )
+    
+    async def get_estimate(self, estimate_id: str) -> Optional[EstimateResponse]:
+        """Retrieve a stored estimate"""
+        stored = await self.store.get(estimate_id)
+        if stored:
+            return EstimateResponse.model_validate_json(stored[0])
         return None
     
-    def _build_estimate_query(self, project_details: ProjectDetails) -> str:
-        """Build a query string for the RAG system"""
+    def _estimate_data(self, project_details: ProjectDetails) -> Dict[str, Any]:
+        """Cost, range, confidence and timeline from the precomputed dataset statistics"""
+        result = self.engine.estimate(
+            project_details.city,
+            project_details.project_type.value,
+            project_details.square_footage,
+        )
+        if result is None:
+            return self._default_estimate_data(project_details)
+        return self._from_engine(result)
+    
+    def _from_engine(self, result) -> Dict[str, Any]:
+        """Engine result → the estimate_data dict the response is built from"""
+        return {
+            "total_cost": result.total,
+            "cost_range_low": result.low,
+            "cost_range_high": result.high,
+            "confidence_score": result.confidence,
+            "permit_days": 30,
+            "construction_days": result.construction_days,
+            "basis": result.basis,
+            "samples": result.samples,
+            "similar_projects": [
+                {
+                    "project_type": project_type,
+                    "location": location,
+                    "cost_range": f"${low:,.0f} - ${high:,.0f}",
+                    "timeline": timeline or "Unknown",
+                    "source": source or "dataset",
+                }
+                for project_type, location, low, high, timeline, source in result.similar
+            ],
+        }
+    
+    def _default_estimate_data(self, project_details: ProjectDetails) -> Dict[str, Any]:
+        """Per-sq-ft fallback when the dataset has nothing for this project type"""
+        # Adjust for LA pricing (+12%)
+        factor = 1.12 if project_details.city == "Los Angeles" else 1.0
+        total = DEFAULT_COST_PER_SQFT[project_details.project_type.value] * project_details.square_footage * factor
+        return {
+            "total_cost": total,
+            "cost_range_low": total * 0.8,
+            "cost_range_high": total * 1.2,
+            "confidence_score": 0.3,
+            "permit_days": 30,
+            "construction_days": 60,
+            "basis": "default",
+            "samples": 0,
+            "similar_projects": [],
+        }
+    
+    def _build_estimate_query(self, project_details: ProjectDetails, estimate_data: Dict[str, Any]) -> str:
+        """Build a narrative prompt for the RAG system around the computed figures"""
         return f"""
         Project Type: {project_details.project_type.value}
         Property Type: {project_details.property_type}
         Location: {project_details.city}, {project_details.state}
         Square Footage: {project_details.square_footage}
         Additional Details: {project_details.additional_details or 'None'}
+        Estimated Cost: ${estimate_data['cost_range_low']:,.0f} - ${estimate_data['cost_range_high']:,.0f}
+        Construction Time: about {estimate_data['construction_days']} days
         
-        Please provide a detailed cost estimate including:
-        1. Total cost estimate
-        2. Cost range (low to high)
-        3. Timeline estimate
-        4. Similar projects with costs
+        In a short paragraph, explain what drives this estimate and what
+        could push the cost toward either end of the range.  Do not change
+        the figures above.
         """
     
-    def _parse_rag_response(self, rag_response: Dict[str, Any]) -> Dict[str, Any]:
-        """Parse the RAG response to extract estimate data"""
-        return {
-            "total_cost": rag_response.get("total_cost", 50000),
-            "cost_range_low": rag_response.get("cost_range_low", 45000),
-            "cost_range_high": rag_response.get("cost_range_high", 55000),
-            "confidence_score": rag_response.get("confidence_score", 0.85),
-            "permit_days": rag_response.get("permit_days", 30),
-            "construction_days": rag_response.get("construction_days", 60),
-            "similar_projects": rag_response.get("similar_projects", [])
-        }
\ No newline at end of file
+    async def _narrative(self, project_details: ProjectDetails, estimate_data: Dict[str, Any]) -> Optional[str]:
+        try:
+            # no session: the narrative is not a conversation to remember
+            return await self.rag_service.get_stateless_response(
+                self._build_estimate_query(project_details, estimate_data), "narrative"
+            )
+        except Exception as e:
+            logger.warning(f"Estimate narrative unavailable: {str(e)}")
+            return None
\ No newline at end of file
@@ -0,0 +1,157 @@
+# services/estimate_store.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+Two-tier store for generated estimates.
+
+  • Durable tier – the shared state backend (SQLite by default, see
+                   state_backend.py): the estimate's JSON bytes and their
+                   content hash, written together with a TTL
+                   (``estimate_ttl``), so estimates survive restarts and
+                   deploys and are visible to every worker.
+  • Hot tier     – a byte-bounded per-process LRU (memory_store.py) of
+                   (bytes, hash) for recently written or read estimates;
+                   memory stays flat however many estimates exist.
+
+Estimates are immutable once written, so the hot tier never needs
+invalidating.  Values are the serialised JSON exactly as returned to
+clients – reads hand the bytes straight to the response.  Each session
+keeps a capped index of its estimate ids for ``for_session`` lookups.
+"""
+import hashlib
+import logging
+import threading
+from typing import AsyncIterator, Iterable, List, Optional, Sequence, Tuple
+
+from config import settings
+from services.memory_store import MemoryStore
+from services.state_backend import StateBackend, get_state_backend
+
+logger = logging.getLogger(__name__)
+
+ESTIMATE_NAMESPACE = "estimate"
+_READ_CHUNK = 256                           # estimates fetched per backend call by iter_many
+ETAG_NAMESPACE = "estimate_etag"            # content hash stored next to each estimate
+SESSION_INDEX_NAMESPACE = "session_estimates"
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class EstimateStore:
+    """Hot LRU tier in front of the durable state backend."""
+
+    def __init__(self, backend: Optional[StateBackend] = None, hot: Optional[MemoryStore] = None):
+        self.backend = backend or get_state_backend()
+        if hot is None:  # (an empty MemoryStore is falsy)
+            hot = MemoryStore(
+                "estimate_hot",
+                max_bytes=settings.estimate_hot_max_bytes,
+                shards=settings.memory_store_shards,
+            )
+        self.hot = hot
+        self.ttl = settings.estimate_ttl or None
+
+    async def put_many(self, estimates: Sequence[Tuple[str, bytes]], session_id: Optional[str] = None) -> None:
+        """Write estimates (and their hashes, and the session index) in one backend operation"""
+        items = []
+        for estimate_id, data in estimates:
+            digest = content_hash(data)
+            items.append((ESTIMATE_NAMESPACE, estimate_id, data, self.ttl))
+            items.append((ETAG_NAMESPACE, estimate_id, digest.encode(), self.ttl))
+            self.hot.set(estimate_id, (data, digest), self.ttl, size=len(data) + len(digest))
+        appends = []
+        if session_id and estimates:
+            appends.append((
+                SESSION_INDEX_NAMESPACE, session_id, [estimate_id.encode() for estimate_id, _ in estimates],
+                settings.estimate_session_index_max, self.ttl,
+            ))
+        await self.backend.write_batch(items=items, appends=appends)
+
+    async def put(self, estimate_id: str, data: bytes, session_id: Optional[str] = None) -> None:
+        await self.put_many([(estimate_id, data)], session_id)
+
+    async def get(self, estimate_id: str) -> Optional[Tuple[bytes, str]]:
+        """The stored estimate JSON and its content hash"""
+        entry = self.hot.get(estimate_id)
+        if entry is not None:
+            return entry
+        data, digest = await self.backend.get_many([
+            (ESTIMATE_NAMESPACE, estimate_id), (ETAG_NAMESPACE, estimate_id),
+        ])
+        if not data:
+            return None
+        entry = (data, digest.decode() if digest else content_hash(data))
+        self.hot.set(estimate_id, entry, self.ttl, size=len(data) + len(entry[1]))
+        return entry
+
+    async def iter_many(self, estimate_ids: Iterable[str],
+                        chunk: int = _READ_CHUNK) -> AsyncIterator[Tuple[str, Optional[bytes]]]:
+        """(estimate_id, JSON or None) in order, reading the backend a chunk at a time.
+
+        For exports of thousands of estimates: only one chunk is held at once.
+        Estimates already in the hot tier are served from it, but what is
+        read from the backend is not added to it, so a bulk export does not
+        flush it.
+        """
+        batch: List[str] = []
+        for estimate_id in estimate_ids:
+            batch.append(estimate_id)
+            if len(batch) >= chunk:
+                for item in await self._read_chunk(batch):
+                    yield item
+                batch = []
+        if batch:
+            for item in await self._read_chunk(batch):
+                yield item
+
+    async def _read_chunk(self, estimate_ids: List[str]) -> List[Tuple[str, Optional[bytes]]]:
+        """Hot-tier hits, then one backend read for the rest (not cached)"""
+        found = {}
+        missing = []
+        for estimate_id in estimate_ids:
+            entry = self.hot.get(estimate_id)
+            if entry is not None:
+                found[estimate_id] = entry[0]
+            else:
+                missing.append(estimate_id)
+        if missing:
+            values = await self.backend.get_many([(ESTIMATE_NAMESPACE, estimate_id) for estimate_id in missing])
+            found.update(zip(missing, values))
+        return [(estimate_id, found.get(estimate_id)) for estimate_id in estimate_ids]
+
+    async def get_hash(self, estimate_id: str) -> Optional[str]:
+        """Just the content hash – lets a conditional GET skip loading the estimate"""
+        entry = self.hot.get(estimate_id)
+        if entry is not None:
+            return entry[1]
+        digest = await self.backend.get(ETAG_NAMESPACE, estimate_id)
+        return digest.decode() if digest else None
+
+    async def session_ids(self, session_id: str, limit: int = 20) -> List[str]:
+        """The session's most recent estimate ids, newest first"""
+        ids = await self.backend.get_range(SESSION_INDEX_NAMESPACE, session_id, -limit, -1)
+        return [estimate_id.decode() for estimate_id in reversed(ids)]
+
+    async def for_session(self, session_id: str, limit: int = 20) -> List[Tuple[str, bytes]]:
+        """(estimate_id, JSON) for the session's most recent estimates that still exist"""
+        found = []
+        for estimate_id in await self.session_ids(session_id, limit):
+            entry = await self.get(estimate_id)
+            if entry is not None:
+                found.append((estimate_id, entry[0]))
+        return found
+
+
+_store: Optional[EstimateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_estimate_store() -> EstimateStore:
+    """Process-wide store, so the API and PDF export share one hot tier."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EstimateStore()
+    return _store
@@ -0,0 +1,164 @@
+# services/export_formats.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+Streaming CSV / NDJSON / zip exports of stored estimates.
+
+Every exporter is an async generator of byte chunks that reads the estimate
+store a chunk at a time (``EstimateStore.iter_many``) and hands each piece
+to the response as soon as it is serialised – memory stays flat however
+many estimates are exported.
+
+  • CSV    – one header, then one row per estimate (CSV_COLUMNS).
+  • NDJSON – the stored estimate JSON, one per line, never re-serialised.
+  • zip    – one PDF or CSV per estimate; each entry is written to the
+             stream as soon as it is produced (zipfile on a non-seekable
+             sink, so sizes go in data descriptors), PDFs rendered through
+             the render pool a few at a time.  Estimates that are missing
+             or fail to render are listed in a final ``errors.txt``.
+"""
+import csv
+import io
+import json
+import logging
+import zipfile
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from services.estimate_store import EstimateStore
+
+logger = logging.getLogger(__name__)
+
+# (column, how to read it from the stored estimate)
+CSV_COLUMNS: List[Tuple[str, Callable[[Dict[str, Any]], Any]]] = [
+    ("estimate_id", lambda e: e["estimate_id"]),
+    ("created_at", lambda e: e["created_at"]),
+    ("session_id", lambda e: (e.get("metadata") or {}).get("session_id", "")),
+    ("basis", lambda e: (e.get("metadata") or {}).get("basis", "")),
+    ("samples", lambda e: (e.get("metadata") or {}).get("samples", "")),
+    ("total_cost", lambda e: e["total_cost"]),
+    ("cost_range_low", lambda e: e["cost_range_low"]),
+    ("cost_range_high", lambda e: e["cost_range_high"]),
+    ("confidence_score", lambda e: e["confidence_score"]),
+    ("materials", lambda e: e["cost_breakdown"]["materials"]),
+    ("labor", lambda e: e["cost_breakdown"]["labor"]),
+    ("permits", lambda e: e["cost_breakdown"]["permits"]),
+    ("other", lambda e: e["cost_breakdown"]["other"]),
+    ("planning_days", lambda e: e["timeline"]["planning_days"]),
+    ("permit_days", lambda e: e["timeline"]["permit_days"]),
+    ("construction_days", lambda e: e["timeline"]["construction_days"]),
+    ("total_days", lambda e: e["timeline"]["total_days"]),
+]
+
+MEDIA_TYPES = {"csv": "text/csv", "json": "application/x-ndjson", "zip": "application/zip"}
+EXTENSIONS = {"csv": "csv", "json": "ndjson", "zip": "zip"}
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  CSV / NDJSON
+# ────────────────────────────────────────────────────────────────────────────
+def _csv_lines(rows: Iterable[List[Any]]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def csv_header() -> bytes:
+    return _csv_lines([[name for name, _ in CSV_COLUMNS]])
+
+
+def csv_row(estimate: Dict[str, Any]) -> List[Any]:
+    return [get(estimate) for _, get in CSV_COLUMNS]
+
+
+async def stream_csv(store: EstimateStore, estimate_ids: Iterable[str]) -> AsyncIterator[bytes]:
+    """Header, then a chunk of rows per backend read; missing estimates are skipped."""
+    yield csv_header()
+    rows = []
+    async for _, data in store.iter_many(estimate_ids):
+        if data is not None:
+            rows.append(csv_row(json.loads(data)))
+        if len(rows) >= 256:
+            yield _csv_lines(rows)
+            rows = []
+    if rows:
+        yield _csv_lines(rows)
+
+
+async def stream_ndjson(store: EstimateStore, estimate_ids: Iterable[str]) -> AsyncIterator[bytes]:
+    """The stored JSON of each estimate, one per line; missing estimates are skipped."""
+    async for _, data in store.iter_many(estimate_ids):
+        if data is not None:
+            yield data + b"\n"
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Zip
+# ────────────────────────────────────────────────────────────────────────────
+class _ZipSink:
+    """Write-only (non-seekable) file for zipfile; the bytes are drained after each entry."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(entries: AsyncIterator[Tuple[str, bytes, int]]) -> AsyncIterator[bytes]:
+    """Zip (name, data, compress_type) entries, yielding each entry's bytes as it is added."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode="w") as archive:
+        async for name, data, compression in entries:
+            info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = compression
+            archive.writestr(info, data)
+            yield sink.drain()
+    yield sink.drain()  # central directory
+
+
+async def _zip_entries(
+    store: EstimateStore,
+    estimate_ids: Iterable[str],
+    entry_format: str,
+    include_breakdown: bool,
+    pdf_service: Optional[Any],
+) -> AsyncIterator[Tuple[str, bytes, int]]:
+    errors = []
+    estimates = store.iter_many(estimate_ids)
+    if entry_format == "pdf":
+        async for estimate_id, pdf in pdf_service.render_many(estimates, include_breakdown):
+            if isinstance(pdf, bytes):
+                # PDF streams are already compressed
+                yield f"estimate_{estimate_id}.pdf", pdf, zipfile.ZIP_STORED
+            else:
+                errors.append(f"{estimate_id}: {pdf}")
+    else:
+        header = csv_header()
+        async for estimate_id, data in estimates:
+            if data is None:
+                errors.append(f"{estimate_id}: not found")
+                continue
+            row = _csv_lines([csv_row(json.loads(data))])
+            yield f"estimate_{estimate_id}.csv", header + row, zipfile.ZIP_DEFLATED
+    if errors:
+        yield "errors.txt", ("\n".join(errors) + "\n").encode(), zipfile.ZIP_DEFLATED
+
+
+def stream_zip_export(
+    store: EstimateStore,
+    estimate_ids: Iterable[str],
+    entry_format: str = "pdf",
+    include_breakdown: bool = True,
+    pdf_service: Optional[Any] = None,
+) -> AsyncIterator[bytes]:
+    """A zip of one *entry_format* file (pdf or csv) per estimate, streamed entry by entry."""
+    return stream_zip(_zip_entries(store, estimate_ids, entry_format, include_breakdown, pdf_service))
@@ -0,0 +1,314 @@
+# services/export_store.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+Disk tier for rendered exports: byte budget, real expiry, LRU, held files.
+
+Sits behind the in-memory PDF cache (pdf_service.py), so a worker restart
+or a cold worker serves a recent export from disk instead of re-rendering
+it.  Files are content addressed (``<export key>.pdf``), so a file never
+changes once written.
+
+  • Shared   – the directory is the index: every worker reads what any
+               worker wrote.  A file's mtime is when it was rendered, its
+               atime when it was last served (set explicitly, so noatime
+               mounts don't matter).
+  • Writes   – to a temp file in the same directory, then ``os.replace``:
+               a reader sees the whole file or none of it.
+  • Budget   – ``export_store_max_bytes`` for the whole directory.  The lock
+               file holds the directory's running byte / file totals, so a
+               write only updates them (under an exclusive flock, shared by
+               every worker); the directory is scanned only when a write
+               goes over budget – least recently served files are evicted
+               down to LOW_WATER of it – and by the janitor's sweep, which
+               also corrects the totals.
+  • Expiry   – ``export_ttl`` after the file was (re)written, matching the
+               ``expires_at`` promised by the export API; expired files are
+               invisible on read and deleted by the janitor (``run_janitor``,
+               started from the app lifespan).
+  • Held     – a download opens the file in ``acquire`` (→ ``ExportFile``)
+               and streams from that descriptor, so a file evicted or
+               expired mid-download – by any worker – is unlinked but still
+               read in full; the space is freed when the last reader closes.
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: workers don't coordinate, held files still stay readable
+    fcntl = None
+
+from config import settings
+from services.metrics import EXPORT_STORE_BYTES, EXPORT_STORE_EVICTIONS, EXPORT_STORE_FILES
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+_SUFFIX = ".pdf"
+_TMP_PREFIX = ".tmp-"
+_LOCK_NAME = ".lock"
+_TMP_MAX_AGE = 300  # a temp file this old was left by a crashed write
+LOW_WATER = 0.9     # eviction frees space down to this share of the budget
+
+
+class ExportFile:
+    """An export opened for reading; ``release`` (idempotent) once the response is done."""
+
+    def __init__(self, store: "ExportStore", key: str, fd: int, size: int):
+        self.store = store
+        self.key = key
+        self.size = size
+        self._fd = fd
+        self._released = False
+
+    def chunks(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Bytes start..end (inclusive) in CHUNK_SIZE pieces, from the open descriptor."""
+        end = self.size - 1 if end is None else end
+        offset = start
+        while offset <= end:
+            chunk = os.pread(self._fd, min(CHUNK_SIZE, end - offset + 1), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+
+    def read(self) -> bytes:
+        return b"".join(self.chunks())
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            os.close(self._fd)
+            self.store._release(self.key)
+
+
+class ExportStore:
+    """Content-addressed export files under one (shared) directory, LRU within a byte budget."""
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()       # counters below
+        self._scan_lock = threading.Lock()  # this process's side of _exclusive
+        self._lock_path = os.path.join(directory, _LOCK_NAME)
+        self._held: Dict[str, int] = {}
+        # directory totals as of this worker's last put or sweep
+        self.bytes = 0
+        self.files = 0
+        self.evictions = 0
+        self.expirations = 0
+        os.makedirs(directory, exist_ok=True)
+        self.sweep()
+        if self.files:
+            logger.info("Export store: %s files (%s bytes) in %s", self.files, self.bytes, directory)
+        ref = weakref.ref(self)  # the gauges must not keep the store alive
+        EXPORT_STORE_BYTES.set_function(lambda: ref().bytes if ref() is not None else 0)
+        EXPORT_STORE_FILES.set_function(lambda: ref().files if ref() is not None else 0)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    @contextmanager
+    def _exclusive(self):
+        """
+        Held by at most one thread of one worker at a time (flock on the lock
+        file); yields the lock file, which records the directory totals.
+        """
+        with self._scan_lock, open(self._lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield lock_file
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_totals(lock_file) -> Optional[Tuple[int, int]]:
+        """(bytes, files) as last recorded, None if never recorded or unreadable."""
+        lock_file.seek(0)
+        try:
+            total, files = lock_file.read().split()
+            return int(total), int(files)
+        except ValueError:
+            return None
+
+    def _write_totals(self, lock_file, total: int, files: int) -> None:
+        lock_file.truncate(0)
+        lock_file.write(f"{total} {files}".encode())
+        lock_file.flush()
+        with self._lock:
+            self.bytes, self.files = total, files
+
+    # ─── writes ───────────────────────────────────────────────────────────
+    def put(self, key: str, data: bytes) -> bool:
+        """Store *data* under *key* (write-then-rename); False if it exceeds the budget."""
+        if len(data) > self.max_bytes:
+            return False
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(prefix=_TMP_PREFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            now = time.time()
+            os.utime(tmp, (now, now))  # same clock as acquire's "last served"
+            with self._exclusive() as lock_file:
+                try:
+                    replaced = os.stat(path).st_size
+                except FileNotFoundError:
+                    replaced = None
+                os.replace(tmp, path)
+                totals = self._read_totals(lock_file)
+                total = totals and totals[0] + len(data) - (replaced or 0)
+                if totals is None or total > self.max_bytes:
+                    self._enforce(now, lock_file)  # scan: evict, or recount unknown totals
+                else:
+                    self._write_totals(lock_file, total, totals[1] + (replaced is None))
+        except BaseException:
+            self._unlink(tmp)
+            raise
+        return True
+
+    # ─── reads ────────────────────────────────────────────────────────────
+    def acquire(self, key: str) -> Optional[ExportFile]:
+        """Open the file for *key* (None if absent or expired); caller must release it."""
+        try:
+            fd = os.open(self._path(key), os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        stat = os.fstat(fd)
+        now = time.time()
+        if stat.st_mtime + self.ttl <= now:  # the janitor deletes it
+            os.close(fd)
+            return None
+        try:
+            os.utime(self._path(key), (now, stat.st_mtime))  # last served, for LRU
+        except OSError:
+            pass
+        with self._lock:
+            self._held[key] = self._held.get(key, 0) + 1
+        return ExportFile(self, key, fd, stat.st_size)
+
+    def read(self, key: str) -> Optional[bytes]:
+        held = self.acquire(key)
+        if held is None:
+            return None
+        try:
+            return held.read()
+        finally:
+            held.release()
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            refs = self._held.get(key, 0) - 1
+            if refs > 0:
+                self._held[key] = refs
+            else:
+                self._held.pop(key, None)
+
+    # ─── eviction / expiry (call under _exclusive, with its lock file) ────
+    def _scan(self, now: float) -> List[Tuple[float, str, int, float]]:
+        """(last served, path, size, written) per export file; drops abandoned temp files."""
+        found = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith(_TMP_PREFIX):
+                if stat.st_mtime + _TMP_MAX_AGE <= now:
+                    self._unlink(entry.path)
+            elif entry.name.endswith(_SUFFIX) and entry.is_file():
+                found.append((stat.st_atime, entry.path, stat.st_size, stat.st_mtime))
+        return found
+
+    def _enforce(self, now: float, lock_file) -> int:
+        """
+        Scan the directory: delete expired files and, when over budget, the
+        least recently served ones down to LOW_WATER of it; record the totals.
+        Returns how many expired.
+        """
+        live, expired = [], 0
+        for entry in self._scan(now):
+            if entry[3] + self.ttl <= now:
+                self._unlink(entry[1])
+                expired += 1
+                EXPORT_STORE_EVICTIONS.labels("expired").inc()
+            else:
+                live.append(entry)
+        live.sort()
+        total = sum(size for _, _, size, _ in live)
+        target = self.max_bytes * LOW_WATER if total > self.max_bytes else self.max_bytes
+        while total > target and live:
+            _, path, size, _ = live.pop(0)
+            self._unlink(path)  # an open download keeps reading it
+            total -= size
+            with self._lock:
+                self.evictions += 1
+            EXPORT_STORE_EVICTIONS.labels("lru").inc()
+        with self._lock:
+            self.expirations += expired
+        self._write_totals(lock_file, total, len(live))
+        return expired
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    # ─── maintenance / stats ──────────────────────────────────────────────
+    def sweep(self) -> int:
+        """Delete every expired file (and enforce the budget); returns how many expired."""
+        with self._exclusive() as lock_file:
+            return self._enforce(time.time(), lock_file)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "files": self.files,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "held": sum(self._held.values()),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_store: Optional[ExportStore] = None
+_store_lock = threading.Lock()
+
+
+def get_export_store() -> ExportStore:
+    """Process-wide export store (created, and its directory swept, on first use)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ExportStore(settings.export_dir, settings.export_store_max_bytes,
+                                     settings.export_ttl)
+    return _store
+
+
+async def run_janitor(interval: float = 60.0) -> None:
+    """
+    Background task: delete expired export files every *interval* seconds.
+    Started from the app lifespan and cancelled on shutdown.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await asyncio.to_thread(get_export_store().sweep)
+            if removed:
+                logger.debug("Export store: removed %s expired files", removed)
+        except Exception as e:
+            logger.error(f"Export janitor failed: {str(e)}")
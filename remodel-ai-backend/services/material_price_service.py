@@ -1,15 +1,88 @@
-from serpapi import GoogleSearch
+import asyncio
+import json
 import os
-from typing import List, Dict, Optional
+import socket
+import time
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
-import json
 import logging
+import threading
+import httpx
+from config import settings
+from services.metrics import record_cache
+from services.state_backend import SQLiteStateBackend, StateBackend
 logger = logging.getLogger(__name__)
+PRICE_NAMESPACE = "material_price"
+REFRESH_LEASE_NAMESPACE = "material_price_refresh"  # one refresher per interval across workers
+COMMON_MATERIALS = {
+    'kitchen_remodel': [
+        'kitchen cabinets',
+        'quartz countertops',
+        'stainless steel sink',
+        'kitchen faucet',
+        'tile backsplash'
+    ],
+    'bathroom_remodel': [
+        'bathroom vanity',
+        'toilet',
+        'shower door',
+        'bathroom tile',
+        'bathroom faucet'
+    ],
+    'flooring': [
+        'hardwood flooring',
+        'laminate flooring',
+        'carpet',
+        'tile flooring',
+        'flooring underlayment'
+    ],
+    'roofing': [
+        'asphalt shingles',
+        'roofing felt',
+        'roofing nails',
+        'flashing',
+        'ridge vent'
+    ]
+}
+class _RateLimiter:
+    """Spaces outbound calls at most *rate* per second (shared by every lookup)."""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+    async def wait(self) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
 class MaterialPriceService:
-    def __init__(self):
+    """
+    Home Depot prices via SerpAPI, fetched concurrently on the event loop.
+    Lookups share one pooled HTTP client, run at most
+    ``material_price_concurrency`` at a time, each bounded by
+    ``material_price_timeout`` and paced by ``material_price_rate``.
+
+    Prices persist in a local SQLite file, so a restart starts warm, and a
+    background refresher (``run_refresher``) re-fetches the common materials
+    for every supported ZIP before they go stale – in one worker per
+    interval, elected through a lease in that shared file.  Requests are served from
+    the cache – stale entries (up to ``material_price_max_stale``) are
+    returned at once and revalidated in the background.  A miss is fetched
+    in the background too and reported pending; without the refresher the
+    caller waits at most ``material_price_deadline`` for it instead.
+    """
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, store: Optional[StateBackend] = None):
         self.api_key = os.getenv('SERP_API_KEY')
-        self.cache = {}
+        self.cache: Dict[str, Tuple[Dict, float]] = {}   # cache_key -> (price info, fetched at)
         self.cache_duration = timedelta(hours=24)
+        self.refresh_after = self.cache_duration / 2
+        self.max_stale = timedelta(seconds=settings.material_price_max_stale)
+        self.store = store or SQLiteStateBackend(settings.material_price_db_path)
+        self._client = client
+        self._semaphore = asyncio.Semaphore(settings.material_price_concurrency)
+        self._limiter = _RateLimiter(settings.material_price_rate)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._refresher_running = False
         # ZIP codes for our supported cities
         self.zip_codes = {
             'San Diego': '92101',
@@ -17,59 +90,108 @@ class MaterialPriceService:
             'LA': '90001',
             'SD': '92101'
         }
-    def get_material_prices(self, materials: List[str], location: str) -> Dict[str, Dict]:
-        """Get prices for materials from Home Depot based on location"""
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=settings.serpapi_base_url,
+                timeout=settings.material_price_timeout,
+                limits=httpx.Limits(max_connections=settings.material_price_concurrency),
+            )
+        return self._client
+    async def aclose(self) -> None:
+        if self._client is not None:
+            client, self._client = self._client, None  # rebuilt if used again
+            await client.aclose()
+    async def get_material_prices(
+        self, materials: List[str], location: str, deadline: Optional[float] = None
+    ) -> Dict[str, Dict]:
+        """Get prices for materials from Home Depot based on location (served from cache where possible)"""
         prices = {}
         zip_code = self.zip_codes.get(location, '92101')
+        lookups: Dict[str, asyncio.Task] = {}
         for material in materials:
             cache_key = f"{material}_{zip_code}"
-            cached_data = self._get_cached_price(cache_key)
-            if cached_data:
-                prices[material] = cached_data
+            cached = await self._get_cached_price(cache_key)
+            if cached is not None:
+                price_info, age = cached
+                prices[material] = price_info
+                if age >= self.cache_duration.total_seconds():
+                    # Stale-while-revalidate: answer now, refresh behind the response
+                    self._lookup(material, zip_code, location, cache_key)
                 continue
-            try:
-                params = {
-                    'engine': 'home_depot',
-                    'q': material,
-                    'lowe\'s_zip': zip_code,
-                    'api_key': self.api_key,
-                    'num': 5
+            lookups[material] = self._lookup(material, zip_code, location, cache_key)
+        if lookups:
+            if deadline is None:
+                # With the refresher warming the cache, never wait on the network here
+                deadline = 0 if self._refresher_running else settings.material_price_deadline
+            done, _ = await asyncio.wait(set(lookups.values()), timeout=deadline)
+            for material, task in lookups.items():
+                prices[material] = task.result() if task in done else {
+                    'error': 'Price lookup still in progress',
+                    'pending': True,
+                    'source': 'Home Depot',
+                    'location': location
                 }
-                search = GoogleSearch(params)
-                results = search.get_dict()
-                if 'products' in results and results['products']:
-                    product_prices = []
-                    for product in results['products'][:5]:
-                        price_data = self._extract_price_data(product)
-                        if price_data:
-                            product_prices.append(price_data)
-                    if product_prices:
-                        price_info = self._aggregate_prices(product_prices)
-                        price_info['source'] = 'Home Depot'
-                        price_info['location'] = location
-                        price_info['timestamp'] = datetime.now().isoformat()
-                        self._cache_price(cache_key, price_info)
-                        prices[material] = price_info
-                    else:
-                        prices[material] = {
-                            'error': 'No valid prices found',
-                            'source': 'Home Depot',
-                            'location': location
-                        }
-                else:
-                    prices[material] = {
-                        'error': 'No products found',
-                        'source': 'Home Depot',
-                        'location': location
-                    }
-            except Exception as e:
-                logger.error(f"Error fetching price for {material}: {str(e)}")
-                prices[material] = {
-                    'error': str(e),
+        return {material: prices[material] for material in materials}
+    def _lookup(self, material: str, zip_code: str, location: str, cache_key: str) -> asyncio.Task:
+        """The in-flight lookup for *cache_key*, started if there is none (requests share it)"""
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_price(material, zip_code, location, cache_key))
+            self._inflight[cache_key] = task
+        return task
+    async def _fetch_price(self, material: str, zip_code: str, location: str, cache_key: str) -> Dict:
+        """One SerpAPI lookup (rate-limited, bounded by the semaphore and the per-request timeout)"""
+        try:
+            params = {
+                'engine': 'home_depot',
+                'q': material,
+                'lowe\'s_zip': zip_code,
+                'api_key': self.api_key,
+                'num': 5,
+                'output': 'json'
+            }
+            async with self._semaphore:
+                await self._limiter.wait()
+                response = await asyncio.wait_for(
+                    self.client.get('/search', params=params), settings.material_price_timeout
+                )
+            response.raise_for_status()
+            results = response.json()
+            if 'products' in results and results['products']:
+                product_prices = []
+                for product in results['products'][:5]:
+                    price_data = self._extract_price_data(product)
+                    if price_data:
+                        product_prices.append(price_data)
+                if product_prices:
+                    price_info = self._aggregate_prices(product_prices)
+                    price_info['source'] = 'Home Depot'
+                    price_info['location'] = location
+                    price_info['timestamp'] = datetime.now().isoformat()
+                    await self._cache_price(cache_key, price_info)
+                    return price_info
+                return {
+                    'error': 'No valid prices found',
                     'source': 'Home Depot',
                     'location': location
                 }
-        return prices
+            return {
+                'error': 'No products found',
+                'source': 'Home Depot',
+                'location': location
+            }
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.error(f"Error fetching price for {material}: {error}")
+            return {
+                'error': error,
+                'source': 'Home Depot',
+                'location': location
+            }
+        finally:
+            self._inflight.pop(cache_key, None)
     def _extract_price_data(self, product: Dict) -> Optional[Dict]:
         """Extract price information from a product result"""
         try:
@@ -104,46 +226,87 @@ class MaterialPriceService:
             'sample_size': len(prices),
             'products': product_prices[:3]
         }
-    def _get_cached_price(self, cache_key: str) -> Optional[Dict]:
-        """Get price from cache if not expired"""
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if datetime.now() - timestamp < self.cache_duration:
-                return cached_data
+    async def _get_cached_price(self, cache_key: str, reload_after: Optional[float] = None) -> Optional[Tuple[Dict, float]]:
+        """
+        (price info, age in seconds) from memory, else from the on-disk store;
+        None past the stale limit.  An in-memory entry older than
+        *reload_after* is re-read from disk in case another worker refreshed it.
+        """
+        entry = self.cache.get(cache_key)
+        if entry is None or (reload_after is not None and time.time() - entry[1] >= reload_after):
+            raw = await self.store.get(PRICE_NAMESPACE, cache_key)
+            if raw:
+                stored = json.loads(raw)
+                entry = (stored['price'], stored['fetched_at'])
+                self.cache[cache_key] = entry
+        if entry is not None:
+            age = time.time() - entry[1]
+            if age < self.max_stale.total_seconds():
+                record_cache("material_price", True)
+                return entry[0], age
+            self.cache.pop(cache_key, None)
+        record_cache("material_price", False)
         return None
-    def _cache_price(self, cache_key: str, price_data: Dict):
-        """Cache price data with timestamp"""
-        self.cache[cache_key] = (price_data, datetime.now())
+    async def _cache_price(self, cache_key: str, price_data: Dict):
+        """Cache price data with timestamp (memory + on-disk store)"""
+        fetched_at = time.time()
+        self.cache[cache_key] = (price_data, fetched_at)
+        await self.store.set(
+            PRICE_NAMESPACE,
+            cache_key,
+            json.dumps({'price': price_data, 'fetched_at': fetched_at}).encode(),
+            ttl=int(self.max_stale.total_seconds()),
+        )
     def get_common_materials(self, project_type: str) -> List[str]:
         """Get common materials for a project type"""
-        materials_map = {
-            'kitchen_remodel': [
-                'kitchen cabinets',
-                'quartz countertops',
-                'stainless steel sink',
-                'kitchen faucet',
-                'tile backsplash'
-            ],
-            'bathroom_remodel': [
-                'bathroom vanity',
-                'toilet',
-                'shower door',
-                'bathroom tile',
-                'bathroom faucet'
-            ],
-            'flooring': [
-                'hardwood flooring',
-                'laminate flooring',
-                'carpet',
-                'tile flooring',
-                'flooring underlayment'
-            ],
-            'roofing': [
-                'asphalt shingles',
-                'roofing felt',
-                'roofing nails',
-                'flashing',
-                'ridge vent'
-            ]
-        }
-        return materials_map.get(project_type, [])
\ No newline at end of file
+        return COMMON_MATERIALS.get(project_type, [])
+    # ── background refresh ───────────────────────────────────────────────
+    async def refresh_all(self) -> int:
+        """Re-fetch every common material for every supported ZIP not refreshed recently"""
+        refresh_after = self.refresh_after.total_seconds()
+        locations = {zip_code: city for city, zip_code in self.zip_codes.items() if len(city) > 2}
+        lookups = []
+        for materials in COMMON_MATERIALS.values():
+            for zip_code, city in locations.items():
+                for material in materials:
+                    cache_key = f"{material}_{zip_code}"
+                    cached = await self._get_cached_price(cache_key, reload_after=refresh_after)
+                    if cached is None or cached[1] >= refresh_after:
+                        lookups.append(self._lookup(material, zip_code, city, cache_key))
+        if lookups:
+            await asyncio.gather(*lookups)
+        return len(lookups)
+    async def run_refresher(self, interval: float) -> None:
+        """
+        Background task: keep the price cache warm.  Started from the app
+        lifespan and cancelled on shutdown; a no-op without SERP_API_KEY.
+        Every worker runs it, but each interval only the one that claims
+        the lease refreshes – the others read its prices from the store.
+        """
+        if not self.api_key:
+            logger.info("SERP_API_KEY not set; material price refresher disabled")
+            return
+        owner = f"{socket.gethostname()}:{os.getpid()}".encode()
+        self._refresher_running = True
+        try:
+            while True:
+                try:
+                    if await self.store.add(REFRESH_LEASE_NAMESPACE, "lease", owner, ttl=max(1, int(interval))):
+                        refreshed = await self.refresh_all()
+                        if refreshed:
+                            logger.info("Material price refresh: %s lookups", refreshed)
+                except Exception as e:
+                    logger.error(f"Material price refresh failed: {str(e)}")
+                await asyncio.sleep(interval)
+        finally:
+            self._refresher_running = False
+_service: Optional[MaterialPriceService] = None
+_service_lock = threading.Lock()
+def get_material_price_service() -> MaterialPriceService:
+    """Process-wide service, so estimates and the refresher share one cache and client."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = MaterialPriceService()
+    return _service
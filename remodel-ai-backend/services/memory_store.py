@@ -0,0 +1,208 @@
+# services/memory_store.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+Bounded in-process key/value store: LRU + per-entry TTL + byte budget.
+
+Used wherever per-user state lives in worker memory (the ``memory`` state
+backend and the Redis backend's local fallback), so sessions and contexts
+share one budget and one eviction policy:
+
+  • Recency – reads move an entry to the back; eviction takes from the
+    front, so an active session outlives abandoned ones.
+  • TTL     – expired entries are invisible on read and removed by the
+    background sweeper (``run_sweeper``, started from the app lifespan).
+  • Budget  – approximate bytes (payload + fixed per-entry overhead) and an
+    optional entry cap, split evenly across shards.
+
+Keys are spread over N shards, each an OrderedDict behind its own lock, so
+callers on different threads rarely contend.  Occupancy, evictions and
+expirations are exported as Prometheus metrics labelled by store name.
+"""
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+
+from services.metrics import (
+    MEMORY_STORE_BYTES,
+    MEMORY_STORE_ENTRIES,
+    MEMORY_STORE_EVICTIONS,
+    record_cache,
+)
+
+logger = logging.getLogger(__name__)
+
+ENTRY_OVERHEAD = 96  # rough bytes per entry for key, tuple and dict slot
+
+_stores: "weakref.WeakSet[MemoryStore]" = weakref.WeakSet()
+_MISSING = object()
+
+
+def sizeof(value: Any) -> int:
+    """Approximate payload size for the values the state backend stores."""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(k) + sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)) or hasattr(value, "maxlen"):
+        return sum(sizeof(v) for v in value)
+    return 64
+
+
+class _Shard:
+    __slots__ = ("lock", "items", "bytes")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> (value, expires_at, size)
+        self.items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.bytes = 0
+
+
+class MemoryStore:
+    """Sharded LRU/TTL map bounded by an approximate byte budget."""
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int,
+        max_entries: Optional[int] = None,
+        shards: int = 16,
+    ):
+        self.name = name
+        self._shards: List[_Shard] = [_Shard() for _ in range(max(1, shards))]
+        self.shard_bytes = max_bytes // len(self._shards)
+        self.shard_entries = (
+            max(1, max_entries // len(self._shards)) if max_entries else None
+        )
+        self.evictions = 0
+        self.expirations = 0
+
+        ref = weakref.ref(self)  # the gauges must not keep the store alive
+        MEMORY_STORE_ENTRIES.labels(name).set_function(lambda: len(ref() or ()))
+        MEMORY_STORE_BYTES.labels(name).set_function(
+            lambda: ref().bytes_used() if ref() is not None else 0
+        )
+        _stores.add(self)
+
+    def _shard(self, key: Hashable) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _drop(self, shard: _Shard, key: Hashable) -> None:
+        _, _, size = shard.items.pop(key)
+        shard.bytes -= size
+
+    # ─── map API ──────────────────────────────────────────────────────────
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.items.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                self._drop(shard, key)
+                self.expirations += 1
+                MEMORY_STORE_EVICTIONS.labels(self.name, "expired").inc()
+                entry = None
+            if entry is None:
+                record_cache(self.name, False)
+                return default
+            shard.items.move_to_end(key)
+        record_cache(self.name, True)
+        return entry[0]
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        size: Optional[int] = None,
+    ) -> None:
+        size = (sizeof(value) if size is None else size) + ENTRY_OVERHEAD
+        if size > self.shard_bytes:
+            logger.warning("%s: %s-byte entry exceeds the shard budget; not cached",
+                           self.name, size)
+            self.pop(key)
+            return
+
+        expires_at = time.time() + ttl if ttl else None
+        shard = self._shard(key)
+        evicted = 0
+        with shard.lock:
+            if key in shard.items:
+                self._drop(shard, key)
+            shard.items[key] = (value, expires_at, size)
+            shard.bytes += size
+            while shard.bytes > self.shard_bytes or (
+                self.shard_entries and len(shard.items) > self.shard_entries
+            ):
+                self._drop(shard, next(iter(shard.items)))
+                evicted += 1
+        if evicted:
+            self.evictions += evicted
+            MEMORY_STORE_EVICTIONS.labels(self.name, "lru").inc(evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        shard = self._shard(key)
+        with shard.lock:
+            if key not in shard.items:
+                return default
+            value = shard.items[key][0]
+            self._drop(shard, key)
+        return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return sum(len(shard.items) for shard in self._shards)
+
+    def keys(self) -> Iterator[Hashable]:
+        for shard in self._shards:
+            with shard.lock:
+                keys = list(shard.items)
+            yield from keys
+
+    # ─── maintenance / stats ──────────────────────────────────────────────
+    def bytes_used(self) -> int:
+        return sum(shard.bytes for shard in self._shards)
+
+    def sweep(self) -> int:
+        """Drop every expired entry; returns how many were removed."""
+        now = time.time()
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                expired = [k for k, (_, exp, _) in shard.items.items()
+                           if exp is not None and exp <= now]
+                for key in expired:
+                    self._drop(shard, key)
+            removed += len(expired)
+        if removed:
+            self.expirations += removed
+            MEMORY_STORE_EVICTIONS.labels(self.name, "expired").inc(removed)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self),
+            "bytes": self.bytes_used(),
+            "max_bytes": self.shard_bytes * len(self._shards),
+            "shards": len(self._shards),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+async def run_sweeper(interval: float = 30.0) -> None:
+    """
+    Background task: sweep expired entries from every live MemoryStore.
+    Started from the app lifespan and cancelled on shutdown.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        for store in list(_stores):
+            removed = store.sweep()
+            if removed:
+                logger.debug("%s: swept %s expired entries", store.name, removed)
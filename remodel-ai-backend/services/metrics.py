@@ -0,0 +1,210 @@
+# services/metrics.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+Prometheus metrics shared by the API layer and the services.
+
+Everything here is a module-level collector so the cost of recording a
+sample is a dict lookup plus an atomic add – cheap enough to leave on in
+production.  The ``/metrics`` endpoint in ``main.py`` renders the default
+registry.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────────────────────────────────────────────────────
+#  Collectors
+# ───────────────────────────────────────────────────────────────────────────
+HTTP_REQUEST_LATENCY = Histogram(
+    "remodelai_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "remodelai_http_requests_in_flight",
+    "HTTP requests currently being served.",
+)
+
+# Stages: context_load, condense, embed, retrieve, llm_answer, summarize,
+# validate, context_save
+RAG_STAGE_LATENCY = Histogram(
+    "remodelai_rag_stage_duration_seconds",
+    "Latency of each RAGService pipeline stage.",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+LLM_CALLS = Counter(
+    "remodelai_llm_calls_total",
+    "LLM calls by call site.",
+    ["site"],
+)
+LLM_TOKENS = Counter(
+    "remodelai_llm_tokens_total",
+    "LLM tokens by call site and kind (prompt/completion).",
+    ["site", "kind"],
+)
+
+CACHE_REQUESTS = Counter(
+    "remodelai_cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss).",
+    ["cache", "result"],
+)
+
+CONTEXT_IO_PER_REQUEST = Histogram(
+    "remodelai_context_io_per_request",
+    "Conversation-context store reads/writes per request (op=load/save).",
+    ["op"],
+    buckets=(0, 1, 2, 3, 4, 6, 10),
+)
+
+MEMORY_STORE_ENTRIES = Gauge(
+    "remodelai_memory_store_entries",
+    "Entries held by each in-process MemoryStore.",
+    ["store"],
+)
+MEMORY_STORE_BYTES = Gauge(
+    "remodelai_memory_store_bytes",
+    "Approximate bytes held by each in-process MemoryStore.",
+    ["store"],
+)
+MEMORY_STORE_EVICTIONS = Counter(
+    "remodelai_memory_store_evictions_total",
+    "MemoryStore removals by reason (lru = over budget, expired = TTL).",
+    ["store", "reason"],
+)
+
+ACTIVE_SESSIONS = Gauge(
+    "remodelai_active_sessions",
+    "Conversation sessions with a chat turn in the last ACTIVE_SESSION_WINDOW seconds (per worker).",
+)
+CHAT_TURNS_IN_FLIGHT = Gauge(
+    "remodelai_chat_turns_in_flight",
+    "Chat turns currently being answered by the RAG service.",
+)
+
+PDF_RENDER_QUEUE_DEPTH = Gauge(
+    "remodelai_pdf_render_queue_depth",
+    "PDF renders admitted to the render pool and not yet finished (queued + rendering).",
+)
+PDF_RENDER_SECONDS = Histogram(
+    "remodelai_pdf_render_seconds",
+    "PDF render time in a render-pool worker (phase=render) and including queueing (phase=total).",
+    ["phase"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+PDF_RENDER_REJECTIONS = Counter(
+    "remodelai_pdf_render_rejections_total",
+    "PDF renders refused by reason (queue_full = 429, unavailable = 503).",
+    ["reason"],
+)
+
+EXPORT_STORE_BYTES = Gauge(
+    "remodelai_export_store_bytes",
+    "Bytes of rendered exports held on disk by the export store.",
+)
+EXPORT_STORE_FILES = Gauge(
+    "remodelai_export_store_files",
+    "Rendered export files held on disk by the export store.",
+)
+EXPORT_STORE_EVICTIONS = Counter(
+    "remodelai_export_store_evictions_total",
+    "Export files removed by reason (lru = over budget, expired = TTL).",
+    ["reason"],
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "remodelai_event_loop_lag_seconds",
+    "Delay between a scheduled wake-up and the event loop running it.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+# ───────────────────────────────────────────────────────────────────────────
+#  Helpers
+# ───────────────────────────────────────────────────────────────────────────
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """Time the enclosed block into ``RAG_STAGE_LATENCY{stage=...}``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        RAG_STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+
+class ActiveSessions:
+    """
+    Sessions seen within the last *window* seconds, for ``ACTIVE_SESSIONS``.
+    Kept in last-seen order, so expiring idle sessions only looks at the
+    oldest entries.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._last_seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()  # the gauge is read from the scrape thread
+
+    def seen(self, session_id: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._last_seen[session_id] = now
+            self._last_seen.move_to_end(session_id)
+            self._expire(now)
+
+    def count(self) -> int:
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._last_seen)
+
+    def _expire(self, now: float) -> None:
+        while self._last_seen:
+            session_id, last = next(iter(self._last_seen.items()))
+            if last + self.window > now:
+                return
+            del self._last_seen[session_id]
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count a hit or miss for the named cache."""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_llm_call(site: str, token_usage: Optional[Dict[str, Any]] = None) -> None:
+    """Count one LLM call and, when the provider reports it, its token usage."""
+    LLM_CALLS.labels(site).inc()
+    if not token_usage:
+        return
+    prompt = token_usage.get("prompt_tokens")
+    completion = token_usage.get("completion_tokens")
+    if prompt:
+        LLM_TOKENS.labels(site, "prompt").inc(prompt)
+    if completion:
+        LLM_TOKENS.labels(site, "completion").inc(completion)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """
+    Background task: sleep for *interval* and record how late we woke up.
+    Started from the app lifespan and cancelled on shutdown.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - expected))
@@ -0,0 +1,173 @@
+# services/pdf_render.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+ReportLab rendering of the estimate report, straight to bytes.
+
+Kept free of app imports (config, state backend, metrics) because it runs in
+the render pool's worker processes (services/render_pool.py), which import
+only this module.  Output is deterministic (ReportLab ``invariant`` mode, the
+report date passed in), so the same inputs always give the same bytes –
+exports are cached and served under a hash of their inputs.
+
+Everything that does not depend on the estimate – the stylesheet, paragraph
+and table styles, the title and section headings, the footer – is built once
+per process (``ReportTemplate``); a render only creates the per-estimate
+paragraphs and tables.  See scripts/benchmarks/pdf_render.py.
+"""
+from __future__ import annotations
+
+import io
+
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import (
+    SimpleDocTemplate,
+    Table,
+    TableStyle,
+    Paragraph,
+    Spacer,
+)
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Low-level PDF generator (sync)
+# ────────────────────────────────────────────────────────────────────────────
+# Bump whenever the layout below changes: it is part of every export's cache key
+TEMPLATE_VERSION = 2
+
+# Streams are already zlib-compressed; skip the extra ASCII85 pass (pure
+# Python without rl_accel, ~10% of a render).  This module only runs in
+# render workers, so the global setting affects nothing else.
+rl_config.useA85 = 0
+
+BRAND_GREEN = colors.HexColor("#10B981")
+_FOOTER_LINES = (
+    "Generated by RemodelAI - AI-Powered Construction Estimates",
+    "Estimates are approximations based on historical data",
+    "Valid for 30 days from generation date",
+)
+
+
+class ReportTemplate:
+    """The static parts of the estimate report, prepared once and reused by every render."""
+
+    def __init__(self):
+        styles = getSampleStyleSheet()
+        self.normal = styles["Normal"]
+
+        # ---------- Title ----------
+        title_style = ParagraphStyle(
+            "CustomTitle",
+            parent=styles["Heading1"],
+            fontSize=24,
+            textColor=BRAND_GREEN,
+            spaceAfter=30,
+            alignment=1,  # center
+        )
+        self.title = Paragraph("RemodelAI Cost Estimate", title_style)
+
+        # ---------- Section headings ----------
+        self.cost_heading = Paragraph("Cost Summary", styles["Heading2"])
+        self.breakdown_heading = Paragraph("Cost Breakdown", styles["Heading2"])
+        self.timeline_heading = Paragraph("Project Timeline", styles["Heading2"])
+
+        # ---------- Tables ----------
+        self.table_style = TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), BRAND_GREEN),
+                ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("FONTSIZE", (0, 0), (-1, 0), 12),
+                ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
+                ("GRID", (0, 0), (-1, -1), 1, colors.grey),
+            ]
+        )
+
+        # ---------- Footer ----------
+        footer_style = ParagraphStyle(
+            "Footer",
+            parent=styles["Normal"],
+            fontSize=10,
+            textColor=colors.grey,
+            alignment=1,  # centered
+        )
+        self.footer = [Spacer(1, 1 * inch)] + [Paragraph(line, footer_style) for line in _FOOTER_LINES]
+
+    def _table(self, rows, col_widths) -> Table:
+        table = Table(rows, colWidths=col_widths)
+        table.setStyle(self.table_style)
+        return table
+
+    def story(self, estimate_id: str, estimate_data: dict, include_breakdown: bool,
+              report_date: str) -> list:
+        story = [self.title, Spacer(1, 0.5 * inch)]
+
+        # ---------- Estimate meta ----------
+        story.append(Paragraph(f"Estimate ID: {estimate_id}", self.normal))
+        story.append(Paragraph(f"Date: {report_date}", self.normal))
+        story.append(Spacer(1, 0.3 * inch))
+
+        # ---------- Cost summary ----------
+        story.append(self.cost_heading)
+        story.append(self._table([
+            ["Item", "Amount"],
+            ["Total Estimate", f"${estimate_data['total_cost']:,.0f}"],
+            ["Low Range", f"${estimate_data['cost_range_low']:,.0f}"],
+            ["High Range", f"${estimate_data['cost_range_high']:,.0f}"],
+            ["Confidence Score", f"{estimate_data['confidence_score']*100:.0f}%"],
+        ], [3 * inch, 2 * inch]))
+        story.append(Spacer(1, 0.5 * inch))
+
+        # ---------- Cost breakdown ----------
+        if include_breakdown:
+            breakdown = estimate_data["cost_breakdown"]
+            story.append(self.breakdown_heading)
+            story.append(self._table([
+                ["Category", "Amount", "Percentage"],
+                ["Materials", f"${breakdown['materials']:,.0f}", "40%"],
+                ["Labor", f"${breakdown['labor']:,.0f}", "35%"],
+                ["Permits", f"${breakdown['permits']:,.0f}", "5%"],
+                ["Other", f"${breakdown['other']:,.0f}", "20%"],
+            ], [2 * inch, 2 * inch, 1.5 * inch]))
+            story.append(Spacer(1, 0.5 * inch))
+
+        # ---------- Timeline ----------
+        timeline = estimate_data["timeline"]
+        story.append(self.timeline_heading)
+        story.append(self._table([
+            ["Phase", "Duration"],
+            ["Planning", f"{timeline['planning_days']} days"],
+            ["Permits", f"{timeline['permit_days']} days"],
+            ["Construction", f"{timeline['construction_days']} days"],
+            ["Total", f"{timeline['total_days']} days"],
+        ], [3 * inch, 2 * inch]))
+        story.append(Spacer(1, 0.5 * inch))
+
+        story.extend(self.footer)
+        return story
+
+    def render(self, estimate_id: str, estimate_data: dict, include_breakdown: bool,
+               report_date: str) -> bytes:
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter, invariant=1)
+        doc.build(self.story(estimate_id, estimate_data, include_breakdown, report_date))
+        return buffer.getvalue()
+
+
+_template: "ReportTemplate | None" = None
+
+
+def render_pdf(estimate_id: str, estimate_data: dict, include_breakdown: bool,
+               report_date: str) -> bytes:
+    """
+    Render the report in memory — **blocking / synchronous**; called in a
+    render-pool worker process, never on the event loop.
+    """
+    global _template
+    if _template is None:
+        _template = ReportTemplate()
+    return _template.render(estimate_id, estimate_data, include_breakdown, report_date)
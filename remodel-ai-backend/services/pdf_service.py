@@ -1,283 +1,312 @@
 from __future__ import annotations
 
-import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
 import logging
-from typing import Optional, Dict
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple, Union
 from datetime import datetime
 
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import (
-    SimpleDocTemplate,
-    Table,
-    TableStyle,
-    Paragraph,
-    Spacer,
-)
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-
-from config import estimates_cache
+from config import settings
+from services.estimate_store import get_estimate_store
+from services.export_store import ExportFile, get_export_store
+from services.memory_store import MemoryStore
+from services.pdf_render import TEMPLATE_VERSION, render_pdf
+from services.render_pool import RenderQueueFull, RenderSlot, get_render_pool
+from services.state_backend import get_state_backend
 
 logger = logging.getLogger(__name__)
 
 # ────────────────────────────────────────────────────────────────────────────
-#  Very small in-memory cache  (keeps the 10 most-recent PDFs)
+#  Content-addressed export cache
+#
+#  An export is identified by a hash of everything that shapes the PDF
+#  (estimate content, options, report date, template version), so changing
+#  an option can never return another variant.  Rendered bytes live in a
+#  byte-bounded in-process LRU, backed by the disk export store
+#  (export_store.py: byte budget, expiry, refcounted downloads).  The export
+#  record (the render inputs) lives in the shared state backend, so any
+#  worker can serve a download: a worker without the bytes re-renders them,
+#  which yields the identical file (rendering is deterministic).
 # ────────────────────────────────────────────────────────────────────────────
-_pdf_cache: Dict[str, str] = {}          # key = pdf_<estimate_id>, value = file-path
-_MAX_CACHE = 10
-
-
-def _evict_if_necessary() -> None:
-    """Keep the cache at ≤ _MAX_CACHE items (FIFO eviction)."""
-    if len(_pdf_cache) > _MAX_CACHE:
-        oldest_key = next(iter(_pdf_cache))
-        try:
-            os.remove(_pdf_cache[oldest_key])
-        except Exception:
-            pass
-        _pdf_cache.pop(oldest_key, None)
-
-
-# ────────────────────────────────────────────────────────────────────────────
-#  Low-level PDF generator (sync)
-# ────────────────────────────────────────────────────────────────────────────
-def _build_pdf_file(filepath: str, estimate_id: str, estimate_data: dict,
-                    include_breakdown: bool) -> None:
-    """
-    Build the PDF file on disk — **blocking / synchronous** helper.
-    """
-    doc = SimpleDocTemplate(filepath, pagesize=letter)
-    story = []
-
-    styles = getSampleStyleSheet()
-
-    # ---------- Title ----------
-    title_style = ParagraphStyle(
-        "CustomTitle",
-        parent=styles["Heading1"],
-        fontSize=24,
-        textColor=colors.HexColor("#10B981"),
-        spaceAfter=30,
-        alignment=1,  # center
-    )
-    story.append(Paragraph("RemodelAI Cost Estimate", title_style))
-    story.append(Spacer(1, 0.5 * inch))
-
-    # ---------- Estimate meta ----------
-    story.append(Paragraph(f"Estimate ID: {estimate_id}", styles["Normal"]))
-    story.append(
-        Paragraph(f"Date: {datetime.now().strftime('%B %d, %Y')}", styles["Normal"])
-    )
-    story.append(Spacer(1, 0.3 * inch))
-
-    # ---------- Cost summary ----------
-    story.append(Paragraph("Cost Summary", styles["Heading2"]))
-    cost_data = [
-        ["Item", "Amount"],
-        ["Total Estimate", f"${estimate_data['total_cost']:,.0f}"],
-        ["Low Range", f"${estimate_data['cost_range_low']:,.0f}"],
-        ["High Range", f"${estimate_data['cost_range_high']:,.0f}"],
-        ["Confidence Score", f"{estimate_data['confidence_score']*100:.0f}%"],
-    ]
-    cost_table = Table(cost_data, colWidths=[3 * inch, 2 * inch])
-    cost_table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#10B981")),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("FONTSIZE", (0, 0), (-1, 0), 12),
-                ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                ("GRID", (0, 0), (-1, -1), 1, colors.grey),
-            ]
-        )
-    )
-    story.append(cost_table)
-    story.append(Spacer(1, 0.5 * inch))
-
-    # ---------- Cost breakdown ----------
-    if include_breakdown:
-        story.append(Paragraph("Cost Breakdown", styles["Heading2"]))
-        breakdown_data = [
-            ["Category", "Amount", "Percentage"],
-            ["Materials", f"${estimate_data['cost_breakdown']['materials']:,.0f}", "40%"],
-            ["Labor", f"${estimate_data['cost_breakdown']['labor']:,.0f}", "35%"],
-            ["Permits", f"${estimate_data['cost_breakdown']['permits']:,.0f}", "5%"],
-            ["Other", f"${estimate_data['cost_breakdown']['other']:,.0f}", "20%"],
-        ]
-        breakdown_table = Table(breakdown_data, colWidths=[2 * inch, 2 * inch, 1.5 * inch])
-        breakdown_table.setStyle(
-            TableStyle(
-                [
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#10B981")),
-                    ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                    ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("FONTSIZE", (0, 0), (-1, 0), 12),
-                    ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                    ("GRID", (0, 0), (-1, -1), 1, colors.grey),
-                ]
+EXPORT_NAMESPACE = "export"               # export key -> record with render inputs
+LATEST_NAMESPACE = "export_latest"        # estimate_id -> most recent export key
+JOB_NAMESPACE = "export_job"
+_BULK_RETRY = 0.2                         # seconds a bulk render waits for a free slot
+
+_pdf_cache = MemoryStore("pdf", max_bytes=settings.pdf_cache_max_bytes,
+                         shards=settings.memory_store_shards)
+_rendering: Dict[str, asyncio.Future] = {}   # export key -> render in progress
+_jobs: Set[asyncio.Task] = set()             # running export jobs (kept referenced)
+
+# Generic placeholder data when the estimate no longer exists
+_PLACEHOLDER_ESTIMATE = {
+    "total_cost": 50_000,
+    "cost_range_low": 45_000,
+    "cost_range_high": 55_000,
+    "confidence_score": 0.85,
+    "cost_breakdown": {
+        "materials": 20_000,
+        "labor": 17_500,
+        "permits": 2_500,
+        "other": 10_000,
+    },
+    "timeline": {
+        "planning_days": 14,
+        "permit_days": 30,
+        "construction_days": 60,
+        "total_days": 104,
+    },
+}
+
+
+def _report_date(estimate_data: dict) -> str:
+    """The estimate's own creation date (today for the placeholder)."""
+    try:
+        created = datetime.fromisoformat(estimate_data["created_at"])
+    except (KeyError, TypeError, ValueError):
+        created = datetime.now()
+    return created.strftime("%B %d, %Y")
+
+
+def _render_inputs(estimate_id: str, estimate_data: dict, include_breakdown: bool,
+                   include_similar_projects: bool) -> Dict[str, Any]:
+    return {
+        "estimate_id": estimate_id,
+        "estimate_data": estimate_data,
+        "include_breakdown": include_breakdown,
+        "include_similar_projects": include_similar_projects,
+        "report_date": _report_date(estimate_data),
+        "template": TEMPLATE_VERSION,
+    }
+
+
+def export_key(inputs: Dict[str, Any]) -> str:
+    """Content address of an export: hash of its canonical render inputs."""
+    canonical = json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+async def _render(key: str, inputs: Dict[str, Any], slot: Optional[RenderSlot] = None) -> bytes:
+    """Bytes for *inputs*: cached (memory, then disk), joined to an identical render in flight, or rendered now."""
+    data = _pdf_cache.get(key)
+    if data is not None or key in _rendering:
+        if slot is not None:
+            slot.release()
+        return data if data is not None else await asyncio.shield(_rendering[key])
+
+    future = asyncio.get_running_loop().create_future()
+    _rendering[key] = future
+    try:
+        data = await asyncio.to_thread(get_export_store().read, key)
+        if data is not None:
+            if slot is not None:
+                slot.release()
+        else:
+            data = await get_render_pool().run(
+                render_pdf, inputs["estimate_id"], inputs["estimate_data"],
+                inputs["include_breakdown"], inputs["report_date"], slot=slot,
             )
-        )
-        story.append(breakdown_table)
-        story.append(Spacer(1, 0.5 * inch))
-
-    # ---------- Timeline ----------
-    story.append(Paragraph("Project Timeline", styles["Heading2"]))
-    timeline_data = [
-        ["Phase", "Duration"],
-        ["Planning", f"{estimate_data['timeline']['planning_days']} days"],
-        ["Permits", f"{estimate_data['timeline']['permit_days']} days"],
-        ["Construction", f"{estimate_data['timeline']['construction_days']} days"],
-        ["Total", f"{estimate_data['timeline']['total_days']} days"],
-    ]
-    timeline_table = Table(timeline_data, colWidths=[3 * inch, 2 * inch])
-    timeline_table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#10B981")),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("FONTSIZE", (0, 0), (-1, 0), 12),
-                ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                ("GRID", (0, 0), (-1, -1), 1, colors.grey),
-            ]
-        )
-    )
-    story.append(timeline_table)
-    story.append(Spacer(1, 0.5 * inch))
-
-    # ---------- Footer ----------
-    footer_style = ParagraphStyle(
-        "Footer",
-        parent=styles["Normal"],
-        fontSize=10,
-        textColor=colors.grey,
-        alignment=1,  # centered
-    )
-    story.append(Spacer(1, 1 * inch))
-    story.append(
-        Paragraph("Generated by RemodelAI - AI-Powered Construction Estimates", footer_style)
-    )
-    story.append(
-        Paragraph("Estimates are approximations based on historical data", footer_style)
-    )
-    story.append(
-        Paragraph("Valid for 30 days from generation date", footer_style)
-    )
-
-    # Build the PDF
-    doc.build(story)
-
-
-# ────────────────────────────────────────────────────────────────────────────
-#  Public helper with caching
-# ────────────────────────────────────────────────────────────────────────────
-def generate_pdf(
-    estimate_id: str,
-    estimate_data: dict,
-    export_dir: str = "exports",
-    include_breakdown: bool = True,
-    force_regenerate: bool = False,
-) -> str:
-    """
-    Generate (or fetch cached) PDF for an estimate.
-
-    Returns the **file path** to the PDF on disk.
-    """
-    cache_key = f"pdf_{estimate_id}"
-
-    # Return cached version if allowed
-    if not force_regenerate and cache_key in _pdf_cache and os.path.exists(_pdf_cache[cache_key]):
-        logger.info(f"Using cached PDF for estimate {estimate_id}")
-        return _pdf_cache[cache_key]
-
-    # Ensure export directory exists
-    os.makedirs(export_dir, exist_ok=True)
-    filepath = os.path.join(export_dir, f"{estimate_id}.pdf")
-
-    # Build the PDF
-    _build_pdf_file(filepath, estimate_id, estimate_data, include_breakdown)
-
-    # Store in cache and evict if necessary
-    _pdf_cache[cache_key] = filepath
-    _evict_if_necessary()
-
-    logger.info(f"Generated new PDF for estimate {estimate_id}")
-    return filepath
+            try:
+                await asyncio.to_thread(get_export_store().put, key, data)
+            except OSError as e:  # the disk tier is an optimisation; serve from memory
+                logger.warning(f"Could not store export {key} on disk: {str(e)}")
+        _pdf_cache.set(key, data, ttl=settings.export_ttl)
+        future.set_result(data)
+        return data
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved: there may be no other waiter
+        raise
+    finally:
+        _rendering.pop(key, None)
 
 
 # ════════════════════════════════════════════════════════════════════════════
-#  PDFService class  (uses the helper above)
+#  PDFService class  (uses the helpers above)
 # ════════════════════════════════════════════════════════════════════════════
 class PDFService:
-    def __init__(self):
-        self.export_dir = "exports"
-        os.makedirs(self.export_dir, exist_ok=True)
-
     async def generate_estimate_pdf(
         self,
         estimate_id: str,
         include_breakdown: bool = True,
         include_similar_projects: bool = True,  # placeholder for future use
-    ) -> str:
+        slot: Optional[RenderSlot] = None,
+    ) -> Dict[str, Any]:
         """
-        Generate or fetch a PDF report for an estimate.
+        Generate or fetch a PDF report for an estimate; returns the export
+        record, whose ``key`` addresses this exact variant for downloads.
 
-        If the specified estimate_id is not found in the cache, the service
+        If the specified estimate_id is not found in the store, the service
         creates a generic/sample estimate so the user still receives a PDF.
+        Rendering runs in the render pool – in *slot* if the caller already
+        reserved one – and raises RenderQueueFull / RenderUnavailable when
+        the pool cannot take it.
         """
         try:
             # ── Retrieve estimate data (with graceful fallback) ──────────
-            estimate_data = estimates_cache.get(estimate_id)
+            stored = await get_estimate_store().get(estimate_id)
+            estimate_data = json.loads(stored[0]) if stored else None
             if not estimate_data:
                 logger.warning(
-                    f"Estimate {estimate_id} not found in cache; "
+                    f"Estimate {estimate_id} not found in store; "
                     "generating generic PDF report."
                 )
-                # Generic placeholder data
-                estimate_data = {
-                    "total_cost": 50_000,
-                    "cost_range_low": 45_000,
-                    "cost_range_high": 55_000,
-                    "confidence_score": 0.85,
-                    "cost_breakdown": {
-                        "materials": 20_000,
-                        "labor": 17_500,
-                        "permits": 2_500,
-                        "other": 10_000,
-                    },
-                    "timeline": {
-                        "planning_days": 14,
-                        "permit_days": 30,
-                        "construction_days": 60,
-                        "total_days": 104,
-                    },
-                }
-
-            # ── Generate (or fetch) cached PDF ──────────────────────────
-            pdf_path = generate_pdf(
-                estimate_id=estimate_id,
-                estimate_data=estimate_data,
-                export_dir=self.export_dir,
-                include_breakdown=include_breakdown,
-                force_regenerate=False,
-            )
-            return pdf_path
+                estimate_data = _PLACEHOLDER_ESTIMATE
+
+            inputs = _render_inputs(estimate_id, estimate_data, include_breakdown, include_similar_projects)
+            key = export_key(inputs)
+
+            # ── Render (or fetch) the cached PDF ────────────────────────
+            data = await _render(key, inputs, slot)
+
+            record = {"key": key, "estimate_id": estimate_id, "size": len(data),
+                      "modified": time.time(), "inputs": inputs}
+            await get_state_backend().write_batch(items=[
+                (EXPORT_NAMESPACE, key, json.dumps(record).encode(), settings.export_ttl),
+                (LATEST_NAMESPACE, estimate_id, key.encode(), settings.export_ttl),
+            ])
+            return record
 
         except Exception as e:
+            if slot is not None:
+                slot.release()
             logger.error(f"Error generating PDF: {str(e)}", exc_info=True)
             raise
 
-    # ---------------------------------------------------------------------
-    def get_export_path(self, estimate_id: str) -> Optional[str]:
-        """Return the full file path for a previously generated PDF."""
-        cache_key = f"pdf_{estimate_id}"
-        if cache_key in _pdf_cache and os.path.exists(_pdf_cache[cache_key]):
-            return _pdf_cache[cache_key]
+    # ── bulk rendering ────────────────────────────────────────────────────
+    async def render_many(
+        self,
+        estimates: AsyncIterator[Tuple[str, Optional[bytes]]],
+        include_breakdown: bool = True,
+    ) -> AsyncIterator[Tuple[str, Union[bytes, str]]]:
+        """
+        PDFs for (estimate_id, stored JSON) pairs, in order: (estimate_id,
+        bytes), or (estimate_id, error message) for a missing estimate or a
+        failed render.  At most ``pdf_render_workers`` renders are in flight,
+        so a bulk export never fills the queue interactive exports use.
+        """
+        window = max(1, settings.pdf_render_workers)
+        pending: deque = deque()
+        try:
+            async for estimate_id, data in estimates:
+                if data is None:
+                    pending.append((estimate_id, None))
+                else:
+                    task = asyncio.ensure_future(self._render_stored(estimate_id, json.loads(data), include_breakdown))
+                    pending.append((estimate_id, task))
+                while len(pending) > window or (pending and pending[0][1] is None):
+                    yield await self._next_rendered(pending)
+            while pending:
+                yield await self._next_rendered(pending)
+        finally:
+            for _, task in pending:
+                if task is not None:
+                    task.cancel()
+
+    @staticmethod
+    async def _next_rendered(pending: deque) -> Tuple[str, Union[bytes, str]]:
+        estimate_id, task = pending.popleft()
+        if task is None:
+            return estimate_id, "not found"
+        try:
+            return estimate_id, await task
+        except Exception as e:
+            logger.error(f"Bulk render of {estimate_id} failed: {str(e)}")
+            return estimate_id, str(e) or type(e).__name__
+
+    async def _render_stored(self, estimate_id: str, estimate_data: dict, include_breakdown: bool) -> bytes:
+        inputs = _render_inputs(estimate_id, estimate_data, include_breakdown, True)
+        key = export_key(inputs)
+        if key in _pdf_cache or key in _rendering:
+            return await _render(key, inputs)
+        while True:  # wait for room rather than failing the whole export
+            try:
+                slot = get_render_pool().reserve()
+                break
+            except RenderQueueFull:
+                await asyncio.sleep(_BULK_RETRY)
+        return await _render(key, inputs, slot)
+
+    # ── async export jobs ─────────────────────────────────────────────────
+    async def start_export_job(
+        self,
+        estimate_id: str,
+        include_breakdown: bool = True,
+        include_similar_projects: bool = True,
+    ) -> str:
+        """
+        Queue a PDF export and return a job id to poll (``get_job``).  The
+        render slot is reserved up front, so a full queue is refused now
+        (RenderQueueFull) rather than reported later as a failed job.
+        """
+        slot = get_render_pool().reserve()
+        job_id = f"job_{uuid.uuid4().hex[:12]}"
+        try:
+            await self._set_job(job_id, {"status": "pending", "estimate_id": estimate_id})
+        except Exception:
+            slot.release()
+            raise
+        task = asyncio.create_task(
+            self._run_job(job_id, estimate_id, include_breakdown, include_similar_projects, slot)
+        )
+        _jobs.add(task)
+        task.add_done_callback(_jobs.discard)
+        return job_id
 
-        filepath = os.path.join(self.export_dir, f"{estimate_id}.pdf")
-        return filepath if os.path.exists(filepath) else None
+    async def _run_job(self, job_id, estimate_id, include_breakdown, include_similar_projects, slot) -> None:
+        try:
+            record = await self.generate_estimate_pdf(
+                estimate_id, include_breakdown, include_similar_projects, slot=slot
+            )
+            job = {"status": "done", "estimate_id": estimate_id, "key": record["key"]}
+        except Exception as e:
+            job = {"status": "failed", "estimate_id": estimate_id, "error": str(e) or type(e).__name__}
+        finally:
+            slot.release()
+        await self._set_job(job_id, job)
+
+    async def _set_job(self, job_id: str, job: Dict[str, Any]) -> None:
+        await get_state_backend().set(JOB_NAMESPACE, job_id, json.dumps(job).encode(),
+                                      ttl=settings.pdf_job_ttl)
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status of an export job (pending / done / failed); any worker can answer."""
+        raw = await get_state_backend().get(JOB_NAMESPACE, job_id)
+        return json.loads(raw) if raw else None
+
+    # ── downloads ─────────────────────────────────────────────────────────
+    async def get_export_info(self, estimate_id: str, key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Export record for *key* (default: the estimate's latest export)."""
+        backend = get_state_backend()
+        if key is None:
+            latest = await backend.get(LATEST_NAMESPACE, estimate_id)
+            if not latest:
+                return None
+            key = latest.decode()
+        raw = await backend.get(EXPORT_NAMESPACE, key)
+        record = json.loads(raw) if raw else None
+        if not record or record["estimate_id"] != estimate_id:
+            return None
+        return record
+
+    async def get_export_bytes(self, record: Dict[str, Any]) -> bytes:
+        """The PDF bytes – from this worker's caches, else re-rendered (identically)."""
+        return await _render(record["key"], record["inputs"])
+
+    async def open_export(self, record: Dict[str, Any]) -> Union[bytes, ExportFile]:
+        """
+        The PDF for a download: bytes from the memory cache, else the disk
+        file held (``ExportFile``; release it when the response is done) so
+        it cannot be deleted mid-stream, else re-rendered bytes.
+        """
+        data = _pdf_cache.get(record["key"])
+        if data is not None:
+            return data
+        held = get_export_store().acquire(record["key"])
+        if held is not None:
+            return held
+        return await _render(record["key"], record["inputs"])
@@ -7,6 +7,7 @@ import asyncio
 import aiohttp
 import logging
 import re
+import time
 
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
@@ -17,11 +18,21 @@ from langchain.prompts import (
     SystemMessagePromptTemplate,
     HumanMessagePromptTemplate,
 )
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, HumanMessage
 from pinecone import Pinecone as PineconeClient
 
 from config import settings
-from services.context_manager import ContextManager
+from services.context_manager import ContextManager, SessionState
 from services.city_mappings import normalize_location
+from services.metrics import (
+    ACTIVE_SESSIONS,
+    CHAT_TURNS_IN_FLIGHT,
+    ActiveSessions,
+    RAG_STAGE_LATENCY,
+    observe_stage,
+    record_llm_call,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +42,89 @@ logger = logging.getLogger(__name__)
 _instance: "RAGService | None" = None  # module-level handle (debug only)
 
 
+# ───────────────────────────────────────────────────────────────────────────
+#  METRICS PLUMBING
+# ───────────────────────────────────────────────────────────────────────────
+class _TimedEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings that reports query-embedding latency as the "embed" stage."""
+
+    def embed_query(self, text: str) -> List[float]:
+        with observe_stage("embed"):
+            return super().embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        with observe_stage("embed"):
+            return await super().aembed_query(text)
+
+
+class _StageMetricsHandler(BaseCallbackHandler):
+    """
+    Maps the callback events of one ConversationalRetrievalChain run onto
+    the condense / retrieve / llm_answer stage histograms and LLM counters.
+
+    The condense LLMChain is a direct child of the retrieval chain while the
+    answer LLMChain sits under StuffDocumentsChain, which is how the two LLM
+    calls are told apart.
+    """
+
+    run_inline = True  # cheap bookkeeping – no need for an executor hop
+
+    def __init__(self):
+        self._chains: Dict[Any, Tuple[str, Any]] = {}   # run_id → (name, parent_run_id)
+        self._started: Dict[Any, Tuple[str, float]] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("id", [""])[-1]
+        self._chains[run_id] = (name, parent_run_id)
+
+    def _llm_stage(self, parent_run_id) -> str:
+        parent = self._chains.get(parent_run_id)
+        grandparent = self._chains.get(parent[1]) if parent else None
+        if grandparent and grandparent[0] == "StuffDocumentsChain":
+            return "llm_answer"
+        return "condense"
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._started[run_id] = (self._llm_stage(parent_run_id), time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._started[run_id] = (self._llm_stage(parent_run_id), time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        stage, start = self._started.pop(run_id, (None, 0.0))
+        if stage is None:
+            return
+        RAG_STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+        site = "answer" if stage == "llm_answer" else "condense"
+        record_llm_call(site, (response.llm_output or {}).get("token_usage"))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._started[run_id] = ("retrieve", time.perf_counter())
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        stage, start = self._started.pop(run_id, (None, 0.0))
+        if stage is not None:
+            RAG_STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+
+class _LLMCallMetrics(BaseCallbackHandler):
+    """Counts every LLM call made through the model it is attached to under one call site."""
+
+    run_inline = True
+
+    def __init__(self, site: str):
+        self.site = site
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        record_llm_call(self.site, (response.llm_output or {}).get("token_usage"))
+
+
 # ═══════════════════════════════════════════════════════════════════════════
 #  RAGService
 # ═══════════════════════════════════════════════════════════════════════════
@@ -53,7 +147,7 @@ class RAGService:
     # ────────────────────────────────────────────────────────────────────
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
-            print("Creating new RAGService instance")
+            logger.debug("Creating new RAGService instance")
             cls._instance = super().__new__(cls)
             cls._instance._initialized = False         # flag for __init__
         return cls._instance
@@ -64,25 +158,31 @@ class RAGService:
     def __init__(self):
         # Skip heavy init if we've already run it
         if getattr(self, "_initialized", False):
-            print("Using existing RAGService instance")
+            logger.debug("Using existing RAGService instance")
             return
 
-        print("Initializing RAG Service…")
+        logger.info("Initializing RAG Service…")
 
         # ── LLM & embeddings ────────────────────────────────────────────
-        self.llm = ChatOpenAI(
+        llm_options = dict(
             openai_api_key=settings.openai_api_key,
             model_name=settings.openai_model,
             temperature=0.3,
         )
-        self.embeddings = OpenAIEmbeddings(
+        self.llm = ChatOpenAI(**llm_options)
+        # the memory's summary updates, counted as their own LLM call site
+        self.summary_llm = ChatOpenAI(**llm_options, callbacks=[_LLMCallMetrics("summarize")])
+        self.embeddings = _TimedEmbeddings(
             openai_api_key=settings.openai_api_key,
             model=settings.embedding_model,
         )
 
-        # ── Context manager & session store ─────────────────────────────
+        # ── Context manager (owns the per-session state record) ─────────
         self.context_manager = ContextManager()
-        self.sessions: Dict[str, Dict[str, Any]] = {}
+        # sessions with a recent turn in this worker
+        self._active_sessions = ActiveSessions(settings.active_session_window)
+        ACTIVE_SESSIONS.set_function(self._active_sessions.count)
+        self._qa_chain: Optional[ConversationalRetrievalChain] = None
 
         # ── Shared aiohttp session ──────────────────────────────────────
         self.aiohttp_session: Optional[aiohttp.ClientSession] = None
@@ -95,9 +195,9 @@ class RAGService:
                 embedding=self.embeddings,
                 pinecone_api_key=settings.pinecone_api_key,
             )
-            print("Pinecone vector store initialized successfully")
+            logger.info("Pinecone vector store initialized successfully")
         except Exception as e:
-            print(f"Warning: Could not initialize Pinecone: {e}")
+            logger.warning("Could not initialize Pinecone: %s", e)
             self.vector_store = None
 
         # Mark the singleton as fully initialised
@@ -134,43 +234,80 @@ class RAGService:
     # ═══════════════════════════════════════════════════════════════════
     #  Session helpers
     # ═══════════════════════════════════════════════════════════════════
-    def get_or_create_session(self, session_id: str) -> Dict[str, Any]:
-        context = self.context_manager.get_or_create_context(session_id)
-        key = f"session_{session_id}"
-
-        if key not in self.sessions:
-            memory = ConversationSummaryBufferMemory(
-                llm=self.llm,
-                max_token_limit=500,
-                memory_key="chat_history",
-                return_messages=True,
-                output_key="answer",
-            )
-            qa_chain = self._create_qa_chain(memory, session_id=session_id)
-            self.sessions[key] = {"memory": memory, "qa_chain": qa_chain}
-            self.context_manager.save_context(session_id, context)
-
+    async def get_or_create_session(self, session_id: str) -> Dict[str, Any]:
+        """
+        This turn's view of a session.  LangChain memory is rebuilt from the
+        shared SessionState (running summary + message tail) instead of
+        being cached per session in this process.
+        """
+        state = await self.context_manager.get_state(session_id)
         return {
-            "memory": self.sessions[key]["memory"],
-            "qa_chain": self.sessions[key]["qa_chain"],
-            "context": context,
-            "conversation_summary": context.conversation_summary,
+            "state": state,
+            "memory": self._memory_view(state),
+            "context": state.context,
+            "conversation_summary": state.context.conversation_summary,
         }
 
+    def _memory_view(self, state: SessionState) -> ConversationSummaryBufferMemory:
+        memory = ConversationSummaryBufferMemory(
+            llm=self.summary_llm,
+            max_token_limit=500,
+            memory_key="chat_history",
+            return_messages=True,
+            input_key="question",
+            output_key="answer",
+            moving_summary_buffer=state.summary,
+        )
+        memory.chat_memory.messages = [
+            HumanMessage(content=m["content"]) if m["role"] == "user"
+            else AIMessage(content=m["content"])
+            for m in state.tail
+        ]
+        return memory
+
+    @staticmethod
+    async def _save_memory(
+        state: SessionState, memory: ConversationSummaryBufferMemory, question: str, answer: str
+    ) -> None:
+        """
+        Add this exchange to the memory and write it back into the record.
+        Messages pruned for the token limit or falling outside the
+        ``history_window_pairs`` tail are folded into the running summary
+        (an LLM call, so run off the event loop) rather than dropped.
+        """
+        def save():
+            memory.save_context({"question": question}, {"answer": answer})  # prunes to max_token_limit
+            messages = memory.chat_memory.messages
+            overflow = len(messages) - 2 * settings.history_window_pairs
+            if overflow > 0:
+                dropped = messages[:overflow]
+                del messages[:overflow]
+                memory.moving_summary_buffer = memory.predict_new_summary(
+                    dropped, memory.moving_summary_buffer
+                )
+
+        with observe_stage("summarize"):
+            await asyncio.to_thread(save)
+        state.summary = memory.moving_summary_buffer
+        state.tail = [
+            {"role": "user" if isinstance(m, HumanMessage) else "assistant", "content": m.content}
+            for m in memory.chat_memory.messages
+        ]
+
     # ═══════════════════════════════════════════════════════════════════
     #  QA chain (context-aware prompt, simple retriever)
     # ═══════════════════════════════════════════════════════════════════
-    def _create_qa_chain(self, memory, session_id: Optional[str] = None):
+    async def _system_prompt(self, session_id: Optional[str] = None) -> str:
         # Fetch context to optionally append conversation summary
         context = (
-            self.context_manager.get_or_create_context(session_id)
+            await self.context_manager.get_or_create_context(session_id)
             if session_id
             else None
         )
 
         # 1) dynamic / fallback system prompt
         system_template = (
-            self.context_manager.get_system_prompt(session_id)
+            await self.context_manager.get_system_prompt(session_id)
             if session_id
             else (
                 "You are an expert AI construction cost advisor specializing in "
@@ -187,25 +324,33 @@ class RAGService:
                 f"\n\nIMPORTANT CONTEXT: {context.conversation_summary}\n\n"
                 "Keep this conversation history in mind when responding to the user."
             )
+        return system_template
 
-        # 2) prompt assembly
+    def _get_qa_chain(self) -> ConversationalRetrievalChain:
+        """
+        The chain is built once; per-turn inputs (system prompt, history)
+        are passed on each call, and memory is saved by _save_memory.
+        """
+        if self._qa_chain is not None:
+            return self._qa_chain
+
+        # 1) prompt assembly – the system prompt is an input, not template text
         chat_prompt = ChatPromptTemplate.from_messages(
             [
-                SystemMessagePromptTemplate.from_template(system_template),
+                SystemMessagePromptTemplate.from_template("{system_prompt}"),
                 HumanMessagePromptTemplate.from_template(
                     "Context from search: {context}\n\nQuestion: {question}"
                 ),
             ]
         )
 
-        # 3) simple retriever (top-3)
+        # 2) simple retriever (top-3)
         retriever = self.vector_store.as_retriever(search_kwargs={"k": 3})
 
-        # 4) chain
-        return ConversationalRetrievalChain.from_llm(
+        # 3) chain
+        self._qa_chain = ConversationalRetrievalChain.from_llm(
             llm=self.llm,
             retriever=retriever,
-            memory=memory,
             combine_docs_chain_kwargs={
                 "prompt": chat_prompt,
                 "document_separator": "\n",
@@ -214,6 +359,7 @@ class RAGService:
             return_source_documents=True,
             verbose=False,
         )
+        return self._qa_chain
 
     # ═══════════════════════════════════════════════════════════════════
     #  aiohttp helpers
@@ -227,6 +373,35 @@ class RAGService:
         if self.aiohttp_session and not self.aiohttp_session.closed:
             await self.aiohttp_session.close()
 
+    # ═══════════════════════════════════════════════════════════════════
+    #  Direct LLM call with per-site metrics
+    # ═══════════════════════════════════════════════════════════════════
+    async def _ainvoke_llm(self, prompt: str, site: str) -> str:
+        msg = await self.llm.ainvoke(prompt)
+        usage = (getattr(msg, "response_metadata", None) or {}).get("token_usage")
+        record_llm_call(site, usage)
+        return msg.content
+
+    # ═══════════════════════════════════════════════════════════════════
+    #  Stateless one-shot answer (internal callers)
+    # ═══════════════════════════════════════════════════════════════════
+    async def get_stateless_response(self, query: str, site: str) -> str:
+        """
+        Answer *query* from the knowledge base without a session: nothing is
+        read from or saved to the state backend.  Used for the estimate
+        narrative; the LLM call is counted under *site*.
+        """
+        docs = []
+        if self.vector_store:
+            with observe_stage("retrieve"):
+                docs = await self.vector_store.asimilarity_search(query, k=3)
+        search_context = "\n".join(doc.page_content for doc in docs)
+        prompt = (
+            f"{await self._system_prompt()}\n\n"
+            f"Context from search: {search_context}\n\nQuestion: {query}"
+        )
+        return await self._ainvoke_llm(prompt, site)
+
     # ═══════════════════════════════════════════════════════════════════
     #  Quick query-type detector
     # ═══════════════════════════════════════════════════════════════════
@@ -242,9 +417,8 @@ class RAGService:
     # ═══════════════════════════════════════════════════════════════════
     #  update_session_context  (improved location + price parsing)
     # ═══════════════════════════════════════════════════════════════════
-    def update_session_context(self, query: str, response: str, session_id: str):
-        # -------------- (contents unchanged from your original file) --------------
-        context = self.context_manager.get_or_create_context(session_id)
+    async def update_session_context(self, query: str, response: str, session_id: str):
+        context = await self.context_manager.get_or_create_context(session_id)
         ql, rl = query.lower(), response.lower()
         updates: Dict[str, Any] = {}
 
@@ -256,10 +430,10 @@ class RAGService:
                 "not in", "rather than", "project in", "property in"
             ])
             if not context.location or change_intent:
-                print(f"DEBUG: Updating location to {q_loc} based on user query")
+                logger.debug("Updating location to %s based on user query", q_loc)
                 updates["location"] = q_loc
             else:
-                print(f"DEBUG: Ignored location change to {q_loc} – no clear user intent")
+                logger.debug("Ignored location change to %s – no clear user intent", q_loc)
 
         # ── project type ────────────────────────────────────────────────
         proj_map = {
@@ -299,7 +473,7 @@ class RAGService:
                 if max(all_prices) >= 20_000:
                     thresh = max(all_prices) * 0.1
                     all_prices = [p for p in all_prices if p >= thresh]
-                    print(f"DEBUG: Filtered out budget outliers, using {len(all_prices)} significant prices")
+                    logger.debug("Filtered out budget outliers, using %s significant prices", len(all_prices))
 
                 min_price, max_price = min(all_prices), max(all_prices)
 
@@ -311,20 +485,20 @@ class RAGService:
                         new_min = min(curr_min, min_price)
                         new_max = max(curr_max, max_price)
                         updates["budget_range"] = {"min": new_min, "max": new_max}
-                        print(f"DEBUG: Updated budget range to ${new_min:,} - ${new_max:,}")
+                        logger.debug("Updated budget range to $%s - $%s", new_min, new_max)
                 else:
                     updates["budget_range"] = {"min": min_price, "max": max_price}
-                    print(f"DEBUG: Set initial budget range to ${min_price:,} - ${max_price:,}")
+                    logger.debug("Set initial budget range to $%s - $%s", min_price, max_price)
 
             elif len(all_prices) == 1 and not context.budget_range:
                 single_price = all_prices[0]
                 range_min = int(single_price * 0.85)
                 range_max = int(single_price * 1.15)
                 updates["budget_range"] = {"min": range_min, "max": range_max}
-                print(f"DEBUG: Created range from single price ${single_price:,} → ${range_min:,} - ${range_max:,}")
+                logger.debug("Created range from single price $%s → $%s - $%s", single_price, range_min, range_max)
 
         elif price_matches and not filtered_prices:
-            print("DEBUG: All prices < $1,000 filtered out; budget not updated")
+            logger.debug("All prices < $1,000 filtered out; budget not updated")
 
         # ── timeline (lightweight) ───────────────────────────────────────
         tl_match = re.search(r"(\d+)\s*(?:to|-)\s*(\d+)\s*weeks?", rl)
@@ -339,7 +513,7 @@ class RAGService:
         for k, v in updates.items():
             if hasattr(context, k):
                 setattr(context, k, v)
-        self.context_manager.save_context(session_id, context)
+        await self.context_manager.save_context(session_id, context)
 
     # -------------------------------------------------------------------
     #  Helper: build summary
@@ -363,7 +537,7 @@ class RAGService:
 
         if parts:
             summary = "Discussing " + " ".join(parts) + "."
-            print(f"DEBUG: Updated conversation summary: {summary}")
+            logger.debug("Updated conversation summary: %s", summary)
             return summary
         return ""
 
@@ -377,7 +551,7 @@ class RAGService:
         Single-pass validator; returns either the original response
         (if valid) or a corrected version from the LLM.
         """
-        context = self.context_manager.get_or_create_context(session_id)
+        context = await self.context_manager.get_or_create_context(session_id)
 
         # ── price consistency ──────────────────────────────────────────
         if context.discussed_prices and context.project_type:
@@ -394,7 +568,7 @@ class RAGService:
                         f"${knmn:,}–${knmx:,}. Original response:\n{response}\n\n"
                         f"Please restate the answer to keep it within that budget."
                     )
-                    return (await self.llm.ainvoke(prompt)).content
+                    return await self._ainvoke_llm(prompt, "validate")
 
         # ── timeline consistency (with replacement-only leniency) ──────
         if context.timeline:
@@ -419,7 +593,7 @@ class RAGService:
                             f"The timeline of {new_min}-{new_max} weeks is unrealistically short "
                             f"for this type of project. Please revise."
                         )
-                        return (await self.llm.ainvoke(prompt)).content
+                        return await self._ainvoke_llm(prompt, "validate")
 
                     valid = (
                         new_min >= curr_min * 0.5
@@ -430,7 +604,7 @@ class RAGService:
                             f"The timeline {new_min}-{new_max} weeks conflicts with the "
                             f"established timeline of {curr_min}-{curr_max} weeks. Please revise."
                         )
-                        return (await self.llm.ainvoke(prompt)).content
+                        return await self._ainvoke_llm(prompt, "validate")
 
         # ── price-inclusion guard ───────────────────────────────────────
         if any(k in query.lower() for k in ["cost", "price", "how much"]):
@@ -440,7 +614,7 @@ class RAGService:
                     f"Original response:\n{response}\n\n"
                     f"Please revise to include specific price ranges (in dollars)."
                 )
-                return (await self.llm.ainvoke(prompt)).content
+                return await self._ainvoke_llm(prompt, "validate")
 
         return response
 
@@ -462,7 +636,7 @@ class RAGService:
             return second_pass  # corrected successfully
 
         # Second attempt still invalid → fall back
-        print("DEBUG: Validation loop did not converge; returning original response")
+        logger.debug("Validation loop did not converge; returning original response")
         return original
 
     # ═══════════════════════════════════════════════════════════════════
@@ -471,18 +645,29 @@ class RAGService:
     async def get_chat_response(
         self,
         query: str,
-        chat_history: List[Tuple[str, str]],
         session_id: Optional[str] = None,
     ) -> Dict[str, Any]:
-        logger.info(f"Incoming query: {query}")
+        """
+        Answer *query* for *session_id*.  History comes from the session
+        record, which is loaded once and flushed once for the whole turn:
+        we join the caller's unit of work (ChatService opens one) or open
+        our own.
+        """
+        logger.debug("Incoming query: %s", query)
 
         if not session_id:
             session_id = str(uuid.uuid4())
-        logger.info(f"Session: {session_id}")
+        logger.debug("Session: %s", session_id)
+
+        self._active_sessions.seen(session_id)
+        with CHAT_TURNS_IN_FLIGHT.track_inprogress():
+            async with self.context_manager.unit_of_work(session_id):
+                return await self._answer(query, session_id)
 
+    async def _answer(self, query: str, session_id: str) -> Dict[str, Any]:
         await self._get_aiohttp_session()
 
-        session = self.get_or_create_session(session_id)
+        session = await self.get_or_create_session(session_id)
         context = session["context"]
 
         # greeting / off-topic
@@ -491,7 +676,7 @@ class RAGService:
                 f'You are a friendly RemodelAI assistant.\nUser said: "{query}"\n'
                 "Respond briefly, mentioning you can estimate remodel costs in San Diego or LA."
             )
-            msg = (await self.llm.ainvoke(friendly)).content
+            msg = await self._ainvoke_llm(friendly, "greeting")
             return {"message": msg, "source_documents": []}
 
         if not self.vector_store:
@@ -501,11 +686,12 @@ class RAGService:
             }
 
         try:
-            qa_chain = session["qa_chain"]
+            qa_chain = self._get_qa_chain()
+            memory = session["memory"]
 
             # ── language detection + instruction ────────────────────────
             user_lang = self.detect_language(query)
-            print(f"DEBUG: Detected user language: {user_lang}")
+            logger.debug("Detected user language: %s", user_lang)
 
             lang_instruction = {
                 "en": "Please respond in English.",
@@ -521,7 +707,15 @@ class RAGService:
             )
 
             # ── run chain ───────────────────────────────────────────────
-            result = await qa_chain.ainvoke({"question": enhanced_query})
+            result = await qa_chain.ainvoke(
+                {
+                    "question": enhanced_query,
+                    "chat_history": memory.load_memory_variables({})["chat_history"],
+                    "system_prompt": await self._system_prompt(session_id),
+                },
+                config={"callbacks": [_StageMetricsHandler()]},
+            )
+            await self._save_memory(session["state"], memory, enhanced_query, result.get("answer", ""))
 
             # ── language-aware document filtering (improved) ───────────
             raw_docs = result.get("source_documents", [])
@@ -536,13 +730,14 @@ class RAGService:
                 else:
                     filtered += 1
             if filtered:
-                print(f"DEBUG: Filtered {filtered} documents due to language/empty content")
+                logger.debug("Filtered %s documents due to language/empty content", filtered)
 
             # answer text
             answer = result.get("answer", "")
 
             # validate / self-correct (with fallback)
-            answer = await self._validate_and_correct_response(answer, session_id, query)
+            with observe_stage("validate"):
+                answer = await self._validate_and_correct_response(answer, session_id, query)
 
             # ── enhanced boilerplate removal ───────────────────────────
             boilerplate_patterns = [
@@ -564,7 +759,7 @@ class RAGService:
                 answer = f"**(Réponse en Français)**\n\n{answer}"
 
             # update context
-            self.update_session_context(query, answer, session_id)
+            await self.update_session_context(query, answer, session_id)
 
             return {
                 "message": answer,
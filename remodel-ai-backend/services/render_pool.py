@@ -0,0 +1,179 @@
+# services/render_pool.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+Bounded process pool for CPU-bound rendering (ReportLab PDFs).
+
+Rendering a report holds the GIL for tens of milliseconds; run on the event
+loop, a handful of concurrent exports stall every chat request in the
+worker.  Renders are submitted to a ``ProcessPoolExecutor`` instead, behind
+an admission check: at most ``pdf_render_workers`` renders run and
+``pdf_render_queue`` more wait.  Past that, ``RenderQueueFull`` carries a
+Retry-After estimate from the recent render times (the API answers 429);
+a crashed pool raises ``RenderUnavailable`` (503) and is rebuilt on the
+next submission.
+
+Workers are started with ``spawn`` so they never inherit the event loop,
+sockets or SQLite handles of the API process.
+"""
+import asyncio
+import logging
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, Tuple
+
+from config import settings
+from services.metrics import PDF_RENDER_QUEUE_DEPTH, PDF_RENDER_REJECTIONS, PDF_RENDER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFull(Exception):
+    """Every worker is busy and the queue is full – retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Render queue full; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RenderUnavailable(Exception):
+    """The render pool is broken or shut down."""
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RenderSlot:
+    """One admitted render; releasing it twice is harmless."""
+
+    __slots__ = ("_pool", "_held")
+
+    def __init__(self, pool: "RenderPool"):
+        self._pool = pool
+        self._held = True
+
+    def release(self) -> None:
+        if self._held:
+            self._held = False
+            self._pool._release()
+
+
+def _timed(fn: Callable, args: Tuple) -> Tuple[Any, float]:
+    """Runs in the worker: the result plus the time spent rendering it."""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class RenderPool:
+    """Process pool with a bounded admission queue and render-time bookkeeping."""
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.pending = 0                 # admitted: queued + rendering
+        self.avg_render = 0.5            # EWMA of render seconds, for Retry-After
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    # ─── admission ────────────────────────────────────────────────────────
+    def reserve(self) -> RenderSlot:
+        """Admit one render now (raising when full); hand the slot to ``run``."""
+        with self._lock:
+            if self._closed:
+                PDF_RENDER_REJECTIONS.labels("unavailable").inc()
+                raise RenderUnavailable("Render pool is shut down")
+            if self.pending >= self.workers + self.max_queue:
+                PDF_RENDER_REJECTIONS.labels("queue_full").inc()
+                raise RenderQueueFull(self.retry_after())
+            self.pending += 1
+        PDF_RENDER_QUEUE_DEPTH.inc()
+        return RenderSlot(self)
+
+    def _release(self) -> None:
+        with self._lock:
+            self.pending -= 1
+        PDF_RENDER_QUEUE_DEPTH.dec()
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: the queue ahead, drained by every worker."""
+        waves = (self.pending - self.workers + 1) / self.workers
+        return max(1, math.ceil(waves * self.avg_render))
+
+    # ─── execution ────────────────────────────────────────────────────────
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    async def run(self, fn: Callable, *args: Any, slot: Optional[RenderSlot] = None) -> Any:
+        """
+        Run ``fn(*args)`` in a worker process, in a slot reserved earlier or
+        admitted now.  ``fn`` must be a picklable, module-level function.
+        The slot is released when the worker finishes, even if the awaiting
+        request has gone away.
+        """
+        slot = slot or self.reserve()
+        started = time.perf_counter()
+        try:
+            future: Future = self._pool().submit(_timed, fn, args)
+        except (BrokenProcessPool, RuntimeError) as e:
+            slot.release()
+            self._reset()
+            PDF_RENDER_REJECTIONS.labels("unavailable").inc()
+            raise RenderUnavailable(f"Render pool unavailable: {e}") from e
+        future.add_done_callback(lambda _: slot.release())
+        try:
+            result, seconds = await asyncio.wrap_future(future)
+        except BrokenProcessPool as e:
+            self._reset()
+            PDF_RENDER_REJECTIONS.labels("unavailable").inc()
+            raise RenderUnavailable("A render worker died; the pool is being restarted") from e
+        self.avg_render = 0.8 * self.avg_render + 0.2 * seconds
+        PDF_RENDER_SECONDS.labels("render").observe(seconds)
+        PDF_RENDER_SECONDS.labels("total").observe(time.perf_counter() - started)
+        return result
+
+    def _reset(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool: Optional[RenderPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> RenderPool:
+    """Process-wide pool; worker processes start on the first render."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RenderPool(settings.pdf_render_workers, settings.pdf_render_queue)
+    return _pool
+
+
+def shutdown_render_pool() -> None:
+    """Stop the worker processes (app shutdown); a later render starts a new pool."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
@@ -1,65 +1,92 @@
-import redis
 import json
-from typing import Dict, Any, Optional
+from typing import Any, AsyncIterator, Dict, List, Tuple
 from config import settings
+from services.state_backend import AppendItem, get_state_backend
 import logging
 logger = logging.getLogger(__name__)
+HISTORY_NAMESPACE = "history"
 class SessionService:
+    """
+    Chat transcripts as append-only, capped lists in the shared state backend
+    (RPUSH/LTRIM on Redis, a ring buffer in memory).  A turn appends its two
+    messages instead of rewriting the transcript, and readers fetch only the
+    slice they need.
+    """
     def __init__(self):
-        # For now, use in-memory storage if Redis is not available
-        self.use_redis = False
-        self.memory_sessions = {}
+        # Sessions live in the shared state backend so every worker sees them
+        self.backend = get_state_backend()
+        self.max_messages = settings.history_max_messages
+    def decode_messages(self, raw: List[bytes]) -> List[Dict[str, Any]]:
+        messages = []
+        for item in raw:
+            try:
+                messages.append(json.loads(item))
+            except Exception as e:
+                logger.error(f"Error decoding history message: {str(e)}")
+        return messages
+    def history_append(self, session_id: str, messages: List[Dict[str, Any]]) -> AppendItem:
+        """The backend append for *messages*, for callers batching it with other writes"""
+        return (
+            HISTORY_NAMESPACE,
+            session_id,
+            [json.dumps(m).encode() for m in messages],
+            self.max_messages,
+            settings.session_ttl,
+        )
+    async def append_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Append messages to a session transcript (oldest are trimmed past the cap)"""
         try:
-            # Try to connect to Redis if available
-            if hasattr(settings, 'redis_url') and settings.redis_url:
-                self.redis_client = redis.from_url(settings.redis_url)
-                self.redis_client.ping()
-                self.use_redis = True
-                logger.info("Connected to Redis for session storage")
+            await self.backend.write_batch(appends=[self.history_append(session_id, messages)])
         except Exception as e:
-            logger.warning(f"Could not connect to Redis, using in-memory storage: {str(e)}")
-            self.use_redis = False
-    def get_session(self, session_id: str) -> Dict[str, Any]:
-        """Retrieve a session by ID"""
+            logger.error(f"Error appending to session: {str(e)}")
+    async def get_recent(self, session_id: str, pairs: int) -> List[Dict[str, Any]]:
+        """The last *pairs* user/assistant exchanges, oldest first"""
+        if pairs <= 0:
+            return []
         try:
-            if self.use_redis:
-                session_data = self.redis_client.get(f"session:{session_id}")
-                if session_data:
-                    return json.loads(session_data)
-            else:
-                if session_id in self.memory_sessions:
-                    return self.memory_sessions[session_id]
-            # Return empty session if not found
-            return {"messages": []}
+            return self.decode_messages(await self.backend.get_range(HISTORY_NAMESPACE, session_id, -2 * pairs, -1))
         except Exception as e:
             logger.error(f"Error getting session: {str(e)}")
-            return {"messages": []}
-    def update_session(self, session_id: str, messages: list) -> None:
-        """Update session with new messages"""
+            return []
+    async def get_page_raw(self, session_id: str, offset: int = 0, limit: int = 50) -> Tuple[List[bytes], int]:
+        """One page of stored (still encoded) messages and the total message count"""
+        total = await self.backend.length(HISTORY_NAMESPACE, session_id)
+        if limit <= 0 or offset >= total:
+            return [], total
+        return await self.backend.get_range(HISTORY_NAMESPACE, session_id, offset, offset + limit - 1), total
+    async def get_page(self, session_id: str, offset: int = 0, limit: int = 50) -> Tuple[List[Dict[str, Any]], int]:
+        """One page of the transcript (oldest first) and the total message count"""
+        raw, total = await self.get_page_raw(session_id, offset, limit)
+        return self.decode_messages(raw), total
+    async def iter_history(self, session_id: str, batch: int = 100) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield the transcript as it was when iteration started, a batch at a
+        time.  Trimming a capped transcript shifts every offset, so a capped
+        one (at most ``max_messages``) is read in one snapshot; an uncapped
+        one only grows, so it is paged by offset up to its starting length.
+        """
+        if self.max_messages:
+            raw = await self.backend.get_range(HISTORY_NAMESPACE, session_id)
+            for start in range(0, len(raw), batch):
+                for message in self.decode_messages(raw[start:start + batch]):
+                    yield message
+            return
+        total = await self.backend.length(HISTORY_NAMESPACE, session_id)
+        for offset in range(0, total, batch):
+            raw = await self.backend.get_range(HISTORY_NAMESPACE, session_id, offset, min(offset + batch, total) - 1)
+            for message in self.decode_messages(raw):
+                yield message
+    async def get_session(self, session_id: str) -> Dict[str, Any]:
+        """Retrieve a session by ID (the retained transcript window)"""
         try:
-            session_data = {"messages": messages}
-            if self.use_redis:
-                self.redis_client.set(
-                    f"session:{session_id}",
-                    json.dumps(session_data),
-                    ex=3600  # Expire after 1 hour
-                )
-            else:
-                self.memory_sessions[session_id] = session_data
-                # Limit in-memory sessions to prevent memory leak
-                if len(self.memory_sessions) > 100:
-                    # Remove oldest sessions
-                    oldest_key = next(iter(self.memory_sessions))
-                    del self.memory_sessions[oldest_key]
+            raw = await self.backend.get_range(HISTORY_NAMESPACE, session_id)
+            return {"messages": self.decode_messages(raw)}
         except Exception as e:
-            logger.error(f"Error updating session: {str(e)}")
-    def clear_session(self, session_id: str) -> None:
+            logger.error(f"Error getting session: {str(e)}")
+            return {"messages": []}
+    async def clear_session(self, session_id: str) -> None:
         """Clear a session"""
         try:
-            if self.use_redis:
-                self.redis_client.delete(f"session:{session_id}")
-            else:
-                if session_id in self.memory_sessions:
-                    del self.memory_sessions[session_id]
+            await self.backend.delete(HISTORY_NAMESPACE, session_id)
         except Exception as e:
             logger.error(f"Error clearing session: {str(e)}")
@@ -0,0 +1,630 @@
+# services/state_backend.py
+# ───────────────────────────────────────────────────────────────────────────
+"""
+Shared state backend for sessions, contexts, estimates and exports.
+
+Every piece of per-user state goes through one small async key/value
+interface, namespaced by kind ("session", "context", "estimate", "export").
+Values are opaque bytes – callers own the serialisation.  Besides whole
+values a key can hold a map of named fields (a Redis hash) so callers can
+rewrite only the fields that changed, or a capped append-only list (a Redis
+list) so growing logs are never rewritten.
+
+Implementations
+  • MemoryStateBackend – per-process dict; single worker only.
+  • SQLiteStateBackend – embedded, WAL-mode file shared by every worker
+                         on the box; no external service needed.
+  • RedisStateBackend  – redis.asyncio on a shared connection pool, shared
+                         across boxes.  Multi-key reads/writes are
+                         pipelined into one round trip, and timeouts trip a
+                         circuit breaker that serves from local memory
+                         until Redis recovers.
+
+Pick one with STATE_BACKEND=memory|sqlite|redis (default sqlite).  If the
+chosen backend cannot be opened we fall back to memory and log a warning.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import settings
+from services.memory_store import MemoryStore
+
+logger = logging.getLogger(__name__)
+
+# (namespace, key) and (namespace, key, value, ttl)
+StateKey = Tuple[str, str]
+StateItem = Tuple[str, str, bytes, Optional[int]]
+# (namespace, key, fields, ttl) and (namespace, key, values, max_len, ttl)
+FieldsItem = Tuple[str, str, Dict[str, bytes], Optional[int]]
+AppendItem = Tuple[str, str, Sequence[bytes], Optional[int], Optional[int]]
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  Interface
+# ═══════════════════════════════════════════════════════════════════════════
+class StateBackend:
+    """Namespaced key/value store with optional per-entry TTL (seconds)."""
+
+    name = "base"
+
+    async def get(self, namespace: str, key: str) -> Optional[bytes]:
+        return (await self.get_many([(namespace, key)]))[0]
+
+    async def set(self, namespace: str, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        await self.set_many([(namespace, key, value, ttl)])
+
+    async def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    async def add(self, namespace: str, key: str, value: bytes, ttl: Optional[int] = None) -> bool:
+        """Set *key* only if it is absent or expired (SET NX); True if this call stored it."""
+        raise NotImplementedError
+
+    async def get_many(self, keys: Sequence[StateKey]) -> List[Optional[bytes]]:
+        """Read several keys at once (one round trip where the backend allows)."""
+        raise NotImplementedError
+
+    async def set_many(self, items: Sequence[StateItem]) -> None:
+        """Write several keys at once (one round trip where the backend allows)."""
+        raise NotImplementedError
+
+    async def get_fields(self, namespace: str, key: str) -> Dict[str, bytes]:
+        """All fields stored under a field-map key ({} if missing or expired)."""
+        raise NotImplementedError
+
+    async def set_fields(
+        self, namespace: str, key: str, fields: Dict[str, bytes], ttl: Optional[int] = None
+    ) -> None:
+        """Merge *fields* into a field-map key and refresh its TTL."""
+        raise NotImplementedError
+
+    async def append(
+        self,
+        namespace: str,
+        key: str,
+        values: Sequence[bytes],
+        max_len: Optional[int] = None,
+        ttl: Optional[int] = None,
+    ) -> None:
+        """Append to a list key, keep only the newest *max_len* items, refresh its TTL."""
+        raise NotImplementedError
+
+    async def get_range(
+        self, namespace: str, key: str, start: int = 0, stop: int = -1
+    ) -> List[bytes]:
+        """List items *start*..*stop* inclusive; negative indices count from the end (LRANGE)."""
+        raise NotImplementedError
+
+    async def length(self, namespace: str, key: str) -> int:
+        raise NotImplementedError
+
+    async def write_batch(
+        self,
+        items: Sequence[StateItem] = (),
+        fields: Sequence[FieldsItem] = (),
+        appends: Sequence[AppendItem] = (),
+    ) -> None:
+        """Whole values, field maps and list appends as one operation where the backend allows."""
+        if items:
+            await self.set_many(items)
+        for ns, key, mapping, ttl in fields:
+            await self.set_fields(ns, key, mapping, ttl)
+        for ns, key, values, max_len, ttl in appends:
+            await self.append(ns, key, values, max_len, ttl)
+
+    async def close(self) -> None:
+        pass
+
+
+def _list_bounds(n: int, start: int, stop: int) -> Tuple[int, int]:
+    """Resolve LRANGE-style (possibly negative, inclusive) indices for a list of *n*."""
+    start = max(n + start, 0) if start < 0 else start
+    stop = n + stop if stop < 0 else min(stop, n - 1)
+    return start, stop
+
+
+def _list_slice(items: Sequence[bytes], start: int, stop: int) -> List[bytes]:
+    start, stop = _list_bounds(len(items), start, stop)
+    return list(islice(items, start, stop + 1)) if start <= stop else []
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  In-process memory
+# ═══════════════════════════════════════════════════════════════════════════
+class MemoryStateBackend(StateBackend):
+    """
+    Per-process MemoryStore (LRU + TTL + byte budget, see memory_store.py),
+    so idle sessions are evicted before active ones and memory stays bounded.
+    """
+
+    name = "memory"
+
+    def __init__(self, store_name: str = "state"):
+        self._data = MemoryStore(
+            store_name,
+            max_bytes=settings.memory_store_max_bytes,
+            max_entries=settings.memory_store_max_entries,
+            shards=settings.memory_store_shards,
+        )
+
+    def _get(self, namespace: str, key: str) -> Any:
+        return self._data.get((namespace, key))
+
+    async def get_many(self, keys: Sequence[StateKey]) -> List[Optional[bytes]]:
+        return [self._get(ns, key) for ns, key in keys]
+
+    async def set_many(self, items: Sequence[StateItem]) -> None:
+        for ns, key, value, ttl in items:
+            self._data.set((ns, key), value, ttl)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        self._data.pop((namespace, key))
+
+    async def add(self, namespace: str, key: str, value: bytes, ttl: Optional[int] = None) -> bool:
+        if self._get(namespace, key) is not None:
+            return False
+        self._data.set((namespace, key), value, ttl)
+        return True
+
+    async def get_fields(self, namespace: str, key: str) -> Dict[str, bytes]:
+        return dict(self._get(namespace, key) or {})
+
+    async def set_fields(
+        self, namespace: str, key: str, fields: Dict[str, bytes], ttl: Optional[int] = None
+    ) -> None:
+        merged = {**(self._get(namespace, key) or {}), **fields}
+        self._data.set((namespace, key), merged, ttl)
+
+    async def append(self, namespace, key, values, max_len=None, ttl=None) -> None:
+        ring = self._get(namespace, key)
+        max_len = max_len or None  # 0 = uncapped, as for the other backends
+        if ring is None or ring.maxlen != max_len:
+            ring = deque(ring or (), maxlen=max_len)  # ring buffer when capped
+        ring.extend(values)
+        self._data.set((namespace, key), ring, ttl)  # re-set so its size is re-counted
+
+    async def get_range(self, namespace, key, start=0, stop=-1) -> List[bytes]:
+        return _list_slice(self._get(namespace, key) or (), start, stop)
+
+    async def length(self, namespace: str, key: str) -> int:
+        return len(self._get(namespace, key) or ())
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  Embedded SQLite (WAL) – shared by all workers on one box
+# ═══════════════════════════════════════════════════════════════════════════
+class SQLiteStateBackend(StateBackend):
+    """
+    One SQLite file in WAL mode: readers never block the writer and every
+    uvicorn worker on the box sees the same rows.  Each process holds a
+    single connection guarded by a lock.  Statements run in a worker thread
+    (``asyncio.to_thread``): a write waiting out another worker's lock (up to
+    the 5 s busy timeout) must not stall the event loop.  Multi-statement
+    writes are ``BEGIN IMMEDIATE`` transactions that roll back on any error,
+    so a failed write never leaves the shared connection mid-transaction.
+    """
+
+    name = "sqlite"
+    _PURGE_EVERY = 500  # writes between expired-row sweeps
+    _TABLES = ("state", "state_fields", "state_lists")
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL,"
+            " PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state_fields ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " field TEXT NOT NULL,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL,"
+            " PRIMARY KEY (namespace, key, field)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state_lists ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL,"
+            " PRIMARY KEY (namespace, key, seq)"
+            ") WITHOUT ROWID"
+        )
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE … COMMIT under the connection lock; ROLLBACK on any error."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+
+    # ── blocking statements (run via asyncio.to_thread) ──────────────────
+    def _get_many(self, keys: Sequence[StateKey]) -> List[Optional[bytes]]:
+        now = time.time()
+        results: List[Optional[bytes]] = []
+        with self._lock:
+            for ns, key in keys:
+                row = self._conn.execute(
+                    "SELECT value FROM state WHERE namespace = ? AND key = ?"
+                    " AND (expires_at IS NULL OR expires_at > ?)",
+                    (ns, key, now),
+                ).fetchone()
+                results.append(bytes(row[0]) if row else None)
+        return results
+
+    def _set_many(self, items: Sequence[StateItem]) -> None:
+        now = time.time()
+        rows = [(ns, key, value, now + ttl if ttl else None) for ns, key, value, ttl in items]
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        with self._lock:
+            self._writes += len(rows)
+            if self._writes >= self._PURGE_EVERY:
+                self._writes = 0
+                for table in self._TABLES:
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                        (now,),
+                    )
+
+    def _delete(self, namespace: str, key: str) -> None:
+        with self._transaction() as conn:
+            for table in self._TABLES:
+                conn.execute(
+                    f"DELETE FROM {table} WHERE namespace = ? AND key = ?", (namespace, key)
+                )
+
+    def _add(self, namespace: str, key: str, value: bytes, ttl: Optional[int]) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ?"
+                " AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, key, now),
+            )
+            return conn.execute(
+                "INSERT OR IGNORE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, now + ttl if ttl else None),
+            ).rowcount == 1
+
+    def _get_fields(self, namespace: str, key: str) -> Dict[str, bytes]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT field, value FROM state_fields WHERE namespace = ? AND key = ?"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            ).fetchall()
+        return {field: bytes(value) for field, value in rows}
+
+    def _set_fields(self, namespace: str, key: str, fields: Dict[str, bytes], ttl: Optional[int]) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO state_fields (namespace, key, field, value, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(namespace, key, field, value, expires_at) for field, value in fields.items()],
+            )
+            conn.execute(
+                "UPDATE state_fields SET expires_at = ? WHERE namespace = ? AND key = ?",
+                (expires_at, namespace, key),
+            )
+
+    def _append(self, namespace, key, values, max_len, ttl) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._transaction() as conn:
+            # An expired list starts over rather than growing its stale tail
+            conn.execute(
+                "DELETE FROM state_lists WHERE namespace = ? AND key = ?"
+                " AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, key, now),
+            )
+            last = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM state_lists WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO state_lists (namespace, key, seq, value, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(namespace, key, last + i, value, expires_at)
+                 for i, value in enumerate(values, start=1)],
+            )
+            if max_len:
+                conn.execute(
+                    "DELETE FROM state_lists WHERE namespace = ? AND key = ? AND seq <= ?",
+                    (namespace, key, last + len(values) - max_len),
+                )
+            conn.execute(
+                "UPDATE state_lists SET expires_at = ? WHERE namespace = ? AND key = ?",
+                (expires_at, namespace, key),
+            )
+
+    def _get_range(self, namespace, key, start, stop) -> List[bytes]:
+        now = time.time()
+        with self._lock:
+            length = self._conn.execute(
+                "SELECT COUNT(*) FROM state_lists WHERE namespace = ? AND key = ?"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, now),
+            ).fetchone()[0]
+            start, stop = _list_bounds(length, start, stop)
+            if start > stop:
+                return []
+            rows = self._conn.execute(
+                "SELECT value FROM state_lists WHERE namespace = ? AND key = ?"
+                " AND (expires_at IS NULL OR expires_at > ?)"
+                " ORDER BY seq LIMIT ? OFFSET ?",
+                (namespace, key, now, stop - start + 1, start),
+            ).fetchall()
+        return [bytes(row[0]) for row in rows]
+
+    def _length(self, namespace: str, key: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM state_lists WHERE namespace = ? AND key = ?"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            ).fetchone()[0]
+
+    def _close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ── StateBackend API ─────────────────────────────────────────────────
+    async def get_many(self, keys: Sequence[StateKey]) -> List[Optional[bytes]]:
+        return await asyncio.to_thread(self._get_many, keys)
+
+    async def set_many(self, items: Sequence[StateItem]) -> None:
+        await asyncio.to_thread(self._set_many, items)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        await asyncio.to_thread(self._delete, namespace, key)
+
+    async def add(self, namespace: str, key: str, value: bytes, ttl: Optional[int] = None) -> bool:
+        return await asyncio.to_thread(self._add, namespace, key, value, ttl)
+
+    async def get_fields(self, namespace: str, key: str) -> Dict[str, bytes]:
+        return await asyncio.to_thread(self._get_fields, namespace, key)
+
+    async def set_fields(
+        self, namespace: str, key: str, fields: Dict[str, bytes], ttl: Optional[int] = None
+    ) -> None:
+        await asyncio.to_thread(self._set_fields, namespace, key, fields, ttl)
+
+    async def append(self, namespace, key, values, max_len=None, ttl=None) -> None:
+        await asyncio.to_thread(self._append, namespace, key, values, max_len, ttl)
+
+    async def get_range(self, namespace, key, start=0, stop=-1) -> List[bytes]:
+        return await asyncio.to_thread(self._get_range, namespace, key, start, stop)
+
+    async def length(self, namespace: str, key: str) -> int:
+        return await asyncio.to_thread(self._length, namespace, key)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  Redis (async, pooled, pipelined, circuit-broken)
+# ═══════════════════════════════════════════════════════════════════════════
+class CircuitBreaker:
+    """
+    Opens after *threshold* consecutive failures; while open every call is
+    short-circuited for *reset_after* seconds, then one trial call is let
+    through (half-open) to probe for recovery.
+    """
+
+    def __init__(self, threshold: int = 3, reset_after: float = 30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        return time.monotonic() - self.opened_at >= self.reset_after
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning("Redis circuit opened after %s failures; using local memory", self.failures)
+            self.opened_at = time.monotonic()
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Keys are ``{namespace}:{key}`` so they match the legacy Redis layout.
+
+    Any Redis error or timeout is counted by the circuit breaker and the
+    call is served from a local MemoryStateBackend instead, so a Redis
+    outage degrades to single-worker behaviour rather than failing turns.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, breaker: Optional[CircuitBreaker] = None):
+        self.client = client
+        self.breaker = breaker or CircuitBreaker()
+        self.fallback = MemoryStateBackend("redis_fallback")
+
+    async def _run(self, primary, fallback):
+        if not self.breaker.allow():
+            return await fallback()
+        try:
+            result = await primary()
+        except Exception as e:
+            logger.warning("Redis state call failed (%s); serving from local memory", e)
+            self.breaker.record_failure()
+            return await fallback()
+        self.breaker.record_success()
+        return result
+
+    async def get_many(self, keys: Sequence[StateKey]) -> List[Optional[bytes]]:
+        async def primary():
+            if len(keys) == 1:
+                return [await self.client.get(f"{keys[0][0]}:{keys[0][1]}")]
+            return await self.client.mget([f"{ns}:{key}" for ns, key in keys])
+
+        return await self._run(primary, lambda: self.fallback.get_many(keys))
+
+    async def set_many(self, items: Sequence[StateItem]) -> None:
+        await self.write_batch(items=items)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        async def primary():
+            await self.client.delete(f"{namespace}:{key}")
+
+        await self._run(primary, lambda: self.fallback.delete(namespace, key))
+
+    async def add(self, namespace: str, key: str, value: bytes, ttl: Optional[int] = None) -> bool:
+        async def primary():
+            return bool(await self.client.set(f"{namespace}:{key}", value, ex=ttl, nx=True))
+
+        return await self._run(primary, lambda: self.fallback.add(namespace, key, value, ttl))
+
+    async def get_fields(self, namespace: str, key: str) -> Dict[str, bytes]:
+        async def primary():
+            raw = await self.client.hgetall(f"{namespace}:{key}")
+            return {field.decode(): value for field, value in raw.items()}
+
+        return await self._run(primary, lambda: self.fallback.get_fields(namespace, key))
+
+    async def set_fields(
+        self, namespace: str, key: str, fields: Dict[str, bytes], ttl: Optional[int] = None
+    ) -> None:
+        await self.write_batch(fields=[(namespace, key, fields, ttl)])
+
+    async def append(self, namespace, key, values, max_len=None, ttl=None) -> None:
+        await self.write_batch(appends=[(namespace, key, values, max_len, ttl)])
+
+    async def write_batch(self, items=(), fields=(), appends=()) -> None:
+        """Every write in one non-transactional pipeline – a single round trip."""
+        async def primary():
+            async with self.client.pipeline(transaction=False) as pipe:
+                for ns, key, value, ttl in items:
+                    pipe.set(f"{ns}:{key}", value, ex=ttl)
+                for ns, key, mapping, ttl in fields:
+                    pipe.hset(f"{ns}:{key}", mapping=mapping)
+                    if ttl:
+                        pipe.expire(f"{ns}:{key}", ttl)
+                for ns, key, values, max_len, ttl in appends:
+                    pipe.rpush(f"{ns}:{key}", *values)
+                    if max_len:
+                        pipe.ltrim(f"{ns}:{key}", -max_len, -1)
+                    if ttl:
+                        pipe.expire(f"{ns}:{key}", ttl)
+                await pipe.execute()
+
+        await self._run(primary, lambda: self.fallback.write_batch(items, fields, appends))
+
+    async def get_range(self, namespace, key, start=0, stop=-1) -> List[bytes]:
+        async def primary():
+            return await self.client.lrange(f"{namespace}:{key}", start, stop)
+
+        return await self._run(primary, lambda: self.fallback.get_range(namespace, key, start, stop))
+
+    async def length(self, namespace: str, key: str) -> int:
+        async def primary():
+            return await self.client.llen(f"{namespace}:{key}")
+
+        return await self._run(primary, lambda: self.fallback.length(namespace, key))
+
+    async def close(self) -> None:
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+
+def _create_redis_client():
+    """redis.asyncio client on one shared, bounded connection pool."""
+    import redis.asyncio as aioredis
+
+    options = dict(
+        max_connections=settings.redis_max_connections,
+        socket_timeout=settings.redis_timeout,
+        socket_connect_timeout=settings.redis_timeout,
+        decode_responses=False,
+    )
+    if settings.redis_url:
+        pool = aioredis.ConnectionPool.from_url(settings.redis_url, **options)
+    else:
+        pool = aioredis.ConnectionPool(
+            host=settings.redis_host, port=settings.redis_port, db=settings.redis_db, **options
+        )
+    return aioredis.Redis(connection_pool=pool)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  Factory (one backend per process)
+# ═══════════════════════════════════════════════════════════════════════════
+_backend: Optional[StateBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend() -> StateBackend:
+    kind = settings.state_backend.lower()
+    try:
+        if kind == "redis":
+            if os.environ.get("USE_REDIS", "").lower() == "false":
+                raise RuntimeError("Redis is disabled via USE_REDIS")
+            # No ping here: connecting is lazy and the circuit breaker
+            # covers an unreachable server.
+            return RedisStateBackend(_create_redis_client())
+        if kind == "sqlite":
+            return SQLiteStateBackend(settings.state_db_path)
+    except Exception as e:
+        logger.warning(
+            "Could not open %s state backend (%s); using per-process memory", kind, e
+        )
+    return MemoryStateBackend()
+
+
+def get_state_backend() -> StateBackend:
+    """Return the process-wide backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend()
+                logger.info("State backend: %s", _backend.name)
+    return _backend
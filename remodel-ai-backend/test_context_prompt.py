@@ -10,7 +10,6 @@ async def test_conversation():
     print("\n----- FIRST MESSAGE -----")
     response1 = await service.get_chat_response(
         "I'm thinking about remodeling my kitchen in San Diego. What would it cost?",
-        [],
         session_id
     )
     print(f"RESPONSE: {response1['message'][:200]}...")
@@ -19,7 +18,6 @@ async def test_conversation():
     print("\n----- SECOND MESSAGE -----")
     response2 = await service.get_chat_response(
         "What kind of countertops would you recommend?",
-        [],
         session_id
     )
     print(f"RESPONSE: {response2['message'][:200]}...")
@@ -28,7 +26,6 @@ async def test_conversation():
     print("\n----- THIRD MESSAGE -----")
     response3 = await service.get_chat_response(
         "Would high-end appliances fit in my budget?",
-        [],
         session_id
     )
     print(f"RESPONSE: {response3['message'][:200]}...")
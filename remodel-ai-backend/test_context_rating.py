@@ -44,7 +44,7 @@ async def test_conversation_quality():
         print(f"Q: {question}")
         
         # Get response
-        response = await service.get_chat_response(question, [], session_id)
+        response = await service.get_chat_response(question, session_id)
         message = response.get('message', '')
         
         # Print truncated response
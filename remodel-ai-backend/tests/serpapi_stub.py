@@ -0,0 +1,38 @@
+"""
+Local stand-in for SerpAPI's Home Depot search, for tests and offline dev.
+
+    python tests/serpapi_stub.py              # serves on :8001
+    SERPAPI_BASE_URL=http://localhost:8001 uvicorn main:app
+
+Every query returns a few priced products; a query containing "slow"
+sleeps first and one containing "missing" returns no products, so deadline
+and partial-result paths can be exercised.
+"""
+import asyncio
+from fastapi import FastAPI
+def create_app(delay: float = 0.5) -> FastAPI:
+    app = FastAPI()
+    app.state.calls = 0
+    app.state.in_flight = 0
+    app.state.max_in_flight = 0
+    @app.get("/search")
+    async def search(q: str, engine: str = "home_depot"):
+        app.state.calls += 1
+        app.state.in_flight += 1
+        app.state.max_in_flight = max(app.state.max_in_flight, app.state.in_flight)
+        try:
+            await asyncio.sleep(delay if "slow" in q else 0.01)
+            if "missing" in q:
+                return {"products": []}
+            base = 10 + len(q)
+            return {"products": [
+                {"title": f"{q} {i}", "price": base + i, "unit": "each",
+                 "availability": {"status": "in_stock"}, "rating": 4.5, "reviews": 10}
+                for i in range(3)
+            ]}
+        finally:
+            app.state.in_flight -= 1
+    return app
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(create_app(), host="127.0.0.1", port=8001)
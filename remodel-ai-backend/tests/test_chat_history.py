@@ -0,0 +1,54 @@
+import json
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import api.chat
+from services.session_service import SessionService
+from services.state_backend import MemoryStateBackend
+def _client_with_history(monkeypatch, count):
+    sessions = SessionService()
+    sessions.backend = MemoryStateBackend()
+    asyncio.run(sessions.append_messages("s1", [{"role": "user", "content": f"m{i}"} for i in range(count)]))
+    monkeypatch.setattr(api.chat, "_session_service", sessions)
+    app = FastAPI()
+    app.include_router(api.chat.router, prefix="/chat")
+    return TestClient(app), sessions
+def test_history_is_paginated(monkeypatch):
+    """History pages come back oldest first with the total count"""
+    client, _ = _client_with_history(monkeypatch, 7)
+    body = client.get("/chat/sessions/s1/history", params={"offset": 5, "limit": 5}).json()
+    assert [m["content"] for m in body["history"]] == ["m5", "m6"]
+    assert body["total"] == 7
+def test_history_streams_ndjson(monkeypatch):
+    """stream=true returns every message as one JSON line"""
+    client, sessions = _client_with_history(monkeypatch, 250)
+    response = client.get("/chat/sessions/s1/history", params={"stream": "true"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert len(lines) == sessions.max_messages
+    assert lines[-1]["content"] == "m249"
+def test_history_revalidates_with_etag(monkeypatch):
+    """An unchanged page answers If-None-Match with 304; a new message changes the ETag"""
+    client, sessions = _client_with_history(monkeypatch, 3)
+    first = client.get("/chat/sessions/s1/history")
+    etag = first.headers["etag"]
+    again = client.get("/chat/sessions/s1/history", headers={"If-None-Match": etag})
+    assert (again.status_code, again.content) == (304, b"")
+    asyncio.run(sessions.append_messages("s1", [{"role": "user", "content": "m3"}]))
+    changed = client.get("/chat/sessions/s1/history", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+def test_streamed_history_is_a_snapshot_while_turns_are_appended(monkeypatch):
+    """Messages appended (and trimmed off the front) mid-stream neither skip nor repeat earlier ones"""
+    _, sessions = _client_with_history(monkeypatch, 200)
+    async def stream_while_chatting():
+        seen = []
+        async for message in sessions.iter_history("s1", batch=50):
+            seen.append(message["content"])
+            if len(seen) % 50 == 0:  # a turn lands between batches and trims the two oldest
+                await sessions.append_messages("s1", [{"role": "user", "content": f"new{len(seen)}"}] * 2)
+        return seen
+    assert asyncio.run(stream_while_chatting()) == [f"m{i}" for i in range(200)]
+    sessions.max_messages = 0  # uncapped: paged by offset up to the length at the start
+    asyncio.run(sessions.backend.delete("history", "s1"))
+    asyncio.run(sessions.append_messages("s1", [{"role": "user", "content": f"m{i}"} for i in range(120)]))
+    assert asyncio.run(stream_while_chatting()) == [f"m{i}" for i in range(120)]
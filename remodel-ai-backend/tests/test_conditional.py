@@ -0,0 +1,34 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import api.estimate
+from schemas import EstimateResponse
+from services.state_backend import MemoryStateBackend
+def _estimate_service():
+    """EstimateService storage only – skip __init__ so no RAG stack is built"""
+    from services.estimate_service import EstimateService
+    from services.estimate_store import EstimateStore
+    service = EstimateService.__new__(EstimateService)
+    service.store = EstimateStore(MemoryStateBackend())
+    return service
+def _estimate_json():
+    return EstimateResponse(
+        estimate_id="est_1", total_cost=50000, cost_range_low=45000, cost_range_high=55000,
+        cost_breakdown={"materials": 20000, "labor": 17500, "permits": 2500, "other": 10000, "total": 50000},
+        confidence_score=0.85,
+        timeline={"planning_days": 14, "permit_days": 30, "construction_days": 60, "total_days": 104},
+        similar_projects=[], created_at="2024-01-01T00:00:00",
+    ).json().encode()
+def test_estimate_conditional_get(monkeypatch):
+    """The stored content hash is the ETag; a match is a bodyless 304"""
+    service = _estimate_service()
+    asyncio.run(service.store.put("est_1", _estimate_json()))
+    monkeypatch.setattr(api.estimate, "_estimate_service", service)
+    app = FastAPI()
+    app.include_router(api.estimate.router, prefix="/estimate")
+    client = TestClient(app)
+    first = client.get("/estimate/est_1")
+    assert first.json()["total_cost"] == 50000
+    hit = client.get("/estimate/est_1", headers={"If-None-Match": first.headers["etag"]})
+    assert (hit.status_code, hit.content, hit.headers["etag"]) == (304, b"", first.headers["etag"])
+    assert client.get("/estimate/missing", headers={"If-None-Match": '"x"'}).status_code == 404
@@ -0,0 +1,44 @@
+import json
+import pytest
+from services.context_codec import SCHEMA_VERSION, ContextCodec
+from services.context_manager import ContextManager, ConversationContext
+from services.state_backend import MemoryStateBackend
+def _context():
+    ctx = ConversationContext()
+    ctx.session_id = "s1"
+    ctx.project_type = "kitchen"
+    ctx.discussed_prices = {"kitchen": ["25,000", "50,000"]}
+    return ctx
+@pytest.mark.parametrize("fmt", ["json", "msgpack", "msgpack+zstd"])
+def test_round_trip_and_legacy_json(fmt):
+    """Every codec round-trips and still reads (and upgrades) contexts stored as plain JSON"""
+    codec = ContextCodec(fmt)
+    data = _context().to_dict()
+    assert codec.decode(codec.encode(data)) == data
+    legacy = codec.decode(json.dumps(data).encode())
+    assert legacy == {f"context.{k}": v for k, v in data.items()}
+def test_newer_schema_is_readable():
+    """Unknown fields from a newer schema version don't break decoding"""
+    codec = ContextCodec("msgpack")
+    raw = codec.encode_value({"_v": SCHEMA_VERSION + 1, "project_type": "adu", "new_field": 1})
+    assert codec.decode(raw)["project_type"] == "adu"
+@pytest.mark.asyncio
+async def test_delta_mode_writes_changed_fields_only():
+    """In delta mode a flush writes only the dirty fields (plus last_updated)"""
+    manager = ContextManager()
+    manager.backend = MemoryStateBackend()
+    manager.delta = True
+    async with manager.unit_of_work("s1") as uow:
+        uow.context.project_type = "kitchen"
+    async with manager.unit_of_work("s1") as uow:
+        assert uow.context.project_type == "kitchen"
+        uow.context.location = "San Diego"
+        written = {}
+        original = manager.backend.set_fields
+        async def spy(namespace, key, fields, ttl=None):
+            written.update(fields)
+            await original(namespace, key, fields, ttl)
+        manager.backend.set_fields = spy
+    assert set(written) == {"context.location", "context.last_updated", "version", "_v"}
+    ctx = await manager.get_or_create_context("s1")
+    assert (ctx.project_type, ctx.location) == ("kitchen", "San Diego")
@@ -0,0 +1,73 @@
+import pytest
+from services.context_manager import ContextManager, SessionState
+from services.session_service import SessionService
+from services.state_backend import MemoryStateBackend
+class CountingBackend(MemoryStateBackend):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.writes = 0
+    async def get_many(self, keys):
+        self.reads += 1
+        return await super().get_many(keys)
+    async def write_batch(self, items=(), fields=(), appends=()):
+        self.writes += 1
+        await super().write_batch(items, fields, appends)
+def _manager():
+    manager = ContextManager()
+    manager.backend = CountingBackend()
+    return manager
+@pytest.mark.asyncio
+async def test_unit_of_work_loads_and_saves_once():
+    """Repeated gets/saves inside one unit of work hit the store once each"""
+    manager = _manager()
+    async with manager.unit_of_work("s1") as uow:
+        for _ in range(5):
+            ctx = await manager.get_or_create_context("s1")
+            assert ctx is uow.context
+        ctx.project_type = "kitchen"
+        await manager.save_context("s1", ctx)
+        await manager.save_context("s1", ctx)
+        assert uow.dirty_fields() == ["context.project_type"]
+    assert (manager.backend.reads, manager.backend.writes) == (1, 1)
+    assert (await manager.get_or_create_context("s1")).project_type == "kitchen"
+@pytest.mark.asyncio
+async def test_unit_of_work_skips_clean_flush():
+    """A request that changes nothing does not write the context back"""
+    manager = _manager()
+    async with manager.unit_of_work("s1"):
+        await manager.get_system_prompt("s1")
+        async with manager.unit_of_work("s1"):
+            await manager.get_or_create_context("s1")
+    assert (manager.backend.reads, manager.backend.writes) == (1, 0)
+@pytest.mark.asyncio
+async def test_turn_state_and_history_written_together():
+    """Summary, tail, context and the transcript append go out in one write"""
+    manager = _manager()
+    history = SessionService()
+    history.backend = manager.backend
+    async with manager.unit_of_work("s1") as uow:
+        uow.state.summary = "Kitchen remodel in San Diego."
+        uow.state.tail = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+        uow.context.project_type = "kitchen"
+        await uow.flush(appends=[history.history_append("s1", uow.state.tail)])
+    assert (manager.backend.reads, manager.backend.writes) == (1, 1)
+    state = await manager.get_state("s1")
+    assert isinstance(state, SessionState)
+    assert (state.version, state.summary, state.context.project_type) == (1, "Kitchen remodel in San Diego.", "kitchen")
+    assert state.tail[-1]["content"] == "hello"
+    assert (await history.get_page("s1"))[1] == 2
+@pytest.mark.asyncio
+async def test_legacy_contexts_are_migrated_on_read():
+    """Contexts stored before the session record (plain JSON or v1 fields) still load"""
+    import json
+    manager = _manager()
+    await manager.backend.set("context", "old", json.dumps(
+        {"session_id": "old", "location": "San Diego", "project_type": "kitchen", "turn_count": 3}).encode())
+    await manager.backend.set_fields("context_fields", "older", {
+        "location": manager.codec.encode_value("Los Angeles"), "_v": manager.codec.encode_value(1)})
+    old = await manager.get_or_create_context("old")
+    assert (old.location, old.project_type, old.turn_count) == ("San Diego", "kitchen", 3)
+    assert (await manager.get_or_create_context("new")).location is None
+    manager.delta = True
+    assert (await manager.get_or_create_context("older")).location == "Los Angeles"
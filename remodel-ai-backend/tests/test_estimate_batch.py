@@ -0,0 +1,50 @@
+import json
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import api.estimate
+from services.estimate_engine import EstimateEngine
+from services.estimate_store import EstimateStore
+from services.state_backend import MemoryStateBackend
+def _client(monkeypatch):
+    """Batch endpoint over a small in-memory engine – no dataset, RAG stack or SerpAPI"""
+    from services.estimate_service import EstimateService
+    rows = [{"Location": "San Diego", "Remodel Type": "kitchen_remodel", "Average Cost (Low)": str(low),
+             "Average Cost (High)": str(low + 20000), "Average Time (weeks/other unit)": "6 weeks"}
+            for low in (20000, 30000, 40000)]
+    service = EstimateService.__new__(EstimateService)
+    service.engine = EstimateEngine(rows)
+    service.store = EstimateStore(MemoryStateBackend())
+    monkeypatch.setattr(api.estimate, "_estimate_service", service)
+    app = FastAPI()
+    app.include_router(api.estimate.router, prefix="/estimate")
+    return TestClient(app), service
+def _project(city="San Diego", sqft=200, project_type="kitchen_remodel"):
+    return {"project_type": project_type, "property_type": "single_family",
+            "city": city, "state": "CA", "square_footage": sqft}
+def test_batch_streams_ndjson_in_input_order(monkeypatch):
+    """One line per project, identical projects share an estimate, then a summary"""
+    client, service = _client(monkeypatch)
+    projects = [_project(), _project(sqft=400), _project(city="LA"), _project(), _project(project_type="roofing")]
+    response = client.post("/estimate/batch", json={"projects": projects, "session_id": "s-1"})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line.get("index") for line in lines[:-1]] == [0, 1, 2, 3, 4]
+    first, double, same = lines[0]["estimate"], lines[1]["estimate"], lines[3]["estimate"]
+    assert double["total_cost"] == 2 * first["total_cost"]
+    assert same["estimate_id"] == first["estimate_id"]
+    assert first["metadata"] == {"basis": "San Diego", "samples": 3, "session_id": "s-1"}
+    assert lines[4]["estimate"]["metadata"]["basis"] == "default"
+    assert lines[4]["estimate"]["total_cost"] == 10 * 200  # per-sq-ft default for roofing
+    assert lines[-1]["summary"]["count"] == 5
+    assert lines[-1]["summary"]["unique"] == 4
+    assert client.get(f"/estimate/{first['estimate_id']}").json()["total_cost"] == first["total_cost"]
+def test_batch_rejects_invalid_and_oversized_portfolios(monkeypatch):
+    """The body is a declared model: invalid projects are a 422 naming their index"""
+    client, _ = _client(monkeypatch)
+    invalid = client.post("/estimate/batch", json={"projects": [_project(), _project(city="Fresno")]})
+    assert invalid.status_code == 422
+    assert invalid.json()["detail"][0]["loc"] == ["body", "projects", 1, "city"]
+    assert client.post("/estimate/batch", json={"projects": []}).status_code == 422
+    monkeypatch.setattr(api.estimate.settings, "estimate_batch_max_projects", 2)
+    assert client.post("/estimate/batch", json={"projects": [_project()] * 3}).status_code == 413
+    assert "BatchEstimateRequest" in client.get("/openapi.json").text
@@ -0,0 +1,36 @@
+import csv
+from services.estimate_engine import EstimateEngine, duration_days
+_COLUMNS = ["Location", "Remodel Type", "Average Cost (Low)", "Average Cost (High)",
+            "Average Time (weeks/other unit)", "Source URL"]
+def _engine(tmp_path):
+    rows = [
+        ["San Diego", "kitchen_remodel", 30000, 50000, "6-8 weeks", "https://a"],
+        ["La Jolla, San Diego CA", "Kitchen Remodel - Premium", 50000, 70000, "8 weeks", "https://b"],
+        ["North Park, San Diego CA", "Kitchen Remodel - Economy", 20000, 30000, "4-6 weeks", "https://c"],
+        ["Los Angeles CA", "Kitchen Remodel", 40000, 60000, "2 months", "https://d"],
+        ["Denver", "Bathroom Remodel", 10000, 20000, "3 weeks", "https://e"],
+        ["Austin", "Bathroom Remodel", 12000, 18000, "3 weeks", "https://f"],
+        ["Boston", "Bathroom Remodel", 15000, 25000, "4 weeks", "https://g"],
+    ]
+    path = tmp_path / "data.csv"
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows([_COLUMNS, *rows])
+    return EstimateEngine.from_csv(str(path))
+def test_estimate_scales_city_distribution(tmp_path):
+    """Exact-city stats scale with square footage; sparse cities fall back to both cities"""
+    engine = _engine(tmp_path)
+    sd = engine.estimate("San Diego", "kitchen_remodel", 200)
+    assert (sd.basis, sd.samples, sd.total, sd.construction_days) == ("San Diego", 3, 40000, 49)
+    assert sd.low < sd.total < sd.high
+    assert engine.estimate("San Diego", "kitchen_remodel", 400).total == 2 * sd.total
+    la = engine.estimate("Los Angeles", "kitchen_remodel", 200)
+    assert (la.basis, la.samples) == ("San Diego + Los Angeles", 4)
+    assert la.confidence < sd.confidence
+    assert engine.estimate("Los Angeles", "bathroom_remodel", 75).basis == "all locations"
+    assert engine.estimate("San Diego", "roofing", 1000) is None
+def test_missing_dataset_and_durations(tmp_path):
+    missing = EstimateEngine.from_csv(str(tmp_path / "missing.csv"))
+    assert missing.stats == {} and missing.status()["loaded"] is False
+    assert _engine(tmp_path).status() == {"path": str(tmp_path / "data.csv"), "loaded": True,
+                                          "rows": 7, "project_types": 2}
+    assert (duration_days("6-8 weeks"), duration_days("2 months"), duration_days("3 to 5 days")) == (49, 60, 4)
@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import api.estimate
+from services.estimate_engine import EstimateEngine
+from services.estimate_store import EstimateStore
+from services.metrics import CACHE_REQUESTS
+from services.state_backend import MemoryStateBackend
+class _NoPrices:
+    def get_common_materials(self, project_type):
+        return []
+    async def get_material_prices(self, materials, location):
+        return {}
+def _client(monkeypatch):
+    from services.estimate_service import EstimateService
+    rows = [{"Location": "San Diego", "Remodel Type": "kitchen_remodel", "Average Cost (Low)": str(low),
+             "Average Cost (High)": str(low + 20000)} for low in (20000, 30000, 40000)]
+    service = EstimateService.__new__(EstimateService)
+    service.engine = EstimateEngine(rows)
+    service.material_service = _NoPrices()
+    service.store = EstimateStore(MemoryStateBackend())
+    calls = []
+    estimate = service.engine.estimate
+    monkeypatch.setattr(service.engine, "estimate", lambda *a: calls.append(a) or estimate(*a))
+    monkeypatch.setattr(api.estimate, "_estimate_service", service)
+    app = FastAPI()
+    app.include_router(api.estimate.router, prefix="/estimate")
+    return TestClient(app), calls
+def _request(sqft=200, details=None, session_id="s-1"):
+    return {"project_details": {"project_type": "kitchen_remodel", "property_type": "single_family",
+                                "city": "SD", "state": "CA", "square_footage": sqft,
+                                "additional_details": details},
+            "session_id": session_id}
+def _count(cache, result):
+    return CACHE_REQUESTS.labels(cache, result)._value.get()
+def test_identical_projects_reuse_the_computation(monkeypatch):
+    """Same canonical project (rounded sqft, trimmed details) → one computation, priced at the real size"""
+    client, calls = _client(monkeypatch)
+    hits = _count("estimate_memo", "hit")
+    first = client.post("/estimate/", json=_request(200, " Quartz  counters ")).json()
+    second = client.post("/estimate/", json=_request(198, "quartz counters", session_id="s-2")).json()
+    assert len(calls) == 1 and _count("estimate_memo", "hit") == hits + 1
+    assert first["estimate_id"] != second["estimate_id"]
+    assert second["total_cost"] == pytest.approx(first["total_cost"] * 198 / 200)
+    assert second["metadata"]["session_id"] == "s-2"
+def test_memo_does_not_change_the_figures(monkeypatch):
+    """Results are the same with memoisation off, and tiny projects are not rounded up"""
+    client, _ = _client(monkeypatch)
+    memoised = [client.post("/estimate/", json=_request(sqft)).json() for sqft in (4, 6, 203)]
+    monkeypatch.setattr(api.estimate.settings, "estimate_memo_ttl", 0)
+    direct = [client.post("/estimate/", json=_request(sqft)).json() for sqft in (4, 6, 203)]
+    for a, b in zip(memoised, direct):
+        assert a["total_cost"] == pytest.approx(b["total_cost"])
+    assert direct[1]["total_cost"] == 1.5 * direct[0]["total_cost"]
+def test_idempotency_key_replays_the_original(monkeypatch):
+    """A retry with the same key gets the same estimate back; a different request under it is rejected"""
+    client, calls = _client(monkeypatch)
+    headers = {"Idempotency-Key": "order-42"}
+    first = client.post("/estimate/", json=_request(), headers=headers)
+    retry = client.post("/estimate/", json=_request(), headers=headers)
+    assert "idempotent-replayed" not in first.headers
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.content == first.content
+    assert client.post("/estimate/", json=_request(900), headers=headers).status_code == 422
+    assert client.post("/estimate/", json=_request(), headers={"Idempotency-Key": "order-43"}).json()[
+        "estimate_id"] != first.json()["estimate_id"]
+@pytest.mark.asyncio
+async def test_idempotency_key_is_claimed_once_across_workers(monkeypatch):
+    """Two workers sharing the backend: concurrent requests under one key generate one estimate"""
+    _, calls = _client(monkeypatch)
+    monkeypatch.setattr(api.estimate.settings, "estimate_memo_ttl", 0)
+    first = api.estimate._estimate_service
+    second = type(first).__new__(type(first))
+    second.__dict__.update(first.__dict__)
+    project = api.estimate.EstimateRequest(**_request()).project_details
+    results = await asyncio.gather(*(
+        worker.generate_idempotent("order-44", project, "s-1") for worker in (first, second)))
+    assert len(calls) == 1
+    assert results[0][0] == results[1][0] and sorted(r[1] for r in results) == [False, True]
+@pytest.mark.asyncio
+async def test_idempotency_claim_outlives_its_ttl_while_generating(monkeypatch):
+    """A generation slower than the claim TTL keeps its claim: a late retry waits and replays"""
+    import services.estimate_service as estimate_service
+    _, calls = _client(monkeypatch)
+    monkeypatch.setattr(estimate_service, "IDEMPOTENCY_CLAIM_TTL", 1)
+    service = api.estimate._estimate_service
+    class _SlowPrices(_NoPrices):
+        async def get_material_prices(self, materials, location):
+            await asyncio.sleep(1.6)
+            return {}
+    service.material_service = _SlowPrices()
+    project = api.estimate.EstimateRequest(**_request()).project_details
+    async def late_retry():
+        await asyncio.sleep(1.2)  # the original claim would have lapsed
+        return await service.generate_idempotent("order-45", project, "s-1")
+    first, retry = await asyncio.gather(service.generate_idempotent("order-45", project, "s-1"), late_retry())
+    assert len(calls) == 1
+    assert retry == (first[0], True)
+def test_narrative_is_stateless_and_only_reused_at_the_same_size(monkeypatch):
+    """The narrative quotes the figures: a rescaled memo hit gets a fresh one; no session is created"""
+    client, calls = _client(monkeypatch)
+    monkeypatch.setattr(api.estimate.settings, "estimate_narrative", True)
+    queries = []
+    class _Rag:
+        async def get_stateless_response(self, query, site):
+            queries.append((query, site))
+            return f"narrative {len(queries)}"
+    api.estimate._estimate_service._rag_service = _Rag()
+    first = client.post("/estimate/", json=_request(200)).json()
+    again = client.post("/estimate/", json=_request(200, session_id="s-2")).json()
+    resized = client.post("/estimate/", json=_request(198)).json()
+    assert len(calls) == 1 and len(queries) == 2
+    assert first["metadata"]["narrative"] == again["metadata"]["narrative"] == "narrative 1"
+    assert resized["metadata"]["narrative"] == "narrative 2"
+    assert "Square Footage: 198" in queries[1][0] and queries[1][1] == "narrative"
@@ -0,0 +1,38 @@
+import pytest
+from services.estimate_store import EstimateStore
+from services.memory_store import MemoryStore
+from services.state_backend import SQLiteStateBackend
+@pytest.mark.asyncio
+async def test_estimates_survive_restart_and_index_by_session(tmp_path):
+    """Bytes come back as written from a fresh process; each session lists its own, newest first"""
+    path = str(tmp_path / "state.db")
+    store = EstimateStore(SQLiteStateBackend(path))
+    await store.put("est_1", b'{"estimate_id":"est_1"}', "s-1")
+    await store.put_many([("est_2", b'{"estimate_id":"est_2"}'), ("est_3", b"{}")], "s-1")
+    await store.put("est_4", b"{}", "s-2")
+    restarted = EstimateStore(SQLiteStateBackend(path))
+    data, digest = await restarted.get("est_1")
+    assert data == b'{"estimate_id":"est_1"}' and await restarted.get_hash("est_1") == digest
+    assert await restarted.session_ids("s-1") == ["est_3", "est_2", "est_1"]
+    assert [i for i, _ in await restarted.for_session("s-1", limit=2)] == ["est_3", "est_2"]
+    assert await restarted.get("missing") is None
+@pytest.mark.asyncio
+async def test_hot_tier_is_bounded(tmp_path):
+    """The in-memory tier evicts by bytes; evicted estimates are re-read from disk"""
+    store = EstimateStore(SQLiteStateBackend(str(tmp_path / "state.db")),
+                          hot=MemoryStore("test_estimate_hot", max_bytes=4096, shards=1))
+    for i in range(50):
+        await store.put(f"est_{i}", b"x" * 500)
+    assert store.hot.bytes_used() <= 4096
+    assert (await store.get("est_0"))[0] == b"x" * 500
+@pytest.mark.asyncio
+async def test_bulk_reads_use_but_do_not_fill_the_hot_tier(tmp_path):
+    """iter_many serves hot hits and reads the rest from disk without caching them"""
+    path = str(tmp_path / "state.db")
+    await EstimateStore(SQLiteStateBackend(path)).put_many([(f"est_{i}", b"%d" % i) for i in range(5)])
+    store = EstimateStore(SQLiteStateBackend(path),
+                          hot=MemoryStore("test_estimate_bulk", max_bytes=4096, shards=1))
+    store.hot.set("est_1", (b"hot", "digest"), None, size=9)
+    found = [item async for item in store.iter_many(["est_0", "est_1", "missing", "est_4"], chunk=2)]
+    assert found == [("est_0", b"0"), ("est_1", b"hot"), ("missing", None), ("est_4", b"4")]
+    assert store.hot.get("est_0") is None and store.hot.get("est_4") is None
@@ -0,0 +1,51 @@
+import io
+import json
+import zipfile
+import pytest
+from services import export_formats
+from services.estimate_store import EstimateStore
+from services.state_backend import MemoryStateBackend
+def _estimate(estimate_id, total):
+    return json.dumps({
+        "estimate_id": estimate_id, "total_cost": total, "cost_range_low": total * 0.9,
+        "cost_range_high": total * 1.1, "confidence_score": 0.8,
+        "cost_breakdown": {"materials": 4, "labor": 3, "permits": 1, "other": 2, "total": 10},
+        "timeline": {"planning_days": 1, "permit_days": 2, "construction_days": 3, "total_days": 6},
+        "similar_projects": [], "created_at": "2024-01-01T00:00:00",
+        "metadata": {"basis": "San Diego", "samples": 12, "session_id": "s1"},
+    }).encode()
+async def _collect(chunks):
+    return [chunk async for chunk in chunks]
+async def _store():
+    store = EstimateStore(MemoryStateBackend())
+    await store.put_many([(f"est_{i}", _estimate(f"est_{i}", 1000 * i)) for i in range(1, 4)], "s1")
+    return store
+@pytest.mark.asyncio
+async def test_csv_and_ndjson_stream_from_the_store():
+    """Rows come back in the requested order; missing estimates are skipped"""
+    store = EstimateStore((await _store()).backend)  # cold hot tier: read from the backend
+    ids = ["est_3", "missing", "est_1"]
+    chunks = await _collect(export_formats.stream_csv(store, ids))
+    lines = b"".join(chunks).decode().splitlines()
+    assert lines[0].startswith("estimate_id,created_at,session_id,basis")
+    assert [line.split(",")[0] for line in lines[1:]] == ["est_3", "est_1"]
+    assert lines[1].split(",")[5] == "3000"
+    ndjson = await _collect(export_formats.stream_ndjson(store, ids))
+    assert ndjson == [_estimate("est_3", 3000) + b"\n", _estimate("est_1", 1000) + b"\n"]
+class _FakePDFService:
+    async def render_many(self, estimates, include_breakdown=True):
+        async for estimate_id, data in estimates:
+            yield estimate_id, b"%PDF-" + estimate_id.encode() if data else "not found"
+@pytest.mark.asyncio
+async def test_zip_is_streamed_entry_by_entry():
+    store = await _store()
+    chunks = await _collect(export_formats.stream_zip_export(
+        store, ["est_1", "est_2", "gone"], "pdf", pdf_service=_FakePDFService()))
+    assert len(chunks) == 4  # two PDFs, errors.txt, central directory
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.namelist() == ["estimate_est_1.pdf", "estimate_est_2.pdf", "errors.txt"]
+    assert archive.read("estimate_est_2.pdf") == b"%PDF-est_2"
+    assert archive.read("errors.txt") == b"gone: not found\n"
+    csv_zip = zipfile.ZipFile(io.BytesIO(b"".join(await _collect(
+        export_formats.stream_zip_export(store, ["est_1"], "csv"))))).read("estimate_est_1.csv")
+    assert csv_zip.decode().splitlines()[1].startswith("est_1,")
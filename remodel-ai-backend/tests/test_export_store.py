@@ -0,0 +1,59 @@
+import os
+import time
+from services.export_store import ExportStore
+def _files(path):
+    return sorted(name for name in os.listdir(path) if name != ".lock")
+def test_budget_evicts_least_recently_used_and_held_files_stay_readable(tmp_path):
+    store = ExportStore(str(tmp_path), max_bytes=250, ttl=3600)
+    for key in ("a", "b"):
+        assert store.put(key, key.encode() * 100)
+    held = store.acquire("a")
+    assert store.read("b") == b"b" * 100  # "b" is now most recent
+    store.put("c", b"c" * 100)  # over budget: "a" is evicted while a download holds it
+    assert store.acquire("a") is None
+    assert _files(tmp_path) == ["b.pdf", "c.pdf"]  # no temp files left behind
+    assert b"".join(held.chunks(10, 19)) == b"a" * 10  # the open descriptor still reads it
+    assert held.read() == b"a" * 100
+    assert store.stats()["held"] == 1
+    held.release()
+    held.release()
+    assert store.stats()["held"] == 0
+    assert store.stats()["bytes"] == 200 and store.stats()["evictions"] == 1
+    assert not store.put("huge", b"x" * 300)
+def test_workers_share_the_directory_and_its_budget(tmp_path):
+    """A file written by one worker is served by another; the budget covers both"""
+    first = ExportStore(str(tmp_path), max_bytes=250, ttl=3600)
+    second = ExportStore(str(tmp_path), max_bytes=250, ttl=3600)
+    first.put("a", b"a" * 100)
+    assert second.read("a") == b"a" * 100
+    held = first.acquire("a")
+    second.put("b", b"b" * 100)
+    second.put("c", b"c" * 100)  # evicts "a" (least recently served) from under first's download
+    assert _files(tmp_path) == ["b.pdf", "c.pdf"] and second.stats()["bytes"] == 200
+    assert held.read() == b"a" * 100
+    held.release()
+def test_expiry_and_restart(tmp_path):
+    store = ExportStore(str(tmp_path), max_bytes=1000, ttl=3600)
+    store.put("old", b"1" * 10)
+    store.put("new", b"2" * 10)
+    os.utime(tmp_path / "old.pdf", (time.time() - 7200,) * 2)
+    assert store.acquire("old") is None  # expired files are invisible at once
+    reopened = ExportStore(str(tmp_path), max_bytes=1000, ttl=3600)  # startup sweep
+    assert reopened.stats()["files"] == 1 and reopened.stats()["expirations"] == 1
+    assert _files(tmp_path) == ["new.pdf"] and reopened.read("new") == b"2" * 10
+    assert reopened.sweep() == 0
+def test_writes_under_budget_do_not_scan_the_directory(tmp_path, monkeypatch):
+    """Totals are kept in the lock file: only a write over budget scans, and it evicts to the low-water mark"""
+    first = ExportStore(str(tmp_path), max_bytes=1000, ttl=3600)
+    second = ExportStore(str(tmp_path), max_bytes=1000, ttl=3600)
+    scans = []
+    for store in (first, second):
+        scan = store._scan
+        monkeypatch.setattr(store, "_scan", lambda now, scan=scan: scans.append(now) or scan(now))
+    for i, store in enumerate([first, second] * 4):
+        store.put(f"k{i}", b"x" * 100)
+    first.put("k0", b"y" * 150)  # replacing a file counts only the difference
+    assert scans == [] and first.stats()["bytes"] == 850 and first.stats()["files"] == 8
+    second.put("k8", b"z" * 200)  # 1050 > budget: evict the oldest down to 900
+    assert len(scans) == 1 and second.stats()["bytes"] <= 900
+    assert "k1.pdf" not in _files(tmp_path) and first.read("k8") == b"z" * 200
@@ -0,0 +1,163 @@
+import os
+import sys
+import types
+import time
+import pandas as pd
+import pytest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from load_data import DataLoader, _AdaptiveLimiter, _Checkpoint, _retry_after
+class FakeEmbeddings:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.embedded = []
+    async def aembed_documents(self, texts):
+        if self.fail_on and any(self.fail_on in text for text in texts):
+            raise RuntimeError("embedding service unavailable")
+        self.embedded.extend(texts)
+        return [[0.1, 0.2] for _ in texts]
+class FakeIndex:
+    """Dict of id -> metadata with the Pinecone calls the loader makes"""
+    def __init__(self, vectors=None):
+        self.vectors = dict(vectors or {})
+        self.deleted = []
+    def upsert(self, vectors):
+        for vector in vectors:
+            self.vectors[vector["id"]] = vector["metadata"]
+    def fetch(self, ids):
+        found = {i: types.SimpleNamespace(metadata=self.vectors[i]) for i in ids if i in self.vectors}
+        return types.SimpleNamespace(vectors=found)
+    def list(self, prefix):
+        ids = sorted(i for i in self.vectors if i.startswith(prefix))
+        for start in range(0, len(ids), 2):
+            yield ids[start:start + 2]
+    def delete(self, ids):
+        self.deleted.extend(ids)
+        for vector_id in ids:
+            self.vectors.pop(vector_id, None)
+def _loader(index, embeddings, max_attempts=1):
+    loader = DataLoader.__new__(DataLoader)  # no Pinecone / OpenAI clients
+    loader.index = index
+    loader.embeddings = embeddings
+    loader.max_attempts = max_attempts
+    for name in ("embed_limiter", "upsert_limiter", "fetch_limiter"):
+        setattr(loader, name, _AdaptiveLimiter(name, 1000))
+    return loader
+def _frame(*rows):
+    return pd.DataFrame([
+        {"Location": location, "Remodel Type": kind, "Average Cost (Low)": low, "Average Cost (High)": low * 2,
+         "Average Time (weeks/other unit)": "4 weeks", "Source URL": "http://example.com"}
+        for kind, location, low in rows
+    ])
+def test_ids_follow_the_row_key_not_its_position():
+    loader = _loader(FakeIndex(), FakeEmbeddings())
+    first = loader.prepare_documents(_frame(("kitchen", "San Diego", 1000), ("bathroom", "LA", 500)))
+    second = loader.prepare_documents(_frame(("bathroom", "LA", 500), ("kitchen", "San Diego", 1200)))
+    assert first[0]["id"] == second[1]["id"]  # edited row keeps its id
+    assert first[0]["metadata"]["content_hash"] != second[1]["metadata"]["content_hash"]
+    assert first[1]["id"] == second[0]["id"]
+    assert first[0]["metadata"]["project_id"] == first[0]["id"]
+def test_duplicate_keys_split_by_content_and_exact_repeats_are_numbered():
+    loader = _loader(FakeIndex(), FakeEmbeddings())
+    docs = loader.prepare_documents(_frame(
+        ("kitchen", "San Diego", 1000), ("kitchen", "San Diego", 2000), ("kitchen", "San Diego", 1000),
+    ))
+    assert len({doc["id"] for doc in docs}) == 3
+    reordered = loader.prepare_documents(_frame(("kitchen", "San Diego", 2000), ("kitchen", "San Diego", 1000)))
+    assert reordered[0]["id"] == docs[1]["id"]  # told apart by content, not position
+    assert reordered[1]["id"] == docs[0]["id"]  # first of the repeats is unnumbered
+@pytest.mark.asyncio
+async def test_sync_reports_added_updated_unchanged_deleted():
+    index, embeddings = FakeIndex({"doc_0": {}, "doc_1": {}}), FakeEmbeddings()
+    loader = _loader(index, embeddings)
+    rows = [("kitchen", "San Diego", 1000), ("bathroom", "LA", 500), ("roof", "SD", 800)]
+    report = await loader.sync(loader.prepare_documents(_frame(*rows)))
+    assert report == {"added": 3, "updated": 0, "unchanged": 0, "deleted": 2, "failed": 0}
+    assert sorted(index.deleted) == ["doc_0", "doc_1"]  # legacy row-position ids
+    embeddings.embedded.clear()
+    report = await loader.sync(loader.prepare_documents(_frame(("bathroom", "LA", 600), rows[0])))
+    assert report == {"added": 0, "updated": 1, "unchanged": 1, "deleted": 1, "failed": 0}
+    assert len(embeddings.embedded) == 1  # only the changed row is embedded again
+    assert len(index.vectors) == 2
+@pytest.mark.asyncio
+async def test_sync_keeps_old_vectors_when_rows_fail_to_store():
+    index = FakeIndex({"doc_0": {}, "doc_1": {}})
+    loader = _loader(index, FakeEmbeddings(fail_on="bathroom"))
+    rows = _frame(("kitchen", "San Diego", 1000), ("bathroom", "LA", 500))
+    report = await loader.sync(loader.prepare_documents(rows), batch_size=1)
+    assert report["added"] == 2 and report["failed"] == 1
+    assert report["deleted"] == 0 and index.deleted == []
+    assert {"doc_0", "doc_1"} <= set(index.vectors)
+    loader.embeddings = FakeEmbeddings()
+    report = await loader.sync(loader.prepare_documents(rows), batch_size=1)
+    assert (report["added"], report["unchanged"], report["deleted"], report["failed"]) == (1, 1, 2, 0)
+@pytest.mark.asyncio
+async def test_permanent_errors_are_not_retried():
+    loader = _loader(FakeIndex(), FakeEmbeddings(), max_attempts=6)
+    calls = []
+    async def missing_method():
+        calls.append(1)
+        raise AttributeError("'Index' object has no attribute 'list'")
+    with pytest.raises(AttributeError):
+        await loader._call(loader.fetch_limiter, missing_method, "List ids")
+    bad_request = RuntimeError("bad request")
+    bad_request.status = 400
+    async def rejected():
+        calls.append(1)
+        raise bad_request
+    with pytest.raises(RuntimeError):
+        await loader._call(loader.fetch_limiter, rejected, "Upsert batch")
+    assert len(calls) == 2
+def test_limiter_halves_on_429_and_recovers_additively():
+    limiter = _AdaptiveLimiter("test", 10)
+    limiter.throttled(0)
+    limiter.throttled(0)
+    assert limiter.rate == 2.5
+    limiter.success()
+    assert limiter.rate == 3.5  # adds a tenth of the starting rate
+    for _ in range(100):
+        limiter.success()
+    assert limiter.rate == 40  # capped at four times the start
+    for _ in range(20):
+        limiter.throttled(0)
+    assert limiter.rate == 10 / 32
+@pytest.mark.asyncio
+async def test_limiter_waits_out_retry_after():
+    limiter = _AdaptiveLimiter("test", 1000)
+    limiter.throttled(0.2)
+    started = time.monotonic()
+    await limiter.wait()
+    assert time.monotonic() - started >= 0.19
+def test_retry_after_only_for_429():
+    throttled = RuntimeError("rate limited")
+    throttled.status_code = 429
+    throttled.response = types.SimpleNamespace(headers={"retry-after": "3"})
+    assert _retry_after(throttled) == 3.0
+    throttled.response.headers = {}
+    assert _retry_after(throttled) == 0.0
+    assert _retry_after(RuntimeError("boom")) is None
+def test_checkpoint_is_tied_to_its_input_and_tolerates_a_torn_line(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = _Checkpoint(path, "hash-a")
+    checkpoint.open(resume=False)
+    checkpoint.mark(["proj_1", "proj_2"])
+    checkpoint.mark(["proj_3"])
+    checkpoint.close(complete=False)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('["proj_4", "pro')  # interrupted mid-write
+    assert _Checkpoint(path, "hash-a").load() == {"proj_1", "proj_2", "proj_3"}
+    assert _Checkpoint(path, "hash-b").load() == set()  # the CSV changed
+    checkpoint.close(complete=True)
+    assert not os.path.exists(path)
+@pytest.mark.asyncio
+async def test_interrupted_load_resumes_from_the_checkpoint(tmp_path):
+    index, embeddings = FakeIndex(), FakeEmbeddings(fail_on="roof")
+    loader = _loader(index, embeddings)
+    docs = loader.prepare_documents(_frame(("kitchen", "San Diego", 1000), ("roof", "SD", 800)))
+    path = str(tmp_path / "checkpoint.jsonl")
+    assert await loader.embed_and_store(docs, batch_size=1, checkpoint=_Checkpoint(path, "hash")) == 1
+    assert os.path.exists(path)  # kept for the re-run
+    loader.embeddings = FakeEmbeddings()
+    assert await loader.embed_and_store(docs, batch_size=1, checkpoint=_Checkpoint(path, "hash")) == 0
+    assert len(loader.embeddings.embedded) == 1  # only the row that failed
+    assert len(index.vectors) == 2
+    assert not os.path.exists(path)
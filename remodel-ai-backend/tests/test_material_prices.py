@@ -0,0 +1,77 @@
+import asyncio
+import time
+import httpx
+import pytest
+from services.material_price_service import COMMON_MATERIALS, MaterialPriceService
+from services.state_backend import MemoryStateBackend, SQLiteStateBackend
+from tests.serpapi_stub import create_app
+def _service(stub, store=None):
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=stub), base_url="http://serpapi.test")
+    service = MaterialPriceService(client=client, store=store or MemoryStateBackend())
+    service._limiter.interval = 0
+    return service
+@pytest.mark.asyncio
+async def test_prices_fetched_concurrently_with_bounded_parallelism():
+    """Lookups overlap (up to the semaphore) and land in the cache"""
+    stub = create_app()
+    service = _service(stub)
+    service._semaphore = asyncio.Semaphore(2)
+    materials = [f"item {i}" for i in range(6)] + ["missing thing"]
+    prices = await service.get_material_prices(materials, "San Diego", deadline=5)
+    assert list(prices) == materials
+    assert prices["item 0"]["min_price"] == 16 and prices["missing thing"]["error"] == "No products found"
+    assert stub.state.max_in_flight == 2
+    await service.get_material_prices(materials[:6], "San Diego")
+    assert stub.state.calls == 7
+    await service.aclose()
+@pytest.mark.asyncio
+async def test_deadline_returns_partial_results_and_finishes_in_background():
+    """Slow lookups are reported pending at the deadline and cached once they finish"""
+    stub = create_app(delay=0.3)
+    service = _service(stub)
+    prices = await service.get_material_prices(["tile", "slow sink"], "Los Angeles", deadline=0.1)
+    assert "avg_price" in prices["tile"] and prices["slow sink"]["pending"] is True
+    await asyncio.sleep(0.4)
+    assert "avg_price" in (await service.get_material_prices(["slow sink"], "Los Angeles", deadline=0))["slow sink"]
+    assert stub.state.calls == 2
+    await service.aclose()
+@pytest.mark.asyncio
+async def test_refresher_persists_warm_cache_and_serves_stale(tmp_path, monkeypatch):
+    """Refreshed prices survive a restart; stale ones are served at once and revalidated"""
+    path = str(tmp_path / "prices.db")
+    stub = create_app()
+    service = _service(stub, SQLiteStateBackend(path))
+    expected = sum(len(m) for m in COMMON_MATERIALS.values()) * 2
+    assert await service.refresh_all() == expected
+    assert await service.refresh_all() == 0
+    await service.aclose()
+    restarted = _service(stub, SQLiteStateBackend(path))
+    prices = await restarted.get_material_prices(["toilet", "carpet"], "SD", deadline=0)
+    assert all("avg_price" in p for p in prices.values())
+    assert stub.state.calls == expected
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 2 * 86400)
+    stale = await restarted.get_material_prices(["toilet"], "SD", deadline=0)
+    assert "avg_price" in stale["toilet"]
+    await asyncio.sleep(0.1)
+    assert stub.state.calls == expected + 1
+    await restarted.aclose()
+@pytest.mark.asyncio
+async def test_refresher_runs_in_one_worker_and_needs_a_key(tmp_path):
+    """Workers sharing the price store elect one refresher per interval; without a key none runs"""
+    path = str(tmp_path / "prices.db")
+    stub = create_app()
+    workers = [_service(stub, SQLiteStateBackend(path)) for _ in range(3)]
+    for worker in workers:
+        worker.api_key = "test-key"
+    tasks = [asyncio.create_task(worker.run_refresher(3600)) for worker in workers]
+    await asyncio.sleep(0.5)
+    for task in tasks:
+        task.cancel()
+    assert stub.state.calls == sum(len(m) for m in COMMON_MATERIALS.values()) * 2
+    keyless = _service(stub)
+    keyless.api_key = None
+    await asyncio.wait_for(keyless.run_refresher(3600), 1)
+    assert keyless._refresher_running is False
+    for worker in (*workers, keyless):
+        await worker.aclose()
@@ -0,0 +1,26 @@
+import time
+from services.memory_store import ENTRY_OVERHEAD, MemoryStore
+def test_lru_keeps_recently_used():
+    """Over budget, the least recently read entry goes first"""
+    store = MemoryStore("test_lru", max_bytes=3 * (ENTRY_OVERHEAD + 10), shards=1)
+    for key in ("a", "b", "c"):
+        store.set(key, b"x" * 10)
+    assert store.get("a") == b"x" * 10  # a is now the most recent
+    store.set("d", b"x" * 10)
+    assert "b" not in store
+    assert all(k in store for k in ("a", "c", "d"))
+    assert store.stats()["evictions"] == 1
+def test_ttl_and_sweep(monkeypatch):
+    """Expired entries vanish on read and are removed by sweep()"""
+    store = MemoryStore("test_ttl", max_bytes=1 << 20, shards=4)
+    store.set("short", b"1", ttl=10)
+    store.set("long", b"2", ttl=100)
+    store.set("forever", b"3")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 50)
+    assert store.get("short") is None
+    store.set("short2", b"4", ttl=10)
+    monkeypatch.setattr(time, "time", lambda: now + 200)
+    assert store.sweep() == 2
+    assert sorted(store.keys()) == ["forever"]
+    assert store.stats()["bytes"] == ENTRY_OVERHEAD + 1
@@ -0,0 +1,48 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from middleware.metrics import MetricsMiddleware
+from services.metrics import observe_stage
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+def test_http_latency_uses_route_template():
+    """Latency is labelled with the route template, not the raw path"""
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: str):
+        return {"id": item_id}
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    before = _sample("remodelai_http_request_duration_seconds_count", labels)
+    client = TestClient(app)
+    client.get("/items/a")
+    client.get("/items/b")
+    after = _sample("remodelai_http_request_duration_seconds_count", labels)
+    assert after - before == 2
+    assert _sample("remodelai_http_requests_in_flight", {}) == 0
+def test_observe_stage_records_on_error():
+    """Stage timings are recorded even when the stage raises"""
+    labels = {"stage": "test_stage"}
+    before = _sample("remodelai_rag_stage_duration_seconds_count", labels)
+    try:
+        with observe_stage("test_stage"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert _sample("remodelai_rag_stage_duration_seconds_count", labels) - before == 1
+def test_active_sessions_counts_recent_sessions_not_turns(monkeypatch):
+    """A session stays active for the idle window after its last turn"""
+    import services.metrics as metrics
+    now = [1000.0]
+    monkeypatch.setattr(metrics.time, "monotonic", lambda: now[0])
+    sessions = metrics.ActiveSessions(window=60)
+    sessions.seen("a")
+    sessions.seen("b")
+    sessions.seen("a")
+    assert sessions.count() == 2
+    now[0] += 30
+    sessions.seen("c")
+    now[0] += 31  # "a" and "b" idle for 61s, "c" for 31s
+    assert sessions.count() == 1
+    sessions.seen("a")
+    assert sessions.count() == 2
@@ -0,0 +1,37 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.messages import AIMessage
+from prometheus_client import REGISTRY
+from config import settings
+from services.context_manager import SessionState
+from services.rag_service import RAGService, _LLMCallMetrics
+class _SummaryModel(FakeListChatModel):
+    def get_num_tokens_from_messages(self, messages):
+        return len(messages)  # no tokenizer needed
+def _calls(site, kind=None):
+    if kind:
+        return REGISTRY.get_sample_value("remodelai_llm_tokens_total", {"site": site, "kind": kind}) or 0
+    return REGISTRY.get_sample_value("remodelai_llm_calls_total", {"site": site}) or 0
+@pytest.mark.asyncio
+async def test_summary_updates_are_counted_as_their_own_llm_call_site(monkeypatch):
+    """Folding dropped history into the summary is an LLM call, recorded under "summarize" """
+    monkeypatch.setattr(settings, "history_window_pairs", 1)
+    service = RAGService.__new__(RAGService)  # no OpenAI / Pinecone clients
+    service.summary_llm = _SummaryModel(responses=["They want a kitchen remodel."],
+                                        callbacks=[_LLMCallMetrics("summarize")])
+    state = SessionState("s1")
+    state.tail = [{"role": "user", "content": "kitchen"}, {"role": "assistant", "content": "Sure"}]
+    before = _calls("summarize")
+    await RAGService._save_memory(state, service._memory_view(state), "in San Diego?", "Yes")
+    assert state.summary == "They want a kitchen remodel."
+    assert [m["content"] for m in state.tail] == ["in San Diego?", "Yes"]
+    assert _calls("summarize") - before == 1
+def test_llm_call_metrics_records_token_usage():
+    """Token usage reported by the provider is added to the call site's counters"""
+    before = _calls("summarize", "prompt"), _calls("summarize", "completion")
+    result = LLMResult(generations=[[ChatGeneration(message=AIMessage(content="x"))]],
+                       llm_output={"token_usage": {"prompt_tokens": 120, "completion_tokens": 30}})
+    _LLMCallMetrics("summarize").on_llm_end(result, run_id=None)
+    assert _calls("summarize", "prompt") - before[0] == 120
+    assert _calls("summarize", "completion") - before[1] == 30
@@ -0,0 +1,75 @@
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import api.export
+import services.render_pool as render_pool
+from services.render_pool import RenderPool, RenderQueueFull
+from services.state_backend import MemoryStateBackend
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    import services.pdf_service as pdf_service
+    from services import export_store
+    monkeypatch.setattr(export_store, "_store", export_store.ExportStore(str(tmp_path), 1 << 20, 3600))
+    pool = RenderPool(workers=1, max_queue=0)
+    monkeypatch.setattr(render_pool, "_pool", pool)
+    backend = MemoryStateBackend()
+    monkeypatch.setattr(pdf_service, "get_state_backend", lambda: backend)
+    monkeypatch.setattr(api.export, "_pdf_service", pdf_service.PDFService())
+    app = FastAPI()
+    app.include_router(api.export.router, prefix="/export")
+    with TestClient(app) as test_client:  # one event loop for the background job
+        yield test_client, pool
+    pool.shutdown()
+def test_full_queue_is_refused_with_retry_after(client):
+    """Admission is bounded: past workers + queue the API answers 429 with Retry-After"""
+    client, pool = client
+    slot = pool.reserve()
+    with pytest.raises(RenderQueueFull):
+        pool.reserve()
+    refused = client.post("/export/", json={"estimate_id": "est_full"})
+    assert refused.status_code == 429 and int(refused.headers["retry-after"]) >= 1
+    slot.release()
+    slot.release()  # releasing twice is harmless
+    assert pool.pending == 0
+def test_async_job_renders_in_worker_process(client):
+    """?mode=async returns a job to poll; the PDF is rendered off the event loop"""
+    client, pool = client
+    accepted = client.post("/export/?mode=async", json={"estimate_id": "est_job"})
+    assert accepted.status_code == 202 and accepted.json()["status"] == "pending"
+    status_url = accepted.headers["location"].removeprefix("/api/v1")
+    deadline = time.time() + 60
+    while (job := client.get(status_url).json())["status"] == "pending" and time.time() < deadline:
+        time.sleep(0.05)
+    assert job["status"] == "done", job
+    download = client.get("/export/download/est_job")
+    assert download.content.startswith(b"%PDF") and pool.pending == 0
+def test_exports_are_content_addressed_and_ranged(client):
+    """Each option set is its own cached variant; downloads honour ETag, Last-Modified and Range"""
+    client, pool = client
+    full = client.post("/export/", json={"estimate_id": "est_1"}).json()["file_url"].removeprefix("/api/v1")
+    short = client.post("/export/", json={"estimate_id": "est_1", "include_breakdown": False}).json()[
+        "file_url"].removeprefix("/api/v1")
+    first, other = client.get(full), client.get(short)
+    assert full != short and first.content != other.content
+    assert len(first.content) > len(other.content)  # the breakdown table is left out
+    assert first.headers["accept-ranges"] == "bytes" and "last-modified" in first.headers
+    assert client.get(full, headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+    assert client.get(full, headers={"If-Modified-Since": first.headers["last-modified"]}).status_code == 304
+    part = client.get(full, headers={"Range": "bytes=4-99"})
+    assert (part.status_code, part.content) == (206, first.content[4:100])
+    assert part.headers["content-range"] == f"bytes 4-99/{len(first.content)}"
+    assert client.get(full, headers={"Range": "bytes=-10"}).content == first.content[-10:]
+    assert client.get(full, headers={"Range": "bytes=999999-"}).status_code == 416
+    assert client.get(full, headers={"Range": "bytes=0-9", "If-Range": '"stale"'}).status_code == 200
+    assert client.get("/export/download/est_1").content == other.content  # latest variant
+def test_shutdown_stops_the_pool_and_the_next_render_starts_a_new_one(monkeypatch):
+    """App shutdown stops the worker processes; the process-wide pool is rebuilt on next use"""
+    pool = RenderPool(workers=1, max_queue=0)
+    monkeypatch.setattr(render_pool, "_pool", pool)
+    pool._pool()  # executor started, as after a first render
+    render_pool.shutdown_render_pool()
+    assert pool._executor is None and render_pool._pool is None
+    fresh = render_pool.get_render_pool()
+    assert fresh is not pool
+    fresh.shutdown()
@@ -0,0 +1,53 @@
+import time
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+from middleware.cache import CacheMiddleware, ResponseCache
+def _client(cache_control="public, max-age=60"):
+    app = FastAPI()
+    calls = {"n": 0}
+    @app.get("/item")
+    async def item(response: Response, q: str = ""):
+        calls["n"] += 1
+        response.headers["Cache-Control"] = cache_control
+        return {"q": q, "n": calls["n"]}
+    @app.post("/api/v1/chat/")
+    async def chat(payload: dict, response: Response):
+        calls["n"] += 1
+        response.headers["Cache-Control"] = cache_control
+        return {"message": payload["content"].upper(), "session_id": payload.get("session_id") or "generated"}
+    cache = ResponseCache("test_http_cache", max_bytes=1 << 20)
+    app.add_middleware(CacheMiddleware, cache=cache)
+    return TestClient(app), cache, calls
+def test_get_hits_served_from_raw_bytes():
+    """Repeat GETs hit whatever the query order; a different query is a different entry"""
+    client, cache, calls = _client()
+    assert client.get("/item?q=a&session_id=1").headers["x-cache"] == "MISS"
+    hit = client.get("/item?session_id=1&q=a")
+    assert (hit.headers["x-cache"], hit.json()["n"]) == ("HIT", 1)
+    assert client.get("/item?q=a&session_id=2").json()["n"] == 2
+    assert cache.stats()["hit_ratio"] == round(1 / 3, 4)
+def test_chat_posts_always_reach_the_handler():
+    """A chat turn updates session state, so even a cacheable reply is never replayed"""
+    client, cache, calls = _client()
+    for session_id in ("s-1", "s-1", "s-2"):
+        reply = client.post("/api/v1/chat/", json={"content": "hi", "session_id": session_id})
+        assert reply.json() == {"message": "HI", "session_id": session_id}
+        assert "x-cache" not in reply.headers
+    assert calls["n"] == 3
+def test_cache_control_is_honoured():
+    """Uncacheable responses are not stored and no-cache requests skip the lookup"""
+    client, cache, calls = _client("no-store")
+    client.get("/item")
+    assert client.get("/item").headers["x-cache"] == "MISS"
+    client, cache, calls = _client()
+    client.get("/item")
+    assert client.get("/item", headers={"Cache-Control": "no-cache"}).json()["n"] == 2
+def test_stale_while_revalidate(monkeypatch):
+    """A stale entry is served at once and refreshed in the background"""
+    client, cache, calls = _client("public, max-age=10, stale-while-revalidate=60")
+    client.get("/item")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 30)
+    stale = client.get("/item")
+    assert (stale.headers["x-cache"], stale.json()["n"]) == ("STALE", 1)
+    assert client.get("/item").json()["n"] == 2
@@ -0,0 +1,114 @@
+import time
+import pytest
+from fakeredis import aioredis as fake_aioredis
+from services.state_backend import (
+    CircuitBreaker,
+    MemoryStateBackend,
+    RedisStateBackend,
+    SQLiteStateBackend,
+)
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateBackend()
+    if request.param == "redis":
+        return RedisStateBackend(fake_aioredis.FakeRedis())
+    return SQLiteStateBackend(str(tmp_path / "state.db"))
+@pytest.mark.asyncio
+async def test_set_get_delete(backend):
+    """Values round-trip per namespace and can be deleted"""
+    await backend.set("estimate", "est_1", b'{"total_cost": 1}')
+    await backend.set("export", "est_1", b"other")
+    assert await backend.get("estimate", "est_1") == b'{"total_cost": 1}'
+    assert await backend.get("export", "est_1") == b"other"
+    await backend.delete("estimate", "est_1")
+    assert await backend.get("estimate", "est_1") is None
+@pytest.mark.asyncio
+async def test_get_many_set_many(backend):
+    """Multi-key reads and writes keep order and report missing keys as None"""
+    await backend.set_many([
+        ("session", "s1", b"transcript", 60),
+        ("context", "s1", b"context", 60),
+    ])
+    assert await backend.get_many(
+        [("session", "s1"), ("context", "s1"), ("context", "missing")]
+    ) == [b"transcript", b"context", None]
+@pytest.mark.asyncio
+async def test_ttl_expiry(tmp_path, monkeypatch):
+    """Entries are invisible once their TTL has passed"""
+    for backend in (MemoryStateBackend(), SQLiteStateBackend(str(tmp_path / "state.db"))):
+        await backend.set("session", "s1", b"data", ttl=10)
+        assert await backend.get("session", "s1") == b"data"
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 11)
+        assert await backend.get("session", "s1") is None
+        monkeypatch.undo()
+@pytest.mark.asyncio
+async def test_sqlite_shared_between_workers(tmp_path):
+    """Two processes opening the same file see each other's writes"""
+    path = str(tmp_path / "state.db")
+    worker_a = SQLiteStateBackend(path)
+    worker_b = SQLiteStateBackend(path)
+    await worker_a.set("estimate", "est_abc", b"payload")
+    assert await worker_b.get("estimate", "est_abc") == b"payload"
+class _DownRedis:
+    """Client whose every call times out"""
+    def __init__(self):
+        self.calls = 0
+    async def get(self, key):
+        self.calls += 1
+        raise TimeoutError("redis timeout")
+    async def mget(self, keys):
+        self.calls += 1
+        raise TimeoutError("redis timeout")
+@pytest.mark.asyncio
+async def test_redis_breaker_falls_back_to_memory():
+    """After repeated timeouts the breaker opens and calls skip Redis entirely"""
+    client = _DownRedis()
+    backend = RedisStateBackend(client, CircuitBreaker(threshold=2, reset_after=60))
+    await backend.fallback.set("session", "s1", b"local")
+    assert await backend.get("session", "s1") == b"local"
+    assert await backend.get("session", "s1") == b"local"
+    assert client.calls == 2
+    assert await backend.get_many([("session", "s1"), ("context", "s1")]) == [b"local", None]
+    assert client.calls == 2
+@pytest.mark.asyncio
+async def test_add_only_when_absent(backend, monkeypatch):
+    """add() stores a key only if it is missing or expired"""
+    assert await backend.add("lease", "job", b"w1", ttl=60) is True
+    assert await backend.add("lease", "job", b"w2", ttl=60) is False
+    assert await backend.get("lease", "job") == b"w1"
+    if backend.name != "redis":  # fakeredis keeps its own clock
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 61)
+        assert await backend.add("lease", "job", b"w2", ttl=60) is True
+        assert await backend.get("lease", "job") == b"w2"
+@pytest.mark.asyncio
+async def test_fields_merge(backend):
+    """Field maps merge on write; missing keys read as empty"""
+    await backend.set_fields("context_fields", "s1", {"a": b"1", "b": b"2"}, ttl=60)
+    await backend.set_fields("context_fields", "s1", {"b": b"3"}, ttl=60)
+    assert await backend.get_fields("context_fields", "s1") == {"a": b"1", "b": b"3"}
+    assert await backend.get_fields("context_fields", "missing") == {}
+@pytest.mark.asyncio
+async def test_append_keeps_newest(backend):
+    """Appends are capped to the newest items and ranges use LRANGE indices"""
+    await backend.append("history", "s1", [b"m1", b"m2", b"m3"], max_len=4, ttl=60)
+    await backend.append("history", "s1", [b"m4", b"m5"], max_len=4, ttl=60)
+    assert await backend.length("history", "s1") == 4
+    assert await backend.get_range("history", "s1") == [b"m2", b"m3", b"m4", b"m5"]
+    assert await backend.get_range("history", "s1", -2, -1) == [b"m4", b"m5"]
+    assert await backend.get_range("history", "s1", 1, 2) == [b"m3", b"m4"]
+    assert await backend.get_range("history", "s1", 10, 20) == []
+@pytest.mark.asyncio
+async def test_sqlite_failed_write_rolls_back(tmp_path):
+    """A write that fails mid-transaction leaves nothing behind and the connection usable"""
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+    with pytest.raises(Exception):
+        await backend.set_many([("session", "s1", b"ok", None), ("session", "s2", None, None)])
+    assert not backend._conn.in_transaction
+    assert await backend.get("session", "s1") is None
+    await backend.set_fields("context", "s1", {"location": b"San Diego"})
+    await backend.append("history", "s1", [b"a"])
+    assert await backend.get_fields("context", "s1") == {"location": b"San Diego"}
+    assert await backend.get_range("history", "s1") == [b"a"]